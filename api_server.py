@@ -0,0 +1,234 @@
+# api_server.py
+"""
+API HTTP JSON (asíncrona) para generar rutas sin pasar por la UI de Streamlit.
+
+Reutiliza las mismas funciones y cachés que la app (geocodificación en lote,
+tramos, QR cacheado, almacén de rutas). El trabajo bloqueante se ejecuta en
+un pool de hilos para no frenar el bucle de eventos.
+
+    python api_server.py --port 8502
+
+Endpoints:
+    POST /routes/links   {"points": [...], "mode": "driving", "avoid": null}
+    POST /routes/qr      {"url": "..."} o {"points": [...], "leg": 0}; ?format=svg
+    GET  /users/{user}/routes
+    GET  /users/{user}/routes/export?format=gpx|kml|geojson[&name=lunes...]  (en streaming)
+    GET  /health
+    GET  /metrics        (texto Prometheus)
+    GET  /r/{code}       redirección del acortador (pública, sin token)
+
+Si API_TOKEN está definido se exige la cabecera "Authorization: Bearer <token>".
+Sin API_TOKEN los endpoints con datos de usuario (rutas guardadas y
+exportación) responden 403: nunca se sirven rutas ajenas sin autenticar.
+Prueba de carga local, p. ej.:
+    hey -n 2000 -c 50 -m POST -T application/json \\
+        -d '{"points": ["girona", "sils", "barcelona"]}' http://127.0.0.1:8502/routes/links
+"""
+import argparse
+import hmac
+import os
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
+from starlette.routing import Route
+
+import metrics
+from app_utils_core import TRAVEL_MODES, client_health, geocache_stats, route_links
+from qr_render import QR_MAX_BYTES, qr_cache_stats, qr_png, qr_svg
+from resilience import BREAKER
+from route_export import EXPORT_FORMATS, export_filename, iter_export
+from route_store import get_route_store
+from shortlinks import get_shortener
+
+API_TOKEN = os.getenv("API_TOKEN")
+MAX_POINTS_PER_REQUEST = int(os.getenv("API_MAX_POINTS", "500"))
+
+
+def _error(status: int, msg: str):
+    return JSONResponse({"error": msg}, status_code=status)
+
+
+def _authorized(request) -> bool:
+    if not API_TOKEN:
+        return True
+    header = request.headers.get("authorization", "")
+    return hmac.compare_digest(header, f"Bearer {API_TOKEN}")
+
+
+def _user_data_denied(request):
+    """Respuesta de error para los endpoints con rutas de usuarios, o None si se pueden servir."""
+    if not API_TOKEN:
+        return _error(403, "API_TOKEN no configurado: las rutas de usuario no se sirven")
+    if not _authorized(request):
+        return _error(401, "unauthorized")
+    return None
+
+
+async def _json_body(request):
+    try:
+        body = await request.json()
+    except Exception:
+        return None
+    return body if isinstance(body, dict) else None
+
+
+def _points_from(body):
+    points = body.get("points")
+    if not isinstance(points, list) or not all(isinstance(p, str) for p in points):
+        return None
+    return points
+
+
+def _route_options(body):
+    """(mode, avoid) de la petición, o None si `mode` no es un modo de viaje o `avoid` no es texto."""
+    mode = body.get("mode") or "driving"
+    avoid = body.get("avoid") or None
+    if mode not in TRAVEL_MODES or not (avoid is None or isinstance(avoid, str)):
+        return None
+    return mode, avoid
+
+
+_OPTIONS_ERROR = f"'mode' debe ser uno de {', '.join(TRAVEL_MODES)} y 'avoid' un texto"
+
+
+# ---------------------------
+# Handlers
+# ---------------------------
+async def links(request):
+    if not _authorized(request):
+        return _error(401, "unauthorized")
+    body = await _json_body(request)
+    points = _points_from(body or {})
+    if points is None:
+        return _error(400, "'points' debe ser una lista de textos")
+    if len(points) > MAX_POINTS_PER_REQUEST:
+        return _error(413, f"máximo {MAX_POINTS_PER_REQUEST} puntos por petición")
+    options = _route_options(body)
+    if options is None:
+        return _error(422, _OPTIONS_ERROR)
+    metrics.set_user("api")
+    metas, legs = await run_in_threadpool(route_links, points, *options)
+    if not legs:
+        return _error(422, "hacen falta al menos 2 puntos (origen y destino)")
+    return JSONResponse({"points": metas, "legs": legs})
+
+
+async def qr(request):
+    if not _authorized(request):
+        return _error(401, "unauthorized")
+    body = await _json_body(request) or {}
+    url = body.get("url")
+    if url is not None and not isinstance(url, str):
+        return _error(422, "'url' debe ser un texto")
+    if not url:
+        points = _points_from(body)
+        if points is None:
+            return _error(400, "indica 'url' o 'points'")
+        if len(points) > MAX_POINTS_PER_REQUEST:
+            return _error(413, f"máximo {MAX_POINTS_PER_REQUEST} puntos por petición")
+        options = _route_options(body)
+        if options is None:
+            return _error(422, _OPTIONS_ERROR)
+        leg = body.get("leg") or 0
+        if isinstance(leg, bool) or not isinstance(leg, int):
+            return _error(422, "'leg' debe ser un número entero")
+        metrics.set_user("api")
+        _, legs = await run_in_threadpool(route_links, points, *options)
+        if not 0 <= leg < len(legs):
+            return _error(422, "tramo inexistente")
+        url = legs[leg].get("short") or legs[leg]["gmaps"]
+    if len(url.encode("utf-8")) > QR_MAX_BYTES:
+        return _error(413, f"la URL no cabe en un QR (máximo {QR_MAX_BYTES} bytes)")
+    if request.query_params.get("format") == "svg":
+        svg = await run_in_threadpool(qr_svg, url)
+        return Response(svg, media_type="image/svg+xml")
+    png = await run_in_threadpool(qr_png, url)
+    return Response(png, media_type="image/png")
+
+
+async def user_routes(request):
+    denied = _user_data_denied(request)
+    if denied is not None:
+        return denied
+    user = request.path_params["user"]
+    routes = await run_in_threadpool(get_route_store().list_routes, user)
+    return JSONResponse(routes)
+
+
+async def redirect(request):
+    # Sin token: es el destino de los QR que escanean los conductores
+    url = await run_in_threadpool(get_shortener().resolve, request.path_params["code"])
+    if url is None:
+        return _error(404, "enlace desconocido")
+    return RedirectResponse(url, status_code=302)
+
+
+async def export(request):
+    denied = _user_data_denied(request)
+    if denied is not None:
+        return denied
+    user = request.path_params["user"]
+    fmt = request.query_params.get("format", "gpx")
+    if fmt not in EXPORT_FORMATS:
+        return _error(400, f"formato no soportado: {fmt}")
+    names = request.query_params.getlist("name") or None
+    chunks = (chunk.encode("utf-8") for chunk in iter_export(user, fmt, names=names))
+    # Iterador síncrono: Starlette lo consume en el pool de hilos, trozo a trozo
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_FORMATS[fmt][0],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(user, fmt, names)}"'},
+    )
+
+
+async def health(request):
+    return JSONResponse({
+        "gmaps": client_health(),
+        "gmaps_circuit": BREAKER.snapshot(),
+        "geocache": await run_in_threadpool(geocache_stats),
+        "qr_cache": qr_cache_stats(),
+    })
+
+
+async def prometheus(request):
+    # Incluye nombres de usuario: misma protección que el resto de la API
+    if not _authorized(request):
+        return _error(401, "unauthorized")
+    body = await run_in_threadpool(metrics.render_prometheus)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+routes = [
+    Route("/routes/links", links, methods=["POST"]),
+    Route("/routes/qr", qr, methods=["POST"]),
+    Route("/users/{user}/routes", user_routes, methods=["GET"]),
+    Route("/users/{user}/routes/export", export, methods=["GET"]),
+    Route("/health", health, methods=["GET"]),
+    Route("/metrics", prometheus, methods=["GET"]),
+    Route("/r/{code}", redirect, methods=["GET"]),
+]
+
+
+def create_app():
+    return Starlette(routes=list(routes))
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="API HTTP del planificador de rutas")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    uvicorn.run("api_server:app", host=args.host, port=args.port, workers=args.workers)
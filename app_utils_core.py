@@ -1,78 +1,563 @@
 # app_utils_core.py
 import os
+import threading
+import time
 import urllib.parse
-import streamlit as st
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
-import googlemaps
+
+import metrics
+from gazetteer import get_gazetteer
+from geocache import MISS, geohash, get_geocache, normalize_query
+from resilience import (
+    BACKGROUND_LIMITER,
+    GoogleUnavailableError,
+    google_call,
+    google_errors,
+    make_client,
+)
+from route_store import get_route_store
+from shortlinks import short_url
+from suggest_index import get_gazetteer_index, get_user_index
 
 # ---------------------------------------------------------
 # Cargar variables de entorno
 # ---------------------------------------------------------
 load_dotenv()
 GMAPS_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Servidor alternativo para las APIs de Google (p. ej. el falso de benchmarks/)
+GMAPS_BASE_URL = os.getenv("GMAPS_BASE_URL")
+GEOCODE_WORKERS = int(os.getenv("GEOCODE_WORKERS", "8"))
+BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", "2"))
+# Paradas intermedias que admite una URL de Google Maps (las rutas más
+# largas se parten en tramos enlazados)
+MAX_URL_WAYPOINTS = int(os.getenv("MAX_URL_WAYPOINTS", "9"))
+# Valores de `travelmode` que entiende Google Maps
+TRAVEL_MODES = ("driving", "walking", "bicycling", "transit")
+# Si es "1", los nombres de municipio exactos ("burgos") se resuelven con el
+# nomenclátor local sin consultar caché ni Google.
+GEOCODER_LOCAL_FIRST = os.getenv("GEOCODER_LOCAL_FIRST", "1") == "1"
+# URLs compactas: coordenadas redondeadas a URL_COORD_PRECISION decimales
+# (5 ≈ 1 m) y comas sin codificar, para QR de versión baja. Con
+# URL_PLACE_IDS=1 se añaden además los place_id de Google cuando se conocen.
+URL_COMPACT = os.getenv("URL_COMPACT", "1") == "1"
+URL_COORD_PRECISION = int(os.getenv("URL_COORD_PRECISION", "5"))
+URL_PLACE_IDS = os.getenv("URL_PLACE_IDS", "0") == "1"
+# Antigüedad máxima (s) de la geometría guardada con una ruta para reutilizarla
+# sin volver a geocodificar
+STOP_META_TTL = int(os.getenv("STOP_META_TTL", str(30 * 24 * 3600)))
+
+# ---------------------------------------------------------
+# Cliente de Google Maps (perezoso)
+# ---------------------------------------------------------
+# El cliente se crea en el primer uso, no al importar. La validación de la
+# clave (una geocodificación de prueba) corre en segundo plano: si falla, el
+# cliente se descarta y se sigue en modo simulado / nomenclátor.
+_CLIENT = None
+_CLIENT_READY = False
+_CLIENT_LOCK = threading.Lock()
+_CLIENT_HEALTH = {"status": "unknown"}   # unknown | checking | ok | degraded | failed
+
+
+def _health_check(client):
+    try:
+        google_call("geocode", client.geocode, "Barcelona")
+        _CLIENT_HEALTH["status"] = "ok"
+    except Exception as exc:
+        # Un error transitorio (red, 5xx, cuota) no descarta el cliente: de
+        # eso se ocupa el cortacircuitos. Una clave rechazada, sí.
+        _CLIENT_HEALTH["status"] = "degraded" if isinstance(exc, GoogleUnavailableError) else "failed"
+        # El mensaje de requests incluye la URL con la clave: no la exponemos
+        msg = str(exc.__cause__ or exc)
+        _CLIENT_HEALTH["error"] = msg.replace(GMAPS_API_KEY, "***") if GMAPS_API_KEY else msg
+
 
-@st.cache_resource
 def get_gmaps_client():
     """
     Devuelve el cliente de Google Maps si hay API KEY.
-    Si no hay clave o la API falla, retorna None (modo simulado).
+    Si no hay clave, no se pudo crear o la comprobación en segundo plano
+    falló, retorna None (modo simulado).
     """
-    key_to_use = GMAPS_API_KEY
-    if not key_to_use:
-        st.warning(
-            "ERROR: La clave GOOGLE_API_KEY no está configurada. "
-            "La geocodificación será SIMULADA."
-        )
-        return None
-    try:
-        client = googlemaps.Client(key=key_to_use)
-        # Sondeo rápido para validar credenciales
-        client.geocode("Barcelona")
-        return client
-    except Exception:
+    global _CLIENT, _CLIENT_READY
+    if not _CLIENT_READY:
+        with _CLIENT_LOCK:
+            if not _CLIENT_READY:
+                if GMAPS_API_KEY:
+                    try:
+                        # Sin reintentos internos: la política vive en resilience.py
+                        _CLIENT = make_client(GMAPS_API_KEY, base_url=GMAPS_BASE_URL)
+                        _CLIENT_HEALTH["status"] = "checking"
+                        threading.Thread(
+                            target=_health_check, args=(_CLIENT,),
+                            name="gmaps-health", daemon=True,
+                        ).start()
+                    except Exception:
+                        _CLIENT = None
+                _CLIENT_READY = True
+    if _CLIENT_HEALTH["status"] == "failed":
         return None
+    return _CLIENT
+
 
-GMAPS_CLIENT = get_gmaps_client()
+def client_health() -> dict:
+    """Estado de la comprobación del cliente de Google Maps."""
+    return dict(_CLIENT_HEALTH)
+
+
+def __getattr__(name):
+    # Compatibilidad: GMAPS_CLIENT y la bandera `gmaps` se resuelven al usarse
+    if name == "GMAPS_CLIENT":
+        return get_gmaps_client()
+    if name == "gmaps":
+        return bool(get_gmaps_client())
+    raise AttributeError(name)
 
 # ---------------------------------------------------------
 # Geocodificación
 # ---------------------------------------------------------
-def geocode_address(query: str):
-    """Geocodifica una dirección. Devuelve dict con address/lat/lon o None."""
-    if not GMAPS_CLIENT:
-        return None
+def _geocode_remote(query: str, limiter=None):
+    """Consulta directa a Google. Devuelve (resultado, definitivo).
+
+    `definitivo` es False cuando no se pudo preguntar (sin cliente o error),
+    para no guardar en caché un "no encontrado" que no es real. `limiter`
+    sustituye al cubo de fichas de las sesiones (trabajos de fondo).
+    """
+    client = get_gmaps_client()
+    if not client:
+        return None, False
     try:
-        results = GMAPS_CLIENT.geocode(query)
-        if results:
-            loc = results[0]["geometry"]["location"]
-            return {
-                "address": results[0]["formatted_address"],
-                "lat": loc["lat"],
-                "lon": loc["lng"],
-            }
-    except Exception:
+        results = google_call("geocode", client.geocode, query, limiter=limiter)
+    except google_errors():
+        # Caída, cuota, cortacircuitos abierto o petición rechazada: se sigue
+        # con el nivel offline
+        return None, False
+    if results:
+        loc = results[0]["geometry"]["location"]
+        geo = {
+            "address": results[0]["formatted_address"],
+            "lat": loc["lat"],
+            "lon": loc["lng"],
+        }
+        if results[0].get("place_id"):
+            geo["place_id"] = results[0]["place_id"]
+        return geo, True
+    return None, True
+
+
+def _geocode_offline(query: str):
+    """Último nivel: nomenclátor local, solo para consultas que son un topónimo."""
+    gz = get_gazetteer()
+    return gz.lookup(query) if gz else None
+
+
+def _geocode_without_api(query: str):
+    """
+    Niveles que no tocan la red: nomenclátor para municipios exactos y caché
+    persistente. Devuelve `MISS` si hace falta preguntar a Google.
+    """
+    if GEOCODER_LOCAL_FIRST:
+        gz = get_gazetteer()
+        hit = gz.exact(query) if gz else None
+        if hit:
+            metrics.inc("geocode_lookups_total", source="gazetteer")
+            return hit
+    cached = get_geocache().get(query)
+    if cached is None:
+        metrics.inc("geocode_lookups_total", source="cache_negative")
+        return _geocode_offline(query)
+    if cached is not MISS:
+        metrics.inc("geocode_lookups_total", source="cache")
+    return cached
+
+
+@metrics.timed()
+def geocode_address(query: str, offline_checked: bool = False, limiter=None):
+    """Geocodifica una dirección. Devuelve dict con address/lat/lon o None.
+
+    Orden: nomenclátor (municipios) -> caché persistente -> Google ->
+    nomenclátor ("Sils, Girona") si Google no está disponible o no lo
+    encuentra. Una dirección con calle sin resultado devuelve None: el
+    llamante conserva el texto y Google Maps la resuelve en el móvil.
+
+    `offline_checked`: el llamante ya probó nomenclátor y caché sin éxito
+    (`geocode_many`); no se repiten ni cuentan como un segundo fallo.
+    `limiter` se pasa a `_geocode_remote`.
+    """
+    if not (query or "").strip():
         return None
-    return None
+    if not offline_checked:
+        geo = _geocode_without_api(query)
+        if geo is not MISS:
+            return geo
+    geo, definitive = _geocode_remote(query, limiter=limiter)
+    metrics.inc("geocode_lookups_total", source="google" if definitive else "unavailable")
+    if definitive:
+        get_geocache().put(query, geo)
+    return geo or _geocode_offline(query)
+
+
+def geocache_stats() -> dict:
+    """Contadores de la caché de geocodificación (entradas, aciertos, fallos)."""
+    return get_geocache().stats()
+
+
+metrics.register_gauge("app_geocache", geocache_stats, "Caché de geocodificación (entradas, aciertos, ratio)")
 
 
-def suggest_addresses(query: str, min_len: int = 3, max_results: int = 8):
-    """Stub sencillo para sugerencias (puedes reemplazar por Places si quieres)."""
+def _recent_matches(q: str, recent):
+    """Puntos recientes de la sesión que contienen una palabra que empieza por `q`."""
+    out = []
+    for p in reversed(list(recent or [])):
+        key = normalize_query(p)
+        if key.startswith(q) or f" {q}" in f" {key}":
+            out.append(p)
+    return out
+
+
+def suggest_addresses(query: str, min_len: int = 3, max_results: int = 8,
+                      username=None, recent=None):
+    """
+    Sugerencias locales (sin llamadas a Places): puntos recientes de la sesión,
+    rutas guardadas de `username` y nomenclátor, ordenadas por frecuencia y
+    uso reciente y tolerando una errata.
+    """
     if not query or len(query.strip()) < min_len:
         return []
-    return [{"description": query.strip()}]
+    q = normalize_query(query)
+    labels = _recent_matches(q, recent)
+
+    if username:
+        store = get_route_store()
+        signature = store.signature(username)
+        index = get_user_index(username, signature, lambda: store.list_routes(username))
+        labels += [label for label, _ in index.search(q, max_results)]
+
+    gz_index = get_gazetteer_index(get_gazetteer())
+    if gz_index is not None:
+        labels += [label for label, _ in gz_index.search(q, max_results)]
+
+    seen = set()
+    results = []
+    for label in labels:
+        key = normalize_query(label)
+        if key in seen:
+            continue
+        seen.add(key)
+        results.append({"description": label})
+        if len(results) >= max_results:
+            break
+    return results
+
+
+def _meta_from_geo(label: str, geo):
+    # Solo las paradas resueltas de verdad llevan `resolved_at`: las
+    # aproximadas y el texto sin resolver se vuelven a intentar más adelante.
+    if geo:
+        coords = f"{geo['lat']},{geo['lon']}"
+        meta = {"address": geo["address"], "coords": coords}
+        if not geo.get("approx"):
+            meta["resolved_at"] = int(time.time())
+        if geo.get("place_id"):
+            meta["place_id"] = geo["place_id"]
+        return meta
+    txt = (label or "").strip()
+    return {"address": txt, "coords": txt}
 
 
+@metrics.timed()
 def resolve_selection(label: str, meta=None):
     """
     Convierte texto a metadatos con address/coords si hay API;
     si no, deja el texto tal cual como fallback.
     """
-    geo = geocode_address(label)
+    return _meta_from_geo(label, geocode_address(label))
+
+# ---------------------------------------------------------
+# Geocodificación inversa ("Usar mi ubicación")
+# ---------------------------------------------------------
+def _reverse_remote(lat: float, lon: float):
+    """Dirección de Google para (lat, lon). Devuelve (resultado, definitivo) como `_geocode_remote`."""
+    client = get_gmaps_client()
+    if not client:
+        return None, False
+    try:
+        results = google_call("reverse_geocode", client.reverse_geocode, (lat, lon))
+    except google_errors():
+        return None, False
+    if results:
+        geo = {"address": results[0]["formatted_address"]}
+        if results[0].get("place_id"):
+            geo["place_id"] = results[0]["place_id"]
+        return geo, True
+    return None, True
+
+
+@metrics.timed()
+def reverse_geocode(lat, lon):
+    """
+    Dirección de una posición GPS. Devuelve dict con address/lat/lon/approx
+    (lat/lon son los de la posición, no los de la dirección) o None.
+
+    Orden: caché por celda geohash (~150 m, compartida por todos los usuarios)
+    -> Google -> municipio más cercano del nomenclátor (aproximado, no se
+    guarda en caché para volver a preguntar cuando Google esté disponible).
+    """
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        return None
+    cell = geohash(lat, lon)
+    cache = get_geocache()
+    geo = cache.get_reverse(cell)
+    if geo is MISS:
+        geo, definitive = _reverse_remote(lat, lon)
+        metrics.inc("reverse_geocode_lookups_total", source="google" if definitive else "unavailable")
+        if definitive:
+            cache.put_reverse(cell, geo)
+    else:
+        metrics.inc("reverse_geocode_lookups_total", source="cache" if geo else "cache_negative")
     if geo:
-        coords = f"{geo['lat']},{geo['lon']}"
-        return {"address": geo["address"], "coords": coords}
-    txt = (label or "").strip()
-    return {"address": txt, "coords": txt}
+        return {**geo, "lat": lat, "lon": lon, "approx": False}
+
+    gz = get_gazetteer()
+    near = gz.nearest(lat, lon) if gz else None
+    if near is None:
+        return None
+    metrics.inc("reverse_geocode_lookups_total", source="gazetteer")
+    return {"address": near["address"], "lat": lat, "lon": lon, "approx": True,
+            "distance_km": near["distance_km"]}
+
+
+def resolve_position(lat, lon):
+    """(etiqueta, meta) listos para la lista de puntos a partir de una posición, o None."""
+    geo = reverse_geocode(lat, lon)
+    if not geo:
+        return None
+    return geo["address"], _meta_from_geo(geo["address"], geo)
+
+# ---------------------------------------------------------
+# Geocodificación en lote (concurrente y con coalescencia)
+# ---------------------------------------------------------
+# Pool y peticiones en vuelo son globales al proceso: dos sesiones que piden
+# la misma dirección a la vez comparten una única llamada a Google.
+_GEOCODE_POOL = ThreadPoolExecutor(max_workers=GEOCODE_WORKERS, thread_name_prefix="geocode")
+# Trabajos de fondo (relleno de rutas guardadas): pool pequeño y cubo de
+# fichas propios, para no quitar hilos ni cuota a las sesiones.
+_BACKGROUND_POOL = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="geocode-bg")
+_INFLIGHT = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+
+def _geocode_and_release(query: str, key: str, offline_checked: bool):
+    try:
+        return geocode_address(query, offline_checked=offline_checked)
+    finally:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT.pop(key, None)
+
+
+def geocode_async(query: str, offline_checked: bool = False, background: bool = False):
+    """
+    Lanza (o reutiliza si ya está en vuelo) la geocodificación de `query`.
+    Devuelve un Future. `offline_checked` se pasa a `geocode_address`.
+
+    Con `background` va al pool y al cubo de fichas de fondo. Reutiliza una
+    petición de una sesión ya en vuelo, pero no registra la suya: ninguna
+    sesión se queda esperando en la cola de fondo.
+    """
+    key = normalize_query(query)
+    with _INFLIGHT_LOCK:
+        fut = _INFLIGHT.get(key)
+        if fut is None and background:
+            return _BACKGROUND_POOL.submit(
+                metrics.bind(geocode_address), query,
+                offline_checked=offline_checked, limiter=BACKGROUND_LIMITER,
+            )
+        if fut is None:
+            fut = _GEOCODE_POOL.submit(
+                metrics.bind(_geocode_and_release), query, key, offline_checked
+            )
+            _INFLIGHT[key] = fut
+    return fut
+
+
+def resolve_async(label: str) -> Future:
+    """
+    Resolución especulativa: Future con el meta de `label` (None si no se
+    encontró). Comparte pool, caché y peticiones en vuelo con `geocode_many`,
+    así que generar la ruta después reutiliza el trabajo ya hecho.
+    """
+    out = Future()
+
+    def _done(fut):
+        try:
+            geo = fut.result()
+        except Exception:
+            geo = None
+        out.set_result(_meta_from_geo(label, geo) if geo else None)
+
+    geocode_async(label).add_done_callback(_done)
+    return out
+
+
+def geocode_many(queries, background: bool = False):
+    """
+    Geocodifica varias direcciones a la vez. Devuelve una lista alineada con
+    `queries` (dict o None por cada una).
+
+    Las entradas repetidas se consultan una sola vez, lo que se resuelve sin
+    red (nomenclátor o caché) no pasa por el pool y el resto se lanza en paralelo.
+    `background` se pasa a `geocode_async`.
+    """
+    queries = list(queries or [])
+    by_key = {}
+    for q in queries:
+        key = normalize_query(q)
+        if key and key not in by_key:
+            by_key[key] = q
+
+    results = {}
+    pending = {}
+    for key, q in by_key.items():
+        # Tramo propio: los aciertos locales no pasan por `geocode_address`
+        with metrics.span("geocode_local"):
+            geo = _geocode_without_api(q)
+        if geo is not MISS:
+            results[key] = geo
+        else:
+            pending[key] = geocode_async(q, offline_checked=True, background=background)
+
+    for key, fut in pending.items():
+        try:
+            results[key] = fut.result()
+        except Exception:
+            results[key] = None
+
+    return [results.get(normalize_query(q)) for q in queries]
+
+
+def is_fresh_meta(meta, now=None) -> bool:
+    """True si `meta` es una parada resuelta hace menos de STOP_META_TTL."""
+    if not isinstance(meta, dict) or not meta.get("resolved_at") or not meta.get("coords"):
+        return False
+    return (now or time.time()) - meta["resolved_at"] < STOP_META_TTL
+
+
+@metrics.timed()
+def resolve_many(labels, known=None, background: bool = False):
+    """
+    Versión en lote de `resolve_selection` (misma forma de salida).
+
+    `known` ({texto: meta}, p. ej. la geometría guardada con la ruta) evita
+    geocodificar las paradas que ya están resueltas y no han caducado.
+    `background` se pasa a `geocode_many`.
+    """
+    labels = list(labels or [])
+    known = known or {}
+    metas = [known.get(label) if is_fresh_meta(known.get(label)) else None for label in labels]
+    missing = [label for label, meta in zip(labels, metas) if meta is None]
+    if len(missing) < len(labels):
+        metrics.inc("geocode_lookups_total", len(labels) - len(missing), source="saved")
+    resolved = iter(
+        _meta_from_geo(label, geo) for label, geo in zip(missing, geocode_many(missing, background))
+    )
+    return [meta if meta is not None else next(resolved) for meta in metas]
+
+
+# ---------------------------------------------------------
+# Geometría de las rutas guardadas (relleno en segundo plano)
+# ---------------------------------------------------------
+_BACKFILL_THREAD = None
+_BACKFILL_AGAIN = False
+_BACKFILL_LOCK = threading.Lock()
+
+
+def backfill_route_stops(page: int = 50) -> int:
+    """
+    Completa `stops` de las rutas guardadas sin geometría (importadas de los
+    JSON antiguos, de un esquema anterior o guardadas antes de resolverse).
+    Usa el pool y la cuota de fondo. Una ruta solo queda migrada si todas sus
+    paradas se resolvieron; si no, se guarda lo resuelto y se reintenta en
+    la próxima pasada. Devuelve el número de rutas completadas.
+    """
+    store = get_route_store()
+    done = 0
+    for user, name, points, version, stops in store.iter_pending_stops(page):
+        stops = list(stops or [])[:len(points)]
+        stops += [None] * (len(points) - len(stops))
+        known = {p: s for p, s in zip(points, stops) if is_fresh_meta(s)}
+        metas = resolve_many(points, known=known, background=True)
+        fresh = sum(1 for m in metas if is_fresh_meta(m))
+        if fresh == sum(1 for s in stops if is_fresh_meta(s)):
+            continue        # nada nuevo (p. ej. sin Google): no se reescribe
+        if store.set_stops(user, name, version, metas) and fresh == len(points):
+            done += 1
+            metrics.inc("route_stops_backfilled_total")
+    return done
+
+
+def start_stops_backfill():
+    """
+    Lanza `backfill_route_stops` en un hilo (uno solo por proceso). Si ya hay
+    uno en marcha, le pide otra pasada al terminar.
+    """
+    global _BACKFILL_THREAD, _BACKFILL_AGAIN
+    with _BACKFILL_LOCK:
+        if _BACKFILL_THREAD is not None:
+            _BACKFILL_AGAIN = True
+            return _BACKFILL_THREAD
+
+        def _run():
+            global _BACKFILL_THREAD, _BACKFILL_AGAIN
+            # Sus llamadas a Google no son de ningún usuario de la app
+            metrics.set_user("system")
+            while True:
+                try:
+                    backfill_route_stops()
+                except Exception:
+                    pass        # se reintenta en el próximo arranque / guardado
+                with _BACKFILL_LOCK:
+                    if not _BACKFILL_AGAIN:
+                        _BACKFILL_THREAD = None
+                        return
+                    _BACKFILL_AGAIN = False
+
+        _BACKFILL_THREAD = threading.Thread(
+            target=_run, name="stops-backfill", daemon=True
+        )
+        _BACKFILL_THREAD.start()
+    return _BACKFILL_THREAD
+
+
+def travel_matrix(metas, mode: str = "driving"):
+    """
+    Matrices (km, minutos) entre paradas ya resueltas, por carretera cuando hay
+    API (con caché por celda) o estimadas en línea recta si no.
+    """
+    from distance_matrix import travel_matrix as _travel_matrix
+
+    return _travel_matrix(metas, mode=mode, client=get_gmaps_client())
+
+
+def optimize_points(points, mode: str = "driving", known=None):
+    """
+    Reordena las paradas intermedias de `points` (textos) para minimizar la
+    distancia, con origen y destino fijos. Devuelve (puntos, km_ahorrados).
+    `known` se pasa a `resolve_many`. Lanza `UnlocatedStopsError` si alguna
+    parada no tiene coordenadas.
+    """
+    import numpy as np
+    from route_optimizer import UnlocatedStopsError, optimize_order, parse_coords
+
+    points = list(points or [])
+    metas = resolve_many(points, known=known)
+    unlocated = [p for p, m in zip(points, metas) if parse_coords(m) is None]
+    if unlocated:
+        raise UnlocatedStopsError(unlocated)
+    km, _, _ = travel_matrix(metas, mode)
+    return optimize_order(points, metas, None if np.isnan(km).any() else km)
 
 # ---------------------------------------------------------
 # Utilidades
@@ -82,6 +567,33 @@ def _encode(s: str) -> str:
     return urllib.parse.quote_plus(s or "")
 
 
+def _compact_location(text: str, precision: int = None) -> str:
+    """'41.97941234,2.82140987' -> '41.97941,2.82141'; las direcciones no cambian."""
+    precision = URL_COORD_PRECISION if precision is None else precision
+    parts = (text or "").split(",")
+    if len(parts) != 2:
+        return text
+    try:
+        lat, lon = float(parts[0]), float(parts[1])
+    except ValueError:
+        return text
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        return text
+
+    def fmt(v):
+        out = f"{v:.{precision}f}".rstrip("0").rstrip(".")
+        return "0" if out in ("-0", "") else out
+
+    return f"{fmt(lat)},{fmt(lon)}"
+
+
+def _encode_location(s: str, compact: bool) -> str:
+    if not compact:
+        return _encode(s)
+    # Google acepta la coma literal: 1 carácter en vez de 3 (%2C)
+    return urllib.parse.quote_plus(_compact_location(s) or "", safe=",")
+
+
 def _clean_waypoints(raw):
     """
     Normaliza y limpia cualquier rastro de 'optimize:true' para que NUNCA
@@ -121,17 +633,21 @@ def _clean_waypoints(raw):
 # ---------------------------------------------------------
 # Construcción de URLs Google / Waze / Apple
 # ---------------------------------------------------------
+@metrics.timed()
 def build_gmaps_url(
     origin_meta,
     destination_meta,
     waypoints_meta=None,
     mode: str = "driving",
     avoid: str | None = None,
+    compact: bool | None = None,
 ):
     """
-    Construye la URL de Google Maps usando 'optimize:true' correctamente dentro
-    del parámetro 'waypoints', evitando que Google lo trate como una parada más.
+    Construye la URL de Google Maps con las paradas en el orden recibido.
+    Cualquier 'optimize:true' colado en los waypoints se descarta.
+    `compact` (por defecto URL_COMPACT) acorta las coordenadas.
     """
+    compact = URL_COMPACT if compact is None else compact
     # Origen/Destino: prioriza coords si existen
     origin = origin_meta.get("coords", origin_meta.get("address"))
     destination = destination_meta.get("coords", destination_meta.get("address"))
@@ -141,31 +657,33 @@ def build_gmaps_url(
 
     params = [
         "api=1",
-        f"origin={_encode(origin)}",
-        f"destination={_encode(destination)}",
+        f"origin={_encode_location(origin, compact)}",
+        f"destination={_encode_location(destination, compact)}",
         f"travelmode={_encode(mode)}",
     ]
 
     if waypoints_list:
-        encoded_waypoints = [_encode(w) for w in waypoints_list]
-
-        # Cambia esta bandera si NO quieres que Google reordene las paradas
-        optimize_flag = False
-
-        if optimize_flag:
-            # Google espera exactamente: optimize:true|wp1|wp2|...
-            waypoints_param = "optimize:False|" + "%7C".join(encoded_waypoints)
-        else:
-            waypoints_param = "%7C".join(encoded_waypoints)
-
+        # El orden lo decide el usuario (o `optimize_points`), nunca Google
+        waypoints_param = "%7C".join(_encode_location(w, compact) for w in waypoints_list)
         params.append(f"waypoints={waypoints_param}")
 
+    if URL_PLACE_IDS:
+        if origin_meta.get("place_id"):
+            params.append(f"origin_place_id={_encode(origin_meta['place_id'])}")
+        if destination_meta.get("place_id"):
+            params.append(f"destination_place_id={_encode(destination_meta['place_id'])}")
+        # Google exige un place_id por cada waypoint, en el mismo orden
+        wp_ids = [w.get("place_id") if isinstance(w, dict) else None for w in (waypoints_meta or [])]
+        if waypoints_list and len(wp_ids) == len(waypoints_list) and all(wp_ids):
+            params.append("waypoint_place_ids=" + "%7C".join(_encode(i) for i in wp_ids))
+
     if avoid:
         params.append(f"avoid={_encode(avoid)}")
 
     return "https://www.google.com/maps/dir/?" + "&".join(params)
 
 
+@metrics.timed()
 def build_waze_url(origin_meta, destination_meta):
     """Waze: usa address; si hay lat/lon de destino, mejor con ?ll=""."""
     origin = origin_meta.get("address")
@@ -184,6 +702,7 @@ def build_waze_url(origin_meta, destination_meta):
     )
 
 
+@metrics.timed()
 def build_apple_maps_url(origin_meta, destination_meta, waypoints=None):
     """Apple Maps usa address para saddr/daddr."""
     origin = origin_meta.get("address")
@@ -193,5 +712,81 @@ def build_apple_maps_url(origin_meta, destination_meta, waypoints=None):
         f"?saddr={_encode(origin)}&daddr={_encode(destination)}&dirflg=d"
     )
 
-# Bandera de “API disponible”
-gmaps = bool(GMAPS_CLIENT)
\ No newline at end of file
+# ---------------------------------------------------------
+# Rutas largas: tramos enlazados
+# ---------------------------------------------------------
+def split_legs(items, max_waypoints: int = MAX_URL_WAYPOINTS):
+    """
+    Parte una lista de puntos en tramos consecutivos de como mucho
+    `max_waypoints` paradas intermedias. El destino de cada tramo es el origen
+    del siguiente.
+    """
+    items = list(items or [])
+    step = max(1, max_waypoints + 1)
+    legs = []
+    for start in range(0, max(len(items) - 1, 0), step):
+        legs.append(items[start:start + step + 1])
+    return legs
+
+
+def _hops(leg, build):
+    """Un enlace por cada salto entre paradas consecutivas (proveedores sin waypoints)."""
+    return [
+        {"destination": d.get("address"), "url": build(o, d)}
+        for o, d in split_legs(leg, max_waypoints=0)
+    ]
+
+
+def build_route_legs(metas, mode: str = "driving", avoid: str | None = None,
+                     max_waypoints: int = MAX_URL_WAYPOINTS):
+    """
+    Enlaces por tramo para una lista de metas ya resueltos (origen primero,
+    destino último). Devuelve [{"gmaps", "short", "waze", "apple",
+    "waze_hops", "apple_hops", "origin", "destination", "points"}], uno por
+    tramo.
+
+    Waze y Apple Maps solo admiten un destino: "waze_hops"/"apple_hops"
+    llevan un enlace por parada del tramo ({"destination", "url"}) y
+    "waze"/"apple" son el primero (hasta la siguiente parada).
+    """
+    out = []
+    for leg in split_legs(metas, max_waypoints):
+        o_meta, d_meta, w_metas = leg[0], leg[-1], leg[1:-1]
+        gmaps_url = build_gmaps_url(o_meta, d_meta, w_metas or None, mode=mode, avoid=avoid)
+        waze_hops = _hops(leg, build_waze_url)
+        apple_hops = _hops(leg, build_apple_maps_url)
+        out.append({
+            "gmaps": gmaps_url,
+            # Enlace corto propio (None si SHORTLINK_BASE_URL no está definido)
+            "short": short_url(gmaps_url),
+            "waze": waze_hops[0]["url"],
+            "apple": apple_hops[0]["url"],
+            "waze_hops": waze_hops,
+            "apple_hops": apple_hops,
+            "origin": o_meta.get("address"),
+            "destination": d_meta.get("address"),
+            "points": len(leg),
+        })
+    return out
+
+
+def route_points(points):
+    """Textos válidos de una ruta, sin 'optimize:...' colado entre las paradas."""
+    pts = [p for p in (points or []) if isinstance(p, str) and p.strip()]
+    if len(pts) < 2:
+        return pts
+    # --- SANEAR waypoints: evitar que 'optimize:true' entre como punto ---
+    return [pts[0]] + [w for w in pts[1:-1] if not w.lower().startswith("optimize")] + [pts[-1]]
+
+
+def route_links(points, mode: str = "driving", avoid: str | None = None, known=None):
+    """
+    De textos a enlaces en un solo paso: resuelve los puntos en lote (caché,
+    nomenclátor, Google) y construye los tramos. Devuelve (metas, tramos).
+    `known` se pasa a `resolve_many`.
+    """
+    pts = route_points(points)
+    if len(pts) < 2:
+        return [], []
+    metas = resolve_many(pts, known=known)
+    return metas, build_route_legs(metas, mode=mode, avoid=avoid)
@@ -0,0 +1,252 @@
+# batch_routes.py
+"""
+Generación masiva de enlaces y QR desde una hoja de rutas (CSV o JSONL).
+
+    python batch_routes.py semana.csv --out salida/ [--sheet] [--workers N]
+
+Formato CSV (cabecera obligatoria):
+    name,stops,mode,avoid,driver
+    lunes,"girona | sils | barcelona",driving,tolls,ana
+
+`stops` va separado por "|" (o ";"). En JSONL cada línea es un objeto con las
+mismas claves y `stops` puede ser una lista.
+
+La entrada se lee en streaming y se procesa por lotes: las paradas de cada
+lote se deduplican y se geocodifican una sola vez (pool de hilos y caché
+compartida de la app), y los QR (trabajo de CPU) se reparten entre procesos.
+Las líneas JSONL mal formadas (o con campos que no son texto) se cuentan
+como rechazadas y se siguen procesando las demás. Cada resultado se escribe
+en cuanto está listo en `<out>/routes.jsonl` y `<out>/qr/<ruta>_<tramo>.png`,
+así la memoria no crece con el tamaño del fichero. Con --sheet se genera además una hoja de
+QR imprimible (HTML) por conductor.
+"""
+import argparse
+import csv
+import html
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from app_utils_core import build_route_legs, resolve_many, route_points
+from qr_render import qr_png
+
+BATCH_ROWS = 64
+
+
+# ---------------------------
+# Lectura en streaming
+# ---------------------------
+def _split_stops(raw):
+    if isinstance(raw, list):
+        return [str(s).strip() for s in raw if str(s).strip()]
+    return [s.strip() for s in re.split(r"[|;]", raw or "") if s.strip()]
+
+
+_TEXT_FIELDS = ("name", "mode", "avoid", "driver")
+
+
+def _row(data: dict, lineno: int):
+    """Fila normalizada, o None si algún campo no es del tipo esperado (p. ej. "name": 5)."""
+    if any(data.get(k) is not None and not isinstance(data[k], str) for k in _TEXT_FIELDS):
+        return None
+    if data.get("stops") is not None and not isinstance(data["stops"], (str, list)):
+        return None
+    return {
+        "name": (data.get("name") or f"ruta_{lineno}").strip(),
+        "stops": _split_stops(data.get("stops")),
+        "mode": (data.get("mode") or "driving").strip() or "driving",
+        "avoid": (data.get("avoid") or "").strip() or None,
+        "driver": (data.get("driver") or "").strip() or None,
+    }
+
+
+def iter_rows(path):
+    """
+    Genera filas normalizadas sin cargar el fichero entero (None por cada
+    línea JSONL que no es un objeto JSON válido o con campos de otro tipo).
+    """
+    path = Path(path)
+    with open(path, encoding="utf-8", newline="") as fh:
+        if path.suffix.lower() in (".jsonl", ".ndjson"):
+            for lineno, line in enumerate(fh, 1):
+                if not line.strip():
+                    continue
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    data = None
+                yield _row(data, lineno) if isinstance(data, dict) else None
+        else:
+            for lineno, data in enumerate(csv.DictReader(fh), 1):
+                yield _row(data, lineno)
+
+
+def _batches(rows, size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ---------------------------
+# Procesado
+# ---------------------------
+def _links_for_batch(batch):
+    """
+    (fila, (metas, tramos)) de cada fila del lote. Las paradas de todo el
+    lote se resuelven juntas: cada dirección distinta se geocodifica una vez.
+    """
+    points = [route_points(row["stops"]) for row in batch]
+    labels = list(dict.fromkeys(p for pts in points for p in pts))
+    resolved = dict(zip(labels, resolve_many(labels)))
+    out = []
+    for row, pts in zip(batch, points):
+        if len(pts) < 2:
+            out.append((row, ([], [])))
+            continue
+        metas = [resolved[p] for p in pts]
+        out.append((row, (metas, build_route_legs(metas, mode=row["mode"], avoid=row["avoid"]))))
+    return out
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", text, flags=re.UNICODE).strip("_") or "ruta"
+
+
+def _qr_job(url: str, path: str) -> int:
+    """Se ejecuta en un proceso hijo: genera y escribe el PNG."""
+    png = qr_png(url)
+    with open(path, "wb") as fh:
+        fh.write(png)
+    return len(png)
+
+
+class _ContactSheets:
+    """Hojas HTML por conductor, escritas a medida que llegan las rutas."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._files = {}
+
+    def add(self, driver, route_name, leg_idx, total, qr_rel, url):
+        key = driver or "sin_conductor"
+        fh = self._files.get(key)
+        if fh is None:
+            fh = open(self.directory / f"sheet_{_slug(key)}.html", "w", encoding="utf-8")
+            fh.write(
+                "<!doctype html><meta charset='utf-8'>"
+                f"<title>{html.escape(key)}</title>"
+                "<style>body{font-family:sans-serif}"
+                ".c{display:inline-block;width:220px;margin:8px;text-align:center;"
+                "page-break-inside:avoid}img{width:200px;image-rendering:pixelated}</style>"
+                f"<h1>{html.escape(key)}</h1>\n"
+            )
+            self._files[key] = fh
+        label = route_name if total == 1 else f"{route_name} ({leg_idx}/{total})"
+        fh.write(
+            f"<div class='c'><a href='{html.escape(url)}'><img src='{html.escape(qr_rel)}'></a>"
+            f"<div>{html.escape(label)}</div></div>\n"
+        )
+
+    def close(self):
+        for fh in self._files.values():
+            fh.close()
+        return len(self._files)
+
+
+def run(input_path, out_dir, workers=None, sheet=False, batch_rows=BATCH_ROWS, log=sys.stderr):
+    """Procesa la hoja completa y devuelve las estadísticas."""
+    out_dir = Path(out_dir)
+    qr_dir = out_dir / "qr"
+    qr_dir.mkdir(parents=True, exist_ok=True)
+    sheets = _ContactSheets(out_dir) if sheet else None
+    stats = {"rows": 0, "routes": 0, "legs": 0, "skipped": 0, "rejected": 0, "qr_bytes": 0}
+    seen_names = {}
+    t0 = time.perf_counter()
+
+    def _flush(pending):
+        results, jobs = pending
+        for fut in jobs:
+            stats["qr_bytes"] += fut.result()
+        for row, (metas, legs) in results:
+            if not legs:
+                continue
+            stats["routes"] += 1
+            stats["legs"] += len(legs)
+            out.write(json.dumps({
+                "name": row["name"], "driver": row["driver"], "mode": row["mode"],
+                "avoid": row["avoid"], "points": metas, "legs": legs,
+            }, ensure_ascii=False) + "\n")
+            if sheets:
+                for i, leg in enumerate(legs, 1):
+                    sheets.add(row["driver"], row["name"], i, len(legs), leg["qr"], leg["gmaps"])
+        out.flush()
+        if log:
+            elapsed = time.perf_counter() - t0
+            log.write(f"\r{stats['rows']} filas · {stats['rows'] / elapsed:.1f} filas/s")
+            log.flush()
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool, \
+            open(out_dir / "routes.jsonl", "w", encoding="utf-8") as out:
+        pending = None
+        for batch in _batches(iter_rows(input_path), batch_rows):
+            rows = [row for row in batch if row is not None]
+            stats["rows"] += len(batch) - len(rows)
+            stats["rejected"] += len(batch) - len(rows)
+            # Geocodificación y enlaces (hilos + caché compartida) mientras
+            # los procesos siguen con los QR del lote anterior
+            results = _links_for_batch(rows)
+            jobs = []
+            for row, (metas, legs) in results:
+                stats["rows"] += 1
+                if not legs:
+                    stats["skipped"] += 1
+                    continue
+                base = _slug(row["name"])
+                n = seen_names.get(base, 0)
+                seen_names[base] = n + 1
+                if n:
+                    base = f"{base}_{n + 1}"
+                for i, leg in enumerate(legs, 1):
+                    leg["qr"] = f"qr/{base}_{i}.png"
+                    qr_url = leg.get("short") or leg["gmaps"]
+                    jobs.append(pool.submit(_qr_job, qr_url, str(out_dir / leg["qr"])))
+            # Como máximo dos lotes en vuelo: memoria acotada
+            if pending:
+                _flush(pending)
+            pending = (results, jobs)
+        if pending:
+            _flush(pending)
+
+    stats["sheets"] = sheets.close() if sheets else 0
+    stats["seconds"] = round(time.perf_counter() - t0, 3)
+    stats["rows_per_s"] = round(stats["rows"] / stats["seconds"], 1) if stats["seconds"] else None
+    stats["legs_per_s"] = round(stats["legs"] / stats["seconds"], 1) if stats["seconds"] else None
+    if log:
+        log.write("\n")
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Enlaces y QR en lote desde CSV/JSONL")
+    parser.add_argument("input", help="fichero .csv o .jsonl con las rutas")
+    parser.add_argument("--out", default="batch_out", help="directorio de salida")
+    parser.add_argument("--workers", type=int, default=None, help="procesos para los QR")
+    parser.add_argument("--sheet", action="store_true", help="hoja de QR imprimible por conductor")
+    parser.add_argument("--batch", type=int, default=BATCH_ROWS, help="filas por lote")
+    args = parser.parse_args(argv)
+    stats = run(args.input, args.out, workers=args.workers, sheet=args.sheet, batch_rows=args.batch)
+    for key, value in stats.items():
+        print(f"{key:12s} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# benchmarks/bench_core.py
+"""
+Micro-benchmarks del pipeline de rutas, sin red.
+
+    python benchmarks/bench_core.py [--quick] [--latency-ms 20] [--compare results/abc123.json]
+
+Mide la limpieza de waypoints, la construcción de URLs, `resolve_selection`
+contra un cliente de Google falso (con y sin caché), el QR de la UI y el
+almacén de rutas con bibliotecas de 10 / 1k / 100k rutas. Todo corre contra
+ficheros temporales (caché, rutas) y el resultado se guarda en
+`benchmarks/results/<commit>.json` para poder comparar entre commits.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# Aislamiento: nada de lo que se mida toca los ficheros reales de la app
+_TMP = tempfile.mkdtemp(prefix="bench_")
+os.environ["GEOCACHE_PATH"] = os.path.join(_TMP, "geocache.sqlite3")
+os.environ["MATRIX_CACHE_PATH"] = os.path.join(_TMP, "matrix.sqlite3")
+os.environ["ROUTES_DB_PATH"] = os.path.join(_TMP, "routes.sqlite3")
+os.environ["GEOCODER_LOCAL_FIRST"] = "0"
+os.environ["GOOGLE_API_KEY"] = ""
+sys.path.insert(0, str(ROOT))
+os.chdir(_TMP)
+
+from benchmarks.fake_gmaps import FakeGoogleMapsClient, install  # noqa: E402
+
+
+def _timeit(fn, repeat: int, number: int = 1) -> dict:
+    """Tiempo por llamada (µs): mediana, p95 y mínimo de `repeat` rondas."""
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - t) / number * 1e6)
+    samples.sort()
+    return {
+        "median_us": round(statistics.median(samples), 3),
+        "p95_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "min_us": round(samples[0], 3),
+        "rounds": repeat,
+    }
+
+
+def _metas(n: int):
+    return [
+        {"address": f"Carrer Major {i}, Girona", "coords": f"{41.9 + i / 1000:.4f},{2.8 + i / 1000:.4f}"}
+        for i in range(n)
+    ]
+
+
+# ---------------------------
+# Benchmarks
+# ---------------------------
+def bench_urls(repeat):
+    import app_utils_core as core
+
+    out = {}
+    raw = ["optimize:true|Sils", "Girona", "optimize%3Atrue", "  ", "Carrer+Pau+Casals+27"] * 2
+    out["clean_waypoints_10"] = _timeit(lambda: core._clean_waypoints(raw), repeat, 200)
+    metas = _metas(11)
+    out["build_gmaps_url_9wp"] = _timeit(
+        lambda: core.build_gmaps_url(metas[0], metas[-1], metas[1:-1], avoid="tolls"), repeat, 200
+    )
+    out["build_waze_url"] = _timeit(lambda: core.build_waze_url(metas[0], metas[-1]), repeat, 200)
+    out["build_apple_maps_url"] = _timeit(
+        lambda: core.build_apple_maps_url(metas[0], metas[-1]), repeat, 200
+    )
+    long_metas = _metas(60)
+    out["build_route_legs_60"] = _timeit(lambda: core.build_route_legs(long_metas), repeat, 20)
+    return out
+
+
+def bench_resolve(repeat, latency_ms):
+    import app_utils_core as core
+    from geocache import get_geocache
+
+    fake = install(FakeGoogleMapsClient(latency_ms=latency_ms))
+    out = {}
+    counter = iter(range(10**9))
+    rounds = max(3, repeat // 4)
+    # Fallo de caché: cada llamada es una dirección nueva (va al cliente falso)
+    out["resolve_selection_miss"] = _timeit(
+        lambda: core.resolve_selection(f"calle inventada {next(counter)} madrid"), rounds, 5
+    )
+    # Acierto: la misma dirección ya está en la caché persistente
+    core.resolve_selection("carrer pau casals 27 sils")
+    out["resolve_selection_hit"] = _timeit(
+        lambda: core.resolve_selection("carrer pau casals 27 sils"), repeat, 200
+    )
+    # Lote de 20 direcciones nuevas (pool de hilos)
+    out["resolve_many_20_miss"] = _timeit(
+        lambda: core.resolve_many([f"calle lote {next(counter)}" for _ in range(20)]), rounds, 1
+    )
+    out["fake_client_calls"] = dict(fake.calls)
+    out["latency_ms"] = latency_ms
+    get_geocache().clear()
+    install(None)
+    return out
+
+
+def bench_qr(repeat):
+    from tab_profesional.ui import _qr_image_for
+
+    url = "https://www.google.com/maps/dir/?api=1&" + "&".join(
+        f"p{i}=41.{i:04d}%2C2.{i:04d}" for i in range(12)
+    )
+    counter = iter(range(10**9))
+    out = {
+        "qr_image_for_cold": _timeit(lambda: _qr_image_for(f"{url}&n={next(counter)}"), max(3, repeat // 4)),
+        "qr_image_for_cached": _timeit(lambda: _qr_image_for(url), repeat, 200),
+    }
+    out["png_bytes"] = len(_qr_image_for(url).getvalue())
+    return out
+
+
+def bench_store(sizes, repeat):
+    from route_store import RouteStore
+
+    out = {}
+    points = [f"parada {i}" for i in range(12)]
+    payload = json.dumps(points)
+    for size in sizes:
+        store = RouteStore(os.path.join(_TMP, f"store_{size}.sqlite3"))
+        # Carga inicial directa en una sola transacción (no es lo que se mide)
+        with store._lock:
+            store._conn.execute("BEGIN")
+            store._conn.executemany(
+                "INSERT INTO routes (user, name, points, version, updated_at) VALUES (?, ?, ?, 1, 0)",
+                ((f"user{i % 10}", f"ruta {i}", payload) for i in range(size)),
+            )
+            store._conn.execute("COMMIT")
+        counter = iter(range(10**9))
+        out[str(size)] = {
+            "save_new": _timeit(lambda: store.save("user0", f"nueva {next(counter)}", points), repeat, 5),
+            "save_overwrite": _timeit(lambda: store.save("user0", "ruta 0", points), repeat, 5),
+            "get": _timeit(lambda: store.get("user0", "ruta 0"), repeat, 50),
+            "list_routes_user": _timeit(lambda: store.list_routes("user0"), max(3, repeat // 4)),
+            "signature": _timeit(lambda: store.signature("user0"), repeat, 20),
+        }
+    return out
+
+
+# ---------------------------
+# Resultados
+# ---------------------------
+def _git_rev():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip() or "nogit"
+    except Exception:
+        return "nogit"
+
+
+def _flatten(d, prefix=""):
+    for k, v in d.items():
+        if isinstance(v, dict) and "median_us" not in v:
+            yield from _flatten(v, f"{prefix}{k}.")
+        elif isinstance(v, dict):
+            yield f"{prefix}{k}", v["median_us"]
+
+
+def compare(old: dict, new: dict, threshold: float = 0.10):
+    """Imprime las diferencias de mediana; devuelve las regresiones > threshold."""
+    before = dict(_flatten(old["results"]))
+    regressions = []
+    for name, now in _flatten(new["results"]):
+        prev = before.get(name)
+        if not prev:
+            continue
+        delta = (now - prev) / prev
+        flag = "  REGRESIÓN" if delta > threshold else ""
+        print(f"{name:48s} {prev:12.2f} → {now:12.2f} µs  {delta:+7.1%}{flag}")
+        if delta > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline de rutas")
+    parser.add_argument("--quick", action="store_true", help="menos rondas y sin la biblioteca de 100k")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="latencia del cliente falso")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior")
+    parser.add_argument("--out", help="ruta del JSON de salida")
+    args = parser.parse_args(argv)
+
+    repeat = 5 if args.quick else 20
+    sizes = (10, 1000) if args.quick else (10, 1000, 100_000)
+    results = {
+        "urls": bench_urls(repeat),
+        "resolve": bench_resolve(repeat, args.latency_ms),
+        "qr": bench_qr(repeat),
+        "store": bench_store(sizes, repeat),
+    }
+    doc = {
+        "commit": _git_rev(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "results": results,
+    }
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{doc['commit']}.json"
+    if not out.is_absolute():
+        out = ROOT / out
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(doc, indent=2, ensure_ascii=False), encoding="utf-8")
+    for name, median in _flatten(results):
+        print(f"{name:48s} {median:12.2f} µs")
+    print(f"\nResultados en {out}")
+    if args.compare:
+        path = Path(args.compare)
+        old = json.loads((path if path.is_absolute() else ROOT / path).read_text(encoding="utf-8"))
+        print(f"\nComparación con {old.get('commit')}:")
+        if compare(old, doc):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+# benchmarks/fake_maps_server.py
+"""
+Servidor HTTP local que imita la Geocoding API y la Distance Matrix API.
+
+La app lo usa en lugar de Google con GMAPS_BASE_URL=http://127.0.0.1:<puerto>.
+Las respuestas salen de `FakeGoogleMapsClient` (deterministas) y se puede
+inyectar latencia y errores:
+
+    python benchmarks/fake_maps_server.py --port 8600 --latency-ms 80 --error-rate 0.05
+
+Tipos de error (--error-kind): "denied" (status REQUEST_DENIED, el cliente
+falla al momento), "http500" (el cliente reintenta con espera) y "quota"
+(OVER_QUERY_LIMIT, también reintentado).
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_gmaps import FakeGoogleMapsClient  # noqa: E402
+
+
+class FakeMapsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 error_kind="denied", seed=None):
+        super().__init__(address, _Handler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_kind = error_kind
+        self.backend = FakeGoogleMapsClient()
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _decide(self):
+        """(espera en segundos, error a inyectar o None) para una petición."""
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms))
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return delay / 1000.0, (self.error_kind if fail else None)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="fake-maps", daemon=True)
+        thread.start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        delay, error = self.server._decide()
+        if delay:
+            time.sleep(delay)
+        if error == "http500":
+            return self._send(500, {"status": "UNKNOWN_ERROR"})
+        if error == "quota":
+            return self._send(200, {"status": "OVER_QUERY_LIMIT", "results": []})
+        if error:
+            return self._send(200, {"status": "REQUEST_DENIED", "error_message": "inyectado"})
+
+        backend = self.server.backend
+        if url.path == "/maps/api/geocode/json":
+            if "latlng" in params:
+                results = backend.reverse_geocode(params["latlng"])
+            else:
+                results = backend.geocode(params.get("address", ""))
+            return self._send(200, {"status": "OK" if results else "ZERO_RESULTS", "results": results})
+        if url.path == "/maps/api/distancematrix/json":
+            origins = params.get("origins", "").split("|")
+            destinations = params.get("destinations", "").split("|")
+            body = backend.distance_matrix(origins, destinations, mode=params.get("mode", "driving"))
+            body["origin_addresses"] = origins
+            body["destination_addresses"] = destinations
+            return self._send(200, body)
+        return self._send(404, {"status": "NOT_FOUND"})
+
+
+def serve(port=0, host="127.0.0.1", **kwargs) -> FakeMapsServer:
+    """Arranca el servidor en un hilo y lo devuelve (port=0: puerto libre)."""
+    return FakeMapsServer((host, port), **kwargs).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Google Maps falso para pruebas de carga")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-kind", choices=["denied", "http500", "quota"], default="denied")
+    args = parser.parse_args()
+    server = FakeMapsServer(
+        (args.host, args.port), latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, error_kind=args.error_kind,
+    )
+    print(f"Google Maps falso en {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,275 @@
+# benchmarks/load_test.py
+"""
+Prueba de carga: N despachadores simultáneos sobre `photo_agent_app.py`.
+
+    python benchmarks/load_test.py --users 8 --iterations 3 --latency-ms 80 --error-rate 0.05
+
+Cada usuario es una sesión de Streamlit sin navegador (AppTest) en su propio
+hilo, todas en el mismo proceso que comparte cachés y almacén de rutas como
+lo haría un servidor real. Cada sesión hace login y repite: añadir puntos,
+reordenar, guardar, generar la ruta y limpiar. Google Maps se sustituye por
+el servidor falso local (latencia y errores inyectables).
+
+Se informa de la latencia de cada rerun (p50/p95/p99, total y por acción),
+del rendimiento (reruns/s), de la memoria por sesión (crecimiento del RSS
+dividido entre sesiones) y de las excepciones. Con --out se guarda en JSON.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+APP = ROOT / "photo_agent_app.py"
+
+# Estado de la app en ficheros temporales (se fija antes de importar la app)
+_TMP = tempfile.mkdtemp(prefix="load_")
+os.environ["CONFIG_FILE"] = os.path.join(_TMP, "config.yaml")
+os.environ["GEOCACHE_PATH"] = os.path.join(_TMP, "geocache.sqlite3")
+os.environ["MATRIX_CACHE_PATH"] = os.path.join(_TMP, "matrix.sqlite3")
+os.environ["ROUTES_DB_PATH"] = os.path.join(_TMP, "routes.sqlite3")
+os.environ["GEOCODER_LOCAL_FIRST"] = "0"
+os.environ["GOOGLE_API_KEY"] = "AIza-fake-load-test"
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
+
+from benchmarks.fake_maps_server import serve  # noqa: E402
+
+STREETS = ["Carrer Major", "Avinguda Catalunya", "Calle Real", "Rambla Nova", "Plaza Mayor"]
+TOWNS = ["Girona", "Sils", "Barcelona", "Reus", "Lleida", "Figueres", "Vic", "Manresa"]
+
+
+def _share_runtime_state():
+    """
+    Ajusta AppTest para que varias sesiones puedan correr a la vez en hilos,
+    como en un servidor real:
+
+    - AppTest instala un Runtime simulado al empezar cada run y lo quita
+      (`Runtime._instance = None`) al acabar, a mitad del run de otra sesión:
+      `Runtime.instance()` devuelve el último runtime simulado en vez de fallar.
+    - AppTest crea ScriptCaches nuevas en cada run y recompila el script;
+      ast.parse no es seguro entre hilos en CPython 3.11 y el servidor real
+      compila una sola vez: todas las sesiones comparten una ScriptCache.
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    original = Runtime.instance.__func__
+    last = []
+
+    def instance(cls):
+        rt = cls._instance
+        if rt is not None:
+            last[:] = [rt]
+            return rt
+        return last[0] if last else original(cls)
+
+    Runtime.instance = classmethod(instance)
+    shared_cache = app_test.ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: shared_cache
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _percentiles(samples):
+    if not samples:
+        return {}
+    s = sorted(samples)
+
+    def pct(p):
+        return round(s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))], 2)
+
+    return {
+        "count": len(s), "p50_ms": pct(50), "p95_ms": pct(95), "p99_ms": pct(99),
+        "max_ms": round(s[-1], 2), "mean_ms": round(statistics.fmean(s), 2),
+    }
+
+
+class _Session:
+    """Un despachador: una sesión AppTest con su propio estado."""
+
+    def __init__(self, idx: int, password: str, timeout: float, seed: int):
+        from streamlit.testing.v1 import AppTest
+
+        self.username = f"despachador{idx}"
+        self.password = password
+        self.at = AppTest.from_file(str(APP), default_timeout=timeout)
+        self.rng = random.Random(seed)
+        self.timings = []        # (acción, ms)
+        self.errors = []
+
+    def _run(self, action, widget=None):
+        t = time.perf_counter()
+        try:
+            (widget.run() if widget is not None else self.at.run())
+        except Exception as exc:        # timeout del rerun u otro fallo del runner
+            self.errors.append(f"{action}: {type(exc).__name__}: {exc}")
+            return
+        self.timings.append((action, (time.perf_counter() - t) * 1000.0))
+        for exc in self.at.exception:
+            self.errors.append(f"{action}: {exc.value}")
+
+    def _button(self, label, nth=0):
+        buttons = [b for b in self.at.button if b.label == label and not b.disabled]
+        return buttons[nth] if len(buttons) > nth else None
+
+    def login(self):
+        self._run("first_render")
+        self.at.text_input(key="login_username").set_value(self.username)
+        self.at.text_input(key="login_password").set_value(self.password)
+        self._run("login", self._button("Login").click())
+        if not self.at.session_state["logged_in"]:
+            self.errors.append("login: no se inició la sesión")
+
+    def iteration(self, n: int, stops: int):
+        for _ in range(stops):
+            addr = f"{self.rng.choice(STREETS)} {self.rng.randint(1, 400)}, {self.rng.choice(TOWNS)}"
+            self.at.text_input(key="prof_text_input").set_value(addr)
+            self._run("add_point", self._button("Añadir").click())
+        ups = [b for b in self.at.button if b.label == "▲" and not b.disabled]
+        if ups:
+            self._run("reorder", ups[-1].click())
+        self.at.text_input(key="route_name_input").set_value(f"ruta {n}")
+        save = self._button("💾 Guardar")
+        if save is not None:
+            self._run("save", save.click())
+            confirm = self._button("✅ Sí, sobrescribir")
+            if confirm is not None:
+                self._run("save_confirm", confirm.click())
+        generate = self._button("Generar ruta profesional")
+        if generate is not None:
+            self._run("generate", generate.click())
+        clear = self._button("Limpiar ruta")
+        if clear is not None:
+            self._run("clear", clear.click())
+
+
+def run(users=4, iterations=2, stops=4, latency_ms=50.0, jitter_ms=20.0, error_rate=0.0,
+        error_kind="denied", timeout=60.0, seed=1234):
+    from credentials import get_credential_store
+
+    _share_runtime_state()
+    server = serve(latency_ms=latency_ms, jitter_ms=jitter_ms, error_kind=error_kind, seed=seed)
+    os.environ["GMAPS_BASE_URL"] = server.base_url
+
+    import app_utils_core
+
+    # El cliente se valida contra el servidor falso antes de inyectar errores
+    app_utils_core.get_gmaps_client()
+    for _ in range(200):
+        if app_utils_core.client_health()["status"] != "checking":
+            break
+        time.sleep(0.05)
+    server.error_rate = error_rate
+
+    password = "carga"
+    store = get_credential_store()
+    for i in range(users):
+        store.register(f"despachador{i}", f"d{i}@example.com", f"Despachador {i}", password)
+
+    # Calentamiento: importa streamlit y la app para que el RSS medido sea
+    # solo el de las sesiones
+    _Session(-1, password, timeout, seed)._run("warmup")
+    rss_before = _rss_mb()
+    sessions = [_Session(i, password, timeout, seed + i) for i in range(users)]
+
+    def _worker(session):
+        try:
+            session.login()
+            for n in range(iterations):
+                session.iteration(n, stops)
+        except Exception as exc:        # p. ej. un widget que no llegó a pintarse
+            session.errors.append(f"abortada: {type(exc).__name__}: {exc}")
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=_worker, args=(s,), name=s.username) for s in sessions]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    wall = time.perf_counter() - t0
+    rss_after = _rss_mb()
+
+    all_ms = [ms for s in sessions for _, ms in s.timings]
+    by_action = {}
+    for s in sessions:
+        for action, ms in s.timings:
+            by_action.setdefault(action, []).append(ms)
+    errors = [e for s in sessions for e in s.errors]
+    return {
+        "config": {
+            "users": users, "iterations": iterations, "stops": stops, "latency_ms": latency_ms,
+            "jitter_ms": jitter_ms, "error_rate": error_rate, "error_kind": error_kind,
+        },
+        "wall_s": round(wall, 3),
+        "reruns": len(all_ms),
+        "reruns_per_s": round(len(all_ms) / wall, 2) if wall else None,
+        "rerun_latency": _percentiles(all_ms),
+        "by_action": {k: _percentiles(v) for k, v in sorted(by_action.items())},
+        "memory": {
+            "rss_before_mb": round(rss_before, 1),
+            "rss_after_mb": round(rss_after, 1),
+            "per_session_mb": round((rss_after - rss_before) / max(users, 1), 2),
+        },
+        "fake_maps": {"requests": server.requests, "injected_errors": server.errors},
+        "client_health": app_utils_core.client_health()["status"],
+        "errors": errors[:50],
+        "error_count": len(errors),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga multi-sesión de la app")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=2)
+    parser.add_argument("--stops", type=int, default=4, help="puntos añadidos por iteración")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-kind", choices=["denied", "http500", "quota"], default="denied")
+    parser.add_argument("--timeout", type=float, default=60.0, help="tiempo máximo por rerun (s)")
+    parser.add_argument("--out", help="guardar el informe en JSON")
+    args = parser.parse_args(argv)
+
+    report = run(
+        users=args.users, iterations=args.iterations, stops=args.stops,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        error_kind=args.error_kind, timeout=args.timeout,
+    )
+    lat = report["rerun_latency"]
+    print(f"{report['config']['users']} usuarios · {report['reruns']} reruns en {report['wall_s']} s "
+          f"({report['reruns_per_s']} reruns/s)")
+    if lat:
+        print(f"rerun  p50 {lat['p50_ms']} ms · p95 {lat['p95_ms']} ms · p99 {lat['p99_ms']} ms")
+    for action, p in report["by_action"].items():
+        print(f"  {action:14s} n={p['count']:4d}  p50 {p['p50_ms']:8.1f}  p95 {p['p95_ms']:8.1f}  "
+              f"p99 {p['p99_ms']:8.1f} ms")
+    mem = report["memory"]
+    print(f"memoria: {mem['rss_before_mb']} → {mem['rss_after_mb']} MB "
+          f"(~{mem['per_session_mb']} MB/sesión)")
+    print(f"Maps falso: {report['fake_maps']['requests']} peticiones, "
+          f"{report['fake_maps']['injected_errors']} errores inyectados")
+    print(f"excepciones en la app: {report['error_count']}")
+    for err in report["errors"][:10]:
+        print("  ", err)
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    return 1 if report["error_count"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
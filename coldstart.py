@@ -0,0 +1,68 @@
+# coldstart.py
+"""
+Medición del arranque en frío.
+
+`mark(etiqueta)` anota el tiempo transcurrido desde que se importó este
+módulo (lo primero que hace la app); cada etiqueta se anota una sola vez por
+proceso, así los reruns de Streamlit no la pisan. Con STARTUP_REPORT=1 la app
+muestra el informe en la barra lateral.
+
+Ejecutado directamente mide, en un proceso limpio por módulo, cuánto tarda
+en importarse cada pieza de la app:
+    python coldstart.py
+"""
+import os
+import subprocess
+import sys
+import time
+
+_T0 = time.perf_counter()
+_MARKS = {}
+
+STARTUP_REPORT = os.getenv("STARTUP_REPORT") == "1"
+
+MODULES = [
+    "streamlit",
+    "googlemaps",
+    "yaml",
+    "qrcode",
+    "numpy",
+    "app_utils_core",
+    "tab_profesional.ui",
+]
+
+
+def mark(label: str):
+    _MARKS.setdefault(label, (time.perf_counter() - _T0) * 1000.0)
+
+
+def report():
+    """[(etiqueta, ms desde el inicio)] en orden cronológico."""
+    return sorted(_MARKS.items(), key=lambda kv: kv[1])
+
+
+def format_report() -> str:
+    return "\n".join(f"{ms:8.1f} ms  {label}" for label, ms in report())
+
+
+def measure_imports(modules=MODULES):
+    """{módulo: ms} importando cada uno en un intérprete nuevo."""
+    out = {}
+    for mod in modules:
+        code = (
+            "import time; t = time.perf_counter(); "
+            f"import {mod}; print((time.perf_counter() - t) * 1000)"
+        )
+        try:
+            res = subprocess.run(
+                [sys.executable, "-c", code], capture_output=True, text=True, timeout=120
+            )
+            out[mod] = float(res.stdout.strip().splitlines()[-1])
+        except Exception:
+            out[mod] = None
+    return out
+
+
+if __name__ == "__main__":
+    for mod, ms in measure_imports().items():
+        print(f"{mod:24s} {'error' if ms is None else f'{ms:8.1f} ms'}")
@@ -0,0 +1,169 @@
+# credentials.py
+"""
+Almacén de credenciales sobre `config.yaml` compartido por todas las sesiones.
+
+El YAML se parsea una vez y se guarda en memoria (índice por nombre de
+usuario); en cada acceso solo se hace un `stat` del fichero y se recarga si
+cambió su mtime/tamaño. Los registros se escriben de forma atómica (fichero
+temporal + rename) bajo un lock de hilo y, donde existe, un lock de fichero
+para que dos altas simultáneas no se pierdan.
+"""
+import hashlib
+import hmac
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo lock de hilo
+    fcntl = None
+
+CONFIG_FILE = Path(os.getenv("CONFIG_FILE", "config.yaml"))
+
+
+def hash_password(password):
+    """Función simple para hashear la contraseña (usando SHA256)."""
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def _default_config():
+    # Configuración completa con cookies iniciales cuando no existe el fichero
+    return {
+        'credentials': {'usernames': {}},
+        'cookie': {
+            'expiry_days': 30,
+            'key': hashlib.sha256(os.urandom(32)).hexdigest(),  # Clave única de seguridad
+            'name': 'auth_cookie'
+        }
+    }
+
+
+class CredentialStore:
+    def __init__(self, path=CONFIG_FILE):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._config = None
+        self._signature = None
+        self.reloads = 0
+
+    # ---------------------------
+    # Lectura con invalidación por mtime
+    # ---------------------------
+    def _stat_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _reload_locked(self, signature):
+        import yaml
+        from yaml.loader import SafeLoader
+
+        if signature is None:
+            config = _default_config()
+        else:
+            with open(self.path, encoding="utf-8") as fh:
+                config = yaml.load(fh, Loader=SafeLoader) or _default_config()
+        config.setdefault('credentials', {}).setdefault('usernames', {})
+        if config['credentials']['usernames'] is None:
+            config['credentials']['usernames'] = {}
+        self._config = config
+        self._signature = signature
+        self.reloads += 1
+
+    def config(self) -> dict:
+        """Configuración actual (recargada solo si el fichero cambió)."""
+        signature = self._stat_signature()
+        if self._config is None or signature != self._signature:
+            with self._lock:
+                if self._config is None or signature != self._signature:
+                    self._reload_locked(signature)
+        return self._config
+
+    def get_user(self, username):
+        return self.config()['credentials']['usernames'].get(username)
+
+    def check_password(self, username, password_unhashed) -> bool:
+        """Verifica si la contraseña coincide (búsqueda O(1) por usuario)."""
+        user_data = self.get_user(username)
+        if not user_data:
+            return False
+        return hmac.compare_digest(
+            str(user_data.get('password_hash', '')), hash_password(password_unhashed or '')
+        )
+
+    # ---------------------------
+    # Escritura atómica
+    # ---------------------------
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        lock_path = self.path.with_name(self.path.name + ".lock")
+        with open(lock_path, "w") as lock_fh:
+            fcntl.flock(lock_fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_fh, fcntl.LOCK_UN)
+
+    def _write_locked(self, config):
+        import yaml
+
+        directory = self.path.parent if str(self.path.parent) else Path(".")
+        fd, tmp = tempfile.mkstemp(prefix=self.path.name, suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                yaml.dump(config, fh, default_flow_style=False, allow_unicode=True)
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        self._config = config
+        self._signature = self._stat_signature()
+
+    def save(self, config):
+        """Reescribe el fichero completo (atómico)."""
+        with self._lock, self._file_lock():
+            self._write_locked(config)
+
+    def register(self, username, email, name, password) -> bool:
+        """Da de alta un usuario. Devuelve False si el nombre ya existe."""
+        with self._lock, self._file_lock():
+            # Releemos bajo el lock por si otro proceso registró a alguien
+            self._reload_locked(self._stat_signature())
+            usernames = self._config['credentials']['usernames']
+            if username in usernames:
+                return False
+            config = dict(self._config)
+            config['credentials'] = dict(config['credentials'])
+            config['credentials']['usernames'] = dict(usernames)
+            config['credentials']['usernames'][username] = {
+                'email': email,
+                'name': name,
+                'password_hash': hash_password(password),
+            }
+            self._write_locked(config)
+            return True
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_credential_store() -> CredentialStore:
+    """Almacén único por proceso."""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = CredentialStore()
+    return _STORE
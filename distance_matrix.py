@@ -0,0 +1,218 @@
+# distance_matrix.py
+"""
+Servicio de matriz de distancias/duraciones entre paradas.
+
+Pide a Google (Distance Matrix) solo las celdas origen-destino que no estén
+ya en la caché persistente, en bloques que respetan los límites de la API
+(máx. 25 orígenes, 25 destinos y 100 elementos por petición). Sin cliente, o
+para las celdas que Google no devuelva, se usa una estimación en línea recta
+(haversine vectorizada) corregida por un factor de rodeo.
+"""
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+import metrics
+from resilience import google_call, google_errors
+
+from route_optimizer import haversine_matrix, parse_coords
+
+MATRIX_CACHE_PATH = Path(os.getenv("MATRIX_CACHE_PATH", ".streamlit/matrix.sqlite3"))
+MATRIX_TTL = int(os.getenv("MATRIX_TTL", str(30 * 24 * 3600)))   # 30 días
+
+TILE_ORIGINS = 10
+TILE_DESTINATIONS = 10          # 10 × 10 = 100 elementos por petición
+
+# Estimación sin API: la carretera es ~30 % más larga que la línea recta
+DETOUR_FACTOR = 1.3
+FALLBACK_SPEED_KMH = {"driving": 70.0, "bicycling": 15.0, "walking": 4.5, "transit": 35.0}
+
+
+def _cell_key(meta) -> str:
+    """Clave estable de una parada: coords redondeadas a ~1 m o el texto."""
+    c = parse_coords(meta)
+    if c:
+        return f"{c[0]:.5f},{c[1]:.5f}"
+    if isinstance(meta, dict):
+        return (meta.get("address") or "").strip().lower()
+    return str(meta or "").strip().lower()
+
+
+class MatrixCache:
+    """Caché persistente de celdas (origen, destino, modo) -> (metros, segundos)."""
+
+    def __init__(self, path=MATRIX_CACHE_PATH, ttl=MATRIX_TTL):
+        self.path = Path(path)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cells (
+                origin      TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                mode        TEXT NOT NULL,
+                meters      REAL NOT NULL,
+                seconds     REAL NOT NULL,
+                created_at  REAL NOT NULL,
+                PRIMARY KEY (origin, destination, mode)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get_many(self, pairs, mode: str) -> dict:
+        """{(o, d): (metros, segundos)} para las parejas cacheadas y vigentes."""
+        pairs = set(pairs)
+        origins = sorted({o for o, _ in pairs})
+        out = {}
+        limit = time.time() - self.ttl
+        with self._lock:
+            for k in range(0, len(origins), 500):
+                chunk = origins[k:k + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT origin, destination, meters, seconds FROM cells "
+                    f"WHERE mode = ? AND created_at >= ? AND origin IN ({marks})",
+                    (mode, limit, *chunk),
+                )
+                for o, d, m, s in rows:
+                    if (o, d) in pairs:
+                        out[(o, d)] = (m, s)
+        return out
+
+    def put_many(self, cells: dict, mode: str):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?, ?, ?)",
+                [(o, d, mode, m, s, now) for (o, d), (m, s) in cells.items()],
+            )
+            self._conn.commit()
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_matrix_cache() -> MatrixCache:
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = MatrixCache()
+    return _CACHE
+
+
+# ---------------------------
+# Estimación y consulta
+# ---------------------------
+def estimate_matrix(metas, mode: str = "driving"):
+    """
+    Estimación sin red: (km, minutos) como matrices N×N. Las paradas sin
+    coordenadas quedan con NaN.
+    """
+    coords = [parse_coords(m) for m in metas]
+    n = len(coords)
+    km = np.full((n, n), np.nan)
+    ok = [i for i, c in enumerate(coords) if c]
+    if ok:
+        sub = haversine_matrix([coords[i] for i in ok]) * DETOUR_FACTOR
+        km[np.ix_(ok, ok)] = sub
+    speed = FALLBACK_SPEED_KMH.get(mode, FALLBACK_SPEED_KMH["driving"])
+    return km, km / speed * 60.0
+
+
+def _fetch_tile(client, origins, destinations, mode):
+    """Una petición a Google. Devuelve {(i, j): (metros, segundos)} para las celdas OK."""
+    resp = google_call("distance_matrix", client.distance_matrix, origins, destinations, mode=mode)
+    # La Distance Matrix se factura por elemento (origen × destino): solo
+    # cuentan las peticiones que Google llegó a responder
+    metrics.inc("gmaps_matrix_elements_total", len(origins) * len(destinations),
+                user=metrics.current_user())
+    out = {}
+    for i, row in enumerate(resp.get("rows", [])):
+        for j, el in enumerate(row.get("elements", [])):
+            if el.get("status") == "OK":
+                out[(i, j)] = (el["distance"]["value"], el["duration"]["value"])
+    return out
+
+
+def travel_matrix(metas, mode: str = "driving", client=None, cache=None):
+    """
+    Matrices N×N (km, minutos) entre las paradas `metas` (dicts con coords o
+    address) y el origen de los datos: "google", "mixed" o "estimate".
+
+    Solo se piden a Google las celdas que falten en la caché; las que sigan
+    faltando se rellenan con la estimación en línea recta.
+    """
+    metas = list(metas or [])
+    n = len(metas)
+    km, minutes = estimate_matrix(metas, mode)
+    if n == 0:
+        return km, minutes, "estimate"
+    np.fill_diagonal(km, 0.0)
+    np.fill_diagonal(minutes, 0.0)
+
+    keys = [_cell_key(m) for m in metas]
+    locations = [
+        m.get("coords") or m.get("address") if isinstance(m, dict) else str(m)
+        for m in metas
+    ]
+    cache = cache or get_matrix_cache()
+    wanted = {(keys[i], keys[j]) for i in range(n) for j in range(n) if i != j}
+    known = cache.get_many(wanted, mode)
+
+    missing = sorted({(i, j) for i in range(n) for j in range(n)
+                      if i != j and (keys[i], keys[j]) not in known})
+    if missing and client is not None:
+        rows = sorted({i for i, _ in missing})
+        cols = sorted({j for _, j in missing})
+        fetched = {}
+        for r0 in range(0, len(rows), TILE_ORIGINS):
+            tile_rows = rows[r0:r0 + TILE_ORIGINS]
+            for c0 in range(0, len(cols), TILE_DESTINATIONS):
+                tile_cols = cols[c0:c0 + TILE_DESTINATIONS]
+                # Saltamos bloques cuyas celdas ya estén todas en caché
+                if all((keys[i], keys[j]) in known or i == j
+                       for i in tile_rows for j in tile_cols):
+                    continue
+                try:
+                    cells = _fetch_tile(
+                        client,
+                        [locations[i] for i in tile_rows],
+                        [locations[j] for j in tile_cols],
+                        mode,
+                    )
+                except google_errors():
+                    continue
+                for (a, b), val in cells.items():
+                    i, j = tile_rows[a], tile_cols[b]
+                    if i != j:
+                        fetched[(keys[i], keys[j])] = val
+        if fetched:
+            cache.put_many(fetched, mode)
+            known.update(fetched)
+
+    from_api = 0
+    for i in range(n):
+        for j in range(n):
+            val = known.get((keys[i], keys[j])) if i != j else None
+            if val:
+                km[i, j] = val[0] / 1000.0
+                minutes[i, j] = val[1] / 60.0
+                from_api += 1
+
+    if n > 1 and from_api == n * (n - 1):
+        source = "google"
+    elif from_api:
+        source = "mixed"
+    else:
+        source = "estimate"
+    return km, minutes, source
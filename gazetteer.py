@@ -0,0 +1,275 @@
+# gazetteer.py
+"""
+Geocodificador offline a partir de un nomenclátor compilado en binario.
+
+El CSV de origen (`data/municipios_es.csv`: name, province, lat, lon, aliases
+y opcionalmente kind) se compila una vez a un fichero ordenado por clave
+normalizada que se abre con `mmap`: arrancar solo lee la cabecera y cada
+búsqueda es una búsqueda binaria sobre registros de tamaño fijo, sin crear
+objetos Python por cada entrada.
+
+Formato (little-endian):
+    cabecera  MAGIC(4s) count(I) strings_offset(I)
+    registros count × RECORD: key_off(I) key_len(H) label_len(H) lat(f) lon(f) kind(B)
+    cadenas   clave normalizada seguida de la etiqueta visible, en UTF-8
+
+Uso en línea de comandos:
+    python gazetteer.py build data/municipios_es.csv .streamlit/gazetteer_es.bin
+    python gazetteer.py lookup "tarragona"
+    python gazetteer.py nearest 41.81 2.74
+"""
+import bisect
+import csv
+import mmap
+import os
+import struct
+import sys
+import threading
+from pathlib import Path
+
+from geocache import normalize_query
+
+GAZETTEER_SOURCE = Path(os.getenv("GAZETTEER_SOURCE", "data/municipios_es.csv"))
+GAZETTEER_PATH = Path(os.getenv("GAZETTEER_PATH", ".streamlit/gazetteer_es.bin"))
+
+MAGIC = b"GZT1"
+HEADER = struct.Struct("<4sII")
+RECORD = struct.Struct("<IHHffB3x")
+
+KIND_MUNICIPALITY = 0
+KIND_STREET = 1
+_KINDS = {"municipio": KIND_MUNICIPALITY, "calle": KIND_STREET}
+
+# Sufijos que `lookup` admite tras "municipio, provincia"
+_COUNTRY_NAMES = {"espana", "spain"}
+
+
+# ---------------------------
+# Compilación
+# ---------------------------
+def _label_for(name: str, province: str) -> str:
+    if province and normalize_query(province) != normalize_query(name):
+        return f"{name}, {province}, España"
+    return f"{name}, España"
+
+
+def build_gazetteer(source, target) -> int:
+    """Compila el CSV `source` en el binario `target`. Devuelve nº de claves."""
+    entries = {}
+    with open(source, newline="", encoding="utf-8") as fh:
+        for row in csv.DictReader(fh):
+            name = (row.get("name") or "").strip()
+            if not name:
+                continue
+            label = _label_for(name, (row.get("province") or "").strip())
+            lat, lon = float(row["lat"]), float(row["lon"])
+            kind = _KINDS.get((row.get("kind") or "municipio").strip(), KIND_MUNICIPALITY)
+            names = [name] + [a for a in (row.get("aliases") or "").split("|") if a.strip()]
+            for n in names:
+                key = normalize_query(n).encode("utf-8")
+                # Si una clave se repite gana la primera (el nombre principal)
+                entries.setdefault(key, (label.encode("utf-8"), lat, lon, kind))
+
+    keys = sorted(entries)
+    strings = bytearray()
+    records = bytearray()
+    for key in keys:
+        label, lat, lon, kind = entries[key]
+        records += RECORD.pack(len(strings), len(key), len(label), lat, lon, kind)
+        strings += key + label
+
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_suffix(target.suffix + ".tmp")
+    with open(tmp, "wb") as out:
+        out.write(HEADER.pack(MAGIC, len(keys), HEADER.size + len(records)))
+        out.write(records)
+        out.write(strings)
+    os.replace(tmp, target)
+    return len(keys)
+
+
+# ---------------------------
+# Lectura
+# ---------------------------
+class _Keys:
+    """Vista perezosa de las claves para usar `bisect` sin materializarlas."""
+
+    def __init__(self, gz):
+        self._gz = gz
+
+    def __len__(self):
+        return self._gz.count
+
+    def __getitem__(self, i):
+        return self._gz._key(i)
+
+
+class Gazetteer:
+    def __init__(self, path):
+        self.path = Path(path)
+        self._fh = open(self.path, "rb")
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self._strings = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} no es un nomenclátor válido")
+        self._keys = _Keys(self)
+        self._coords = None          # (lat, lon) en radianes, para `nearest`
+
+    def close(self):
+        self._mm.close()
+        self._fh.close()
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, i):
+        return RECORD.unpack_from(self._mm, HEADER.size + i * RECORD.size)
+
+    def _key(self, i) -> bytes:
+        off, klen, _, _, _, _ = self._record(i)
+        start = self._strings + off
+        return self._mm[start:start + klen]
+
+    def _entry(self, i) -> dict:
+        off, klen, llen, lat, lon, kind = self._record(i)
+        start = self._strings + off + klen
+        return {
+            "address": self._mm[start:start + llen].decode("utf-8"),
+            "lat": round(lat, 5),
+            "lon": round(lon, 5),
+            "kind": kind,
+            "source": "gazetteer",
+        }
+
+    def exact(self, query: str):
+        """Entrada cuya clave coincide exactamente con la consulta normalizada."""
+        key = normalize_query(query).encode("utf-8")
+        if not key:
+            return None
+        i = bisect.bisect_left(self._keys, key)
+        if i < self.count and self._key(i) == key:
+            return self._entry(i)
+        return None
+
+    def lookup(self, query: str):
+        """
+        Topónimo escrito solo: coincidencia exacta ("tarragona") o municipio
+        seguido de su provincia y/o país ("Sils, Girona, España"). Una
+        dirección con calle no se resuelve aquí: el centroide del municipio
+        no es la dirección, y Google la encuentra con el texto tal cual.
+        """
+        hit = self.exact(query)
+        if hit:
+            return hit
+        parts = [p for p in (normalize_query(x) for x in str(query or "").split(",")) if p]
+        if len(parts) < 2:
+            return None
+        hit = self.exact(parts[0])
+        if hit is None:
+            return None
+        allowed = {normalize_query(x) for x in hit["address"].split(",")} | _COUNTRY_NAMES
+        return hit if all(p in allowed for p in parts[1:]) else None
+
+    def prefix(self, prefix: str, limit: int = 10):
+        """Entradas cuya clave empieza por `prefix`, en orden alfabético."""
+        p = normalize_query(prefix).encode("utf-8")
+        if not p:
+            return []
+        out = []
+        i = bisect.bisect_left(self._keys, p)
+        while i < self.count and len(out) < limit:
+            key = self._key(i)
+            if not key.startswith(p):
+                break
+            out.append((key.decode("utf-8"), self._entry(i)))
+            i += 1
+        return out
+
+    def _coord_arrays(self):
+        """Latitudes/longitudes de todos los registros leídas del mmap de una vez (NumPy)."""
+        if self._coords is None:
+            import numpy as np
+
+            dtype = np.dtype([
+                ("key_off", "<u4"), ("key_len", "<u2"), ("label_len", "<u2"),
+                ("lat", "<f4"), ("lon", "<f4"), ("kind", "u1"), ("pad", "V3"),
+            ])
+            recs = np.frombuffer(self._mm, dtype=dtype, count=self.count, offset=HEADER.size)
+            lat = np.radians(recs["lat"].astype(float))
+            lon = np.radians(recs["lon"].astype(float))
+            self._coords = (lat, lon, np.cos(lat), recs["kind"].copy())
+        return self._coords
+
+    def nearest(self, lat: float, lon: float, kind: int = None):
+        """
+        Entrada más cercana a (lat, lon), con `distance_km`, o None si el
+        nomenclátor está vacío. `kind` limita a municipios o calles.
+        """
+        import numpy as np
+
+        if not self.count:
+            return None
+        lats, lons, cos_lats, kinds = self._coord_arrays()
+        lat_r, lon_r = np.radians(lat), np.radians(lon)
+        a = (np.sin((lats - lat_r) / 2) ** 2
+             + np.cos(lat_r) * cos_lats * np.sin((lons - lon_r) / 2) ** 2)
+        if kind is not None:
+            a = np.where(kinds == kind, a, np.inf)
+        i = int(np.argmin(a))
+        if not np.isfinite(a[i]):
+            return None
+        entry = self._entry(i)
+        entry["distance_km"] = round(float(2 * 6371.0088 * np.arcsin(np.sqrt(min(a[i], 1.0)))), 3)
+        return entry
+
+    def items(self):
+        """Itera (clave, entrada) sobre todo el nomenclátor."""
+        for i in range(self.count):
+            yield self._key(i).decode("utf-8"), self._entry(i)
+
+
+_GAZETTEER = None
+_GAZETTEER_LOADED = False
+_GAZETTEER_LOCK = threading.Lock()
+
+
+def get_gazetteer():
+    """
+    Nomenclátor del proceso, o None si no hay datos. Si el binario falta o es
+    más antiguo que el CSV de origen, se recompila en ese momento.
+    """
+    global _GAZETTEER, _GAZETTEER_LOADED
+    if not _GAZETTEER_LOADED:
+        with _GAZETTEER_LOCK:
+            if not _GAZETTEER_LOADED:
+                try:
+                    stale = (
+                        GAZETTEER_SOURCE.exists() and (
+                            not GAZETTEER_PATH.exists()
+                            or GAZETTEER_PATH.stat().st_mtime < GAZETTEER_SOURCE.stat().st_mtime
+                        )
+                    )
+                    if stale:
+                        build_gazetteer(GAZETTEER_SOURCE, GAZETTEER_PATH)
+                    if GAZETTEER_PATH.exists():
+                        _GAZETTEER = Gazetteer(GAZETTEER_PATH)
+                except Exception:
+                    _GAZETTEER = None
+                _GAZETTEER_LOADED = True
+    return _GAZETTEER
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "build":
+        src = sys.argv[2] if len(sys.argv) > 2 else GAZETTEER_SOURCE
+        dst = sys.argv[3] if len(sys.argv) > 3 else GAZETTEER_PATH
+        print(f"{build_gazetteer(src, dst)} claves -> {dst}")
+    elif len(sys.argv) >= 3 and sys.argv[1] == "lookup":
+        gz = get_gazetteer()
+        print(gz.lookup(" ".join(sys.argv[2:])) if gz else "Sin nomenclátor")
+    elif len(sys.argv) >= 4 and sys.argv[1] == "nearest":
+        gz = get_gazetteer()
+        print(gz.nearest(float(sys.argv[2]), float(sys.argv[3])) if gz else "Sin nomenclátor")
+    else:
+        print(__doc__)
@@ -0,0 +1,258 @@
+# geocache.py
+"""
+Caché persistente (SQLite) para la geocodificación.
+
+Guarda el resultado de cada consulta normalizada junto a `.streamlit/`, con
+caducidad (TTL), expulsión LRU cuando se supera el tamaño máximo y entradas
+negativas para direcciones que Google no encontró.
+
+La geocodificación inversa usa otra tabla con la celda geohash como clave:
+dos posiciones a pocos metros (el mismo almacén cada mañana) comparten
+entrada.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+GEOCACHE_PATH = Path(os.getenv("GEOCACHE_PATH", ".streamlit/geocache.sqlite3"))
+GEOCACHE_TTL = int(os.getenv("GEOCACHE_TTL", str(90 * 24 * 3600)))        # 90 días
+GEOCACHE_NEG_TTL = int(os.getenv("GEOCACHE_NEG_TTL", str(24 * 3600)))     # 1 día
+GEOCACHE_MAX_ENTRIES = int(os.getenv("GEOCACHE_MAX_ENTRIES", "50000"))
+# Un acierto solo actualiza `accessed_at` (LRU) si la marca tiene más de esto (s)
+GEOCACHE_TOUCH_INTERVAL = float(os.getenv("GEOCACHE_TOUCH_INTERVAL", "3600"))
+
+# Celda de la caché inversa: 7 caracteres ≈ 153 m × 153 m
+REVERSE_GEOHASH_PRECISION = int(os.getenv("REVERSE_GEOHASH_PRECISION", "7"))
+
+# Marca para distinguir "no está en caché" de "está en caché como no encontrado"
+MISS = object()
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Clave de caché: minúsculas, sin acentos y con espacios colapsados."""
+    s = unicodedata.normalize("NFKD", str(query or ""))
+    s = "".join(c for c in s if not unicodedata.combining(c))
+    s = s.lower().replace(",", " ")
+    return _SPACES.sub(" ", s).strip()
+
+
+def geohash(lat: float, lon: float, precision: int = REVERSE_GEOHASH_PRECISION) -> str:
+    """Celda geohash de (lat, lon) con `precision` caracteres."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    out = []
+    bits = ch = 0
+    even = True
+    while len(out) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                ch = (ch << 1) | 1
+                lon_lo = mid
+            else:
+                ch <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_GEOHASH_ALPHABET[ch])
+            bits = ch = 0
+    return "".join(out)
+
+
+class GeocodeCache:
+    """
+    Caché clave -> resultado de geocodificación (dict o None si no existe).
+
+    Es segura entre hilos (una conexión protegida por lock) y entre procesos
+    (SQLite en modo WAL). Los contadores hits/misses son del proceso actual.
+    """
+
+    def __init__(self, path=GEOCACHE_PATH, ttl=GEOCACHE_TTL,
+                 negative_ttl=GEOCACHE_NEG_TTL, max_entries=GEOCACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS geocode (
+                key         TEXT PRIMARY KEY,
+                payload     TEXT,          -- JSON del resultado; NULL = no encontrado
+                created_at  REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS geocode_accessed ON geocode(accessed_at)"
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS reverse (
+                cell        TEXT PRIMARY KEY,   -- geohash
+                payload     TEXT,               -- JSON; NULL = sin resultado
+                created_at  REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS reverse_accessed ON reverse(accessed_at)"
+        )
+        self._conn.commit()
+
+    # ---------------------------
+    # Lectura / escritura
+    # ---------------------------
+    def _get_locked(self, table: str, column: str, key: str, now: float):
+        row = self._conn.execute(
+            f"SELECT payload, created_at, accessed_at FROM {table} WHERE {column} = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return MISS
+        payload, created_at, accessed_at = row
+        ttl = self.ttl if payload is not None else self.negative_ttl
+        if now - created_at > ttl:
+            self._conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (key,))
+            self._conn.commit()
+            self.misses += 1
+            return MISS
+        # La marca LRU solo se reescribe si está desfasada: un acierto normal
+        # es una lectura pura, sin escritura ni commit
+        if now - accessed_at > GEOCACHE_TOUCH_INTERVAL:
+            self._conn.execute(
+                f"UPDATE {table} SET accessed_at = ? WHERE {column} = ?", (now, key)
+            )
+            self._conn.commit()
+        self.hits += 1
+        if payload is None:
+            self.negative_hits += 1
+            return None
+        return json.loads(payload)
+
+    def get(self, query: str):
+        """Devuelve el resultado cacheado (dict o None) o `MISS` si no hay entrada válida."""
+        key = normalize_query(query)
+        if not key:
+            return MISS
+        with self._lock:
+            return self._get_locked("geocode", "key", key, time.time())
+
+    def put(self, query: str, result):
+        """Guarda un resultado (dict) o una entrada negativa (None)."""
+        key = normalize_query(query)
+        if not key:
+            return
+        now = time.time()
+        payload = None if result is None else json.dumps(result, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode (key, payload, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, payload, now, now),
+            )
+            self._writes += 1
+            # La expulsión LRU se comprueba cada cierto número de escrituras
+            if self._writes % 100 == 0:
+                self._evict_locked()
+            self._conn.commit()
+
+    def get_reverse(self, cell: str):
+        """Resultado inverso cacheado de la celda (dict o None) o `MISS`."""
+        with self._lock:
+            return self._get_locked("reverse", "cell", cell, time.time())
+
+    def put_reverse(self, cell: str, result):
+        now = time.time()
+        payload = None if result is None else json.dumps(result, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO reverse (cell, payload, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (cell, payload, now, now),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self):
+        for table, key in (("geocode", "key"), ("reverse", "cell")):
+            (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+            excess = count - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    f"DELETE FROM {table} WHERE {key} IN ("
+                    f"SELECT {key} FROM {table} ORDER BY accessed_at ASC LIMIT ?)",
+                    (excess,),
+                )
+
+    def evict(self):
+        """Fuerza la expulsión LRU hasta `max_entries`."""
+        with self._lock:
+            self._evict_locked()
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM geocode")
+            self._conn.execute("DELETE FROM reverse")
+            self._conn.commit()
+
+    # ---------------------------
+    # Estadísticas
+    # ---------------------------
+    def stats(self) -> dict:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM geocode").fetchone()
+            (reverse,) = self._conn.execute("SELECT COUNT(*) FROM reverse").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": count,
+            "reverse_entries": reverse,
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_geocache() -> GeocodeCache:
+    """Instancia única por proceso (compartida por todas las sesiones)."""
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = GeocodeCache()
+    return _CACHE
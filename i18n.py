@@ -77,6 +77,7 @@ TEXTS = {
         "type_or_select": "Escribe o selecciona una dirección antes de añadir.",
         "loc_added": "📍 Añadido por ubicación (aprox.): {x}",
         "loc_failed": "No se pudo obtener tu ubicación. Inténtalo de nuevo o escribe manualmente.",
+        "loc_exists": "Esa ubicación ya está en la lista: {x}",
     },
     "en": {
         # App
@@ -152,6 +153,7 @@ TEXTS = {
         "type_or_select": "Type or pick an address before adding.",
         "loc_added": "📍 Added by location (approx.): {x}",
         "loc_failed": "Could not get your location. Try again or type manually.",
+        "loc_exists": "That location is already in the list: {x}",
     }
 }
 
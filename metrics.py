@@ -0,0 +1,277 @@
+# metrics.py
+"""
+Instrumentación del camino caliente: tiempos por tramo y contadores.
+
+    with metrics.span("geocode_address"):
+        ...
+
+    @metrics.timed("build_gmaps_url")
+    def build_gmaps_url(...): ...
+
+    metrics.inc("gmaps_api_calls_total", api="geocode", user=metrics.current_user())
+
+Todo se agrega en memoria, por proceso y sin dependencias, y se exporta en
+formato de texto de Prometheus (`render_prometheus`). El usuario de la sesión
+viaja en una contextvar (`set_user`) para poder contar las llamadas
+facturables a Google por usuario; `bind` la propaga a los hilos del pool.
+
+Con METRICS_PORT definido, `start_http_server()` sirve /metrics desde el
+propio proceso de Streamlit, en METRICS_HOST (127.0.0.1 por defecto: no
+lleva autenticación y las etiquetas incluyen nombres de usuario).
+"""
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_PORT = os.getenv("METRICS_PORT")
+# Sin autenticación y con nombres de usuario: solo local salvo que se indique
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Límites (segundos) de los cubos del histograma de tiempos
+BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_USER = contextvars.ContextVar("metrics_user", default=None)
+_USER_RESOLVER = None
+_LOCK = threading.Lock()
+_SPANS = {}          # nombre -> [cubos..., +Inf, suma, cuenta]
+_COUNTERS = {}       # (nombre, etiquetas ordenadas) -> valor
+_GAUGES = {}         # nombre -> (función, ayuda)
+
+
+# ---------------------------
+# Usuario actual
+# ---------------------------
+def set_user(username):
+    """Fija el usuario de las métricas en el contexto actual (rerun, petición)."""
+    _USER.set(username or "-")
+
+
+def set_user_resolver(fn):
+    """`fn()` da el usuario cuando el contexto no lo fija (p. ej. la sesión de Streamlit)."""
+    global _USER_RESOLVER
+    _USER_RESOLVER = fn
+
+
+def current_user() -> str:
+    user = _USER.get()
+    if user is None and _USER_RESOLVER is not None:
+        try:
+            user = _USER_RESOLVER()
+        except Exception:
+            user = None
+    return user or "-"
+
+
+def bind(fn):
+    """Envuelve `fn` para que corra (p. ej. en otro hilo) con el usuario actual."""
+    user = current_user()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        _USER.set(user)
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+# ---------------------------
+# Tiempos
+# ---------------------------
+def observe(name: str, seconds: float):
+    with _LOCK:
+        hist = _SPANS.get(name)
+        if hist is None:
+            hist = _SPANS[name] = [0] * (len(BUCKETS) + 1) + [0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+                break
+        else:
+            hist[len(BUCKETS)] += 1
+        hist[-2] += seconds
+        hist[-1] += 1
+
+
+@contextmanager
+def span(name: str):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t)
+
+
+def timed(name: str = None):
+    """Decorador: registra cada llamada como un tramo `name` (por defecto, el de la función)."""
+    def deco(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(label, time.perf_counter() - t)
+        return wrapper
+    return deco
+
+
+# ---------------------------
+# Contadores y medidores
+# ---------------------------
+def inc(name: str, value: float = 1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0) + value
+
+
+def register_gauge(name: str, fn, help_text: str = ""):
+    """`fn()` devuelve un número o {etiqueta: número}; se evalúa al exportar."""
+    _GAUGES[name] = (fn, help_text)
+
+
+def snapshot() -> dict:
+    """Copia de los datos agregados (para el panel de administración)."""
+    with _LOCK:
+        spans = {
+            name: {
+                "count": h[-1],
+                "total_s": h[-2],
+                "avg_ms": (h[-2] / h[-1] * 1000.0) if h[-1] else 0.0,
+                "p95_ms": _quantile(h, 0.95) * 1000.0,
+            }
+            for name, h in _SPANS.items()
+        }
+        counters = {}
+        for (name, labels), value in _COUNTERS.items():
+            counters.setdefault(name, {})[",".join(f"{k}={v}" for k, v in labels)] = value
+    return {"spans": spans, "counters": counters, "gauges": _eval_gauges()}
+
+
+def _quantile(hist, q: float) -> float:
+    """Cota superior del cubo que contiene el cuantil `q` (aproximado)."""
+    total = hist[-1]
+    if not total:
+        return 0.0
+    target = q * total
+    seen = 0
+    for i, bound in enumerate(BUCKETS):
+        seen += hist[i]
+        if seen >= target:
+            return bound
+    return float("inf")
+
+
+def _eval_gauges() -> dict:
+    out = {}
+    for name, (fn, _) in list(_GAUGES.items()):
+        try:
+            out[name] = fn()
+        except Exception:
+            continue
+    return out
+
+
+def reset():
+    with _LOCK:
+        _SPANS.clear()
+        _COUNTERS.clear()
+
+
+# ---------------------------
+# Exportación Prometheus
+# ---------------------------
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render_prometheus() -> str:
+    lines = []
+    with _LOCK:
+        spans = {name: list(h) for name, h in _SPANS.items()}
+        counters = dict(_COUNTERS)
+
+    if spans:
+        lines.append("# HELP app_span_seconds Duración de los tramos instrumentados")
+        lines.append("# TYPE app_span_seconds histogram")
+        for name in sorted(spans):
+            h = spans[name]
+            cumulative = 0
+            for i, bound in enumerate(BUCKETS):
+                cumulative += h[i]
+                lines.append(f"app_span_seconds_bucket{_labels([('span', name), ('le', bound)])} {cumulative}")
+            lines.append(f"app_span_seconds_bucket{_labels([('span', name), ('le', '+Inf')])} {h[-1]}")
+            lines.append(f"app_span_seconds_sum{_labels([('span', name)])} {h[-2]:.6f}")
+            lines.append(f"app_span_seconds_count{_labels([('span', name)])} {h[-1]}")
+
+    by_name = {}
+    for (name, labels), value in counters.items():
+        by_name.setdefault(name, []).append((labels, value))
+    for name in sorted(by_name):
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in sorted(by_name[name]):
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+    for name, value in sorted(_eval_gauges().items()):
+        help_text = _GAUGES.get(name, (None, ""))[1]
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        if isinstance(value, dict):
+            for label, v in sorted(value.items()):
+                lines.append(f"{name}{_labels([('kind', label)])} {v}")
+        else:
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------
+# Servidor /metrics opcional
+# ---------------------------
+_SERVER = None
+_SERVER_LOCK = threading.Lock()
+
+
+def start_http_server(port=None, host: str = None):
+    """Sirve /metrics en un hilo (una sola vez por proceso). Sin puerto no hace nada."""
+    global _SERVER
+    port = port or METRICS_PORT
+    host = host or METRICS_HOST
+    if not port or _SERVER is not None:
+        return _SERVER
+    with _SERVER_LOCK:
+        if _SERVER is not None:
+            return _SERVER
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class _Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        try:
+            server = ThreadingHTTPServer((host, int(port)), _Handler)
+        except OSError:
+            return None          # puerto ocupado (p. ej. otro worker ya lo sirve)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        _SERVER = server
+    return _SERVER
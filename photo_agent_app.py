@@ -1,12 +1,13 @@
 # photo_agent_app.py - Código Final Funcional
+import coldstart
 import streamlit as st
-import yaml
-from yaml.loader import SafeLoader
 from pathlib import Path
-from PIL import Image
-import hashlib
 import os
-from dotenv import load_dotenv
+
+import metrics
+from credentials import get_credential_store
+
+coldstart.mark("imports")
 
 # --- Ocultar avisos del sistema Streamlit (líneas amarillas) ---
 st.markdown(
@@ -27,61 +28,75 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
-CONFIG_FILE = Path('config.yaml')
+# Credenciales compartidas por todas las sesiones del proceso
+CREDENTIALS = get_credential_store()
+
+CONFIG_FILE = CREDENTIALS.path
 
+@metrics.timed()
 def load_config():
-    """Carga configuraciones de YAML. Inicializa cookies si el archivo no existe."""
-    try:
-        with open(CONFIG_FILE) as file:
-            return yaml.load(file, Loader=SafeLoader)
-    except FileNotFoundError:
-        # CORRECCIÓN: Devolvemos un diccionario de configuración completo con cookies iniciales.
-        return {
-            'credentials': {'usernames': {}}, 
-            'cookie': {
-                'expiry_days': 30,
-                'key': hashlib.sha256(os.urandom(32)).hexdigest(), # Clave única de seguridad
-                'name': 'auth_cookie'
-            }
-        }
+    """Configuración actual (en memoria; se relee solo si config.yaml cambió)."""
+    return CREDENTIALS.config()
 
 def save_config(config):
-    """Guarda configuraciones en YAML."""
-    with open(CONFIG_FILE, 'w') as file:
-        yaml.dump(config, file, default_flow_style=False)
-
-def hash_password(password):
-    """Función simple para hashear la contraseña (usando SHA256)."""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Guarda configuraciones en YAML (escritura atómica)."""
+    CREDENTIALS.save(config)
 
-def check_password(username, password_unhashed, config):
+def check_password(username, password_unhashed, config=None):
     """Verifica si la contraseña coincide."""
-    user_data = config['credentials']['usernames'].get(username)
-    if not user_data:
-        return False
-    
-    # Comparamos el hash almacenado con el hash de la contraseña introducida
-    stored_hash = user_data['password_hash']
-    input_hash = hash_password(password_unhashed)
-    
-    return stored_hash == input_hash
+    return CREDENTIALS.check_password(username, password_unhashed)
+
+# Métricas: usuario de la sesión para contar llamadas a Google y /metrics
+# opcional (METRICS_PORT). ADMIN_USERS: usuarios que ven el panel.
+metrics.set_user_resolver(lambda: st.session_state.get("username"))
+metrics.start_http_server()
+ADMIN_USERS = {u.strip() for u in os.getenv("ADMIN_USERS", "").split(",") if u.strip()}
+
+
+def _metrics_panel():
+    """Panel de métricas del proceso (solo administradores)."""
+    snap = metrics.snapshot()
+    with st.sidebar.expander("📊 Métricas"):
+        if snap["spans"]:
+            st.caption("Tiempos (ms)")
+            st.dataframe(
+                [
+                    {"tramo": name, "n": v["count"], "media": round(v["avg_ms"], 2),
+                     "p95 ≤": v["p95_ms"]}
+                    for name, v in sorted(snap["spans"].items())
+                ],
+                hide_index=True,
+            )
+        for name, values in sorted(snap["counters"].items()):
+            st.caption(name)
+            st.dataframe(
+                [{"etiquetas": k or "-", "valor": v} for k, v in sorted(values.items())],
+                hide_index=True,
+            )
+        for name, value in sorted(snap["gauges"].items()):
+            st.caption(name)
+            st.json(value, expanded=False)
+
 
 def clear_route_state():
     """Función que borra las variables de ruta al cerrar sesión."""
-    for key in ["prof_points", "saved_routes", "route_name_input", "saved_choice", "_current_routes_user"]:
+    for key in ["prof_points", "saved_routes", "saved_versions", "route_name_input", "saved_choice", "_current_routes_user"]:
         if key in st.session_state:
             del st.session_state[key]
 
 
-# Cargar variables de entorno para Geocodificación (solo para el warning)
-load_dotenv()
-if not os.getenv("GOOGLE_API_KEY"):
-    st.sidebar.warning("⚠️ Clave API de Google no configurada. La Geocodificación será SIMULADA.")
-# Fin de chequeo de API
+@st.cache_resource
+def _load_logo():
+    """Bytes del logo (una sola lectura de disco por proceso) o None si no existe."""
+    try:
+        return Path("logo.png").read_bytes()
+    except FileNotFoundError:
+        return None
 
 
 # Cargar configuraciones
 config = load_config()
+coldstart.mark("config")
 
 # Inicialización de estado de Autenticación
 st.session_state.setdefault('logged_in', False)
@@ -106,6 +121,16 @@ def _import_ui():
 
 
 mostrar_profesional = _import_ui()
+coldstart.mark("ui")
+
+# Chequeo de la API para el aviso (app_utils_core ya cargó el .env)
+if not os.getenv("GOOGLE_API_KEY"):
+    st.sidebar.warning("⚠️ Clave API de Google no configurada. La Geocodificación será SIMULADA.")
+# Fin de chequeo de API
+
+if coldstart.STARTUP_REPORT:
+    with st.sidebar.expander("⏱️ Arranque"):
+        st.code(coldstart.format_report())
 
 
 def main():
@@ -115,6 +140,8 @@ def main():
         # ------------------- PÁGINA PRINCIPAL (LOGEADO) -------------------
         st.sidebar.markdown("---")
         st.sidebar.subheader(f"Bienvenido, {st.session_state['name']}!") 
+        if st.session_state['username'] in ADMIN_USERS:
+            _metrics_panel()
         
         # Botón de Logout MANUAL
         if st.sidebar.button('Logout', use_container_width=True):
@@ -150,12 +177,12 @@ def main():
         col_spacer1, col_content, col_spacer2 = st.columns([1, 4, 1])
 
         with col_content:
-            try:
-                # Intenta cargar el logo
-                logo = Image.open("logo.png")
-                st.image(logo, width=150) 
-            except FileNotFoundError:
-                st.write("🗺️") 
+            # Logo cacheado por proceso (sin PIL ni lectura de disco en cada rerun)
+            logo = _load_logo()
+            if logo:
+                st.image(logo, width=150)
+            else:
+                st.write("🗺️")
                 
             st.markdown("<h1 style='text-align: center; margin-top: -15px;'>Planificador de Rutas</h1>", unsafe_allow_html=True)
             st.markdown("---")
@@ -174,22 +201,11 @@ def main():
 
                     if submitted:
                         # CHEQUEO DE INTEGRIDAD FINAL
-                        usernames = config['credentials']['usernames']
-                        
                         if not all([new_username, new_email, new_name, new_password]):
                             st.error("Rellena todos los campos.")
-                        elif new_username in usernames:
+                        elif not CREDENTIALS.register(new_username, new_email, new_name, new_password):
                             st.error("El nombre de usuario ya existe.")
                         else:
-                            # Guardar nuevo usuario
-                            config['credentials']['usernames'][new_username] = {
-                                'email': new_email,
-                                'name': new_name,
-                                'password_hash': hash_password(new_password)
-                            }
-                            # No necesitamos añadir la cookie aquí, ya que load_config la inicializa
-                                
-                            save_config(config)
                             st.success('¡Registro exitoso! Ya puedes iniciar sesión.')
                             st.session_state['show_register'] = False
                             st.rerun()
@@ -209,8 +225,8 @@ def main():
                     submitted = st.form_submit_button("Login")
 
                     if submitted:
-                        if check_password(login_username, login_password, config):
-                            user_data = config['credentials']['usernames'][login_username]
+                        if CREDENTIALS.check_password(login_username, login_password):
+                            user_data = CREDENTIALS.get_user(login_username)
                             st.session_state['logged_in'] = True
                             st.session_state['username'] = login_username
                             st.session_state['name'] = user_data['name']
@@ -226,3 +242,4 @@ def main():
 
 if __name__ == "__main__":
     main()
+    coldstart.mark("primer render")
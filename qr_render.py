@@ -0,0 +1,179 @@
+# qr_render.py
+"""
+Generación de códigos QR con caché por contenido.
+
+La matriz QR se calcula una vez por URL (clave: hash SHA-256) y se guarda en
+una LRU acotada compartida por todas las sesiones del proceso. La salida es
+un PNG de 1 bit por píxel (escrito directamente con zlib, sin PIL) o un SVG,
+mucho más ligeros que el PNG a color que se enviaba antes al navegador.
+"""
+import hashlib
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+import metrics
+
+QR_CACHE_MAX_ENTRIES = int(os.getenv("QR_CACHE_MAX_ENTRIES", "512"))
+# Ancho objetivo en píxeles (el doble de lo que se muestra, para pantallas HiDPI)
+QR_TARGET_PX = 440
+QR_BORDER = 2
+# A partir de esta longitud bajamos la corrección de errores a L para que la
+# versión (densidad) del QR no se dispare y siga leyéndose bien en el móvil.
+LONG_URL_CHARS = 300
+# Capacidad de un QR versión 40-L en modo byte: un texto más largo no cabe
+QR_MAX_BYTES = 2953
+
+
+def qr_matrix(data: str):
+    """Matriz de módulos (lista de filas de bool) incluyendo el borde."""
+    # qrcode se importa en el primer QR, no al arrancar la app
+    import qrcode
+    from qrcode.constants import ERROR_CORRECT_L, ERROR_CORRECT_M
+
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=ERROR_CORRECT_L if len(data) > LONG_URL_CHARS else ERROR_CORRECT_M,
+        box_size=1,
+        border=QR_BORDER,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+# ---------------------------
+# Codificadores
+# ---------------------------
+def _png_chunk(tag: bytes, payload: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(payload)) + tag + payload
+        + struct.pack(">I", zlib.crc32(tag + payload) & 0xFFFFFFFF)
+    )
+
+
+def matrix_to_png(matrix, box_size: int) -> bytes:
+    """PNG en escala de grises de 1 bit (0 = negro, 1 = blanco)."""
+    modules = len(matrix)
+    size = modules * box_size
+    raw = bytearray()
+    for row in matrix:
+        bits = 0
+        nbits = 0
+        line = bytearray([0])           # filtro "None"
+        for dark in row:
+            for _ in range(box_size):
+                bits = (bits << 1) | (0 if dark else 1)
+                nbits += 1
+                if nbits == 8:
+                    line.append(bits)
+                    bits = nbits = 0
+        if nbits:
+            line.append(bits << (8 - nbits))
+        raw += bytes(line) * box_size
+    header = struct.pack(">IIBBBBB", size, size, 1, 0, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(bytes(raw), 9))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def matrix_to_svg(matrix) -> str:
+    """SVG escalable: un único <path> con un rectángulo por tramo negro de cada fila."""
+    modules = len(matrix)
+    parts = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < modules:
+            if row[x]:
+                start = x
+                while x < modules and row[x]:
+                    x += 1
+                parts.append(f"M{start},{y}h{x - start}v1h-{x - start}z")
+            else:
+                x += 1
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {modules} {modules}" '
+        f'shape-rendering="crispEdges"><rect width="100%" height="100%" fill="#fff"/>'
+        f'<path fill="#000" d="{"".join(parts)}"/></svg>'
+    )
+
+
+# ---------------------------
+# Caché LRU compartida
+# ---------------------------
+class _LRU:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+_CACHE = _LRU(QR_CACHE_MAX_ENTRIES)
+
+
+def _key(data: str, fmt: str) -> str:
+    return hashlib.sha256(f"{fmt}\0{data}".encode("utf-8")).hexdigest()
+
+
+def qr_png(data: str, target_px: int = QR_TARGET_PX) -> bytes:
+    """PNG de 1 bit con el QR de `data` (memoizado por contenido)."""
+    key = _key(data, f"png{target_px}")
+    png = _CACHE.get(key)
+    if png is None:
+        metrics.inc("qr_encoded_total", format="png")
+        matrix = qr_matrix(data)
+        png = matrix_to_png(matrix, max(2, target_px // len(matrix)))
+        _CACHE.put(key, png)
+    return png
+
+
+def qr_svg(data: str) -> str:
+    """SVG con el QR de `data` (memoizado por contenido)."""
+    key = _key(data, "svg")
+    svg = _CACHE.get(key)
+    if svg is None:
+        metrics.inc("qr_encoded_total", format="svg")
+        svg = matrix_to_svg(qr_matrix(data))
+        _CACHE.put(key, svg)
+    return svg
+
+
+def qr_cache_stats() -> dict:
+    return _CACHE.stats()
+
+
+metrics.register_gauge("app_qr_cache", qr_cache_stats, "Caché de QR (entradas, aciertos, ratio)")
@@ -0,0 +1,288 @@
+# resilience.py
+"""
+Protección de las llamadas a Google Maps, compartida por todas las sesiones
+del proceso:
+
+- Limitador de cubo de fichas (GMAPS_QPS / GMAPS_BURST): una ráfaga de
+  usuarios no supera la cuota por segundo; si no hay ficha antes del plazo
+  de la llamada, se falla enseguida al nivel de caché / nomenclátor. Los
+  trabajos de fondo usan otro cubo (BACKGROUND_LIMITER).
+- Reintentos acotados con espera exponencial y jitter completo, solo para
+  errores transitorios (timeouts, 5xx, OVER_QUERY_LIMIT).
+- Cortacircuitos: tras GMAPS_BREAKER_FAILURES fallos seguidos deja de llamar
+  a Google durante GMAPS_BREAKER_RESET segundos y después deja pasar una
+  sola llamada de prueba.
+- Plazo por llamada (GMAPS_DEADLINE): ningún punto espera más que eso,
+  sumando colas, intentos y esperas.
+
+    result = google_call("geocode", client.geocode, "Girona")
+
+El cliente de googlemaps se crea con `make_client`, sin reintentos internos,
+para que toda la política viva aquí.
+"""
+import contextvars
+import os
+import random
+import threading
+import time
+
+import metrics
+
+GMAPS_QPS = float(os.getenv("GMAPS_QPS", "25"))
+GMAPS_BURST = float(os.getenv("GMAPS_BURST", str(GMAPS_QPS)))
+# Cuota aparte para trabajos de fondo (relleno de rutas guardadas): no gastan
+# fichas de los usuarios. GMAPS_QPS + GMAPS_BACKGROUND_QPS <= cuota de Google.
+GMAPS_BACKGROUND_QPS = float(os.getenv("GMAPS_BACKGROUND_QPS", "2"))
+GMAPS_CALL_TIMEOUT = float(os.getenv("GMAPS_CALL_TIMEOUT", "3"))     # por intento (s)
+GMAPS_DEADLINE = float(os.getenv("GMAPS_DEADLINE", "6"))             # por llamada (s)
+GMAPS_RETRIES = int(os.getenv("GMAPS_RETRIES", "2"))
+GMAPS_BACKOFF_BASE = float(os.getenv("GMAPS_BACKOFF_BASE", "0.2"))
+GMAPS_BACKOFF_MAX = float(os.getenv("GMAPS_BACKOFF_MAX", "2"))
+GMAPS_BREAKER_FAILURES = int(os.getenv("GMAPS_BREAKER_FAILURES", "5"))
+GMAPS_BREAKER_RESET = float(os.getenv("GMAPS_BREAKER_RESET", "30"))
+
+
+class GoogleUnavailableError(Exception):
+    """No se llamó (o no se pudo completar) la llamada a Google: usar el nivel offline."""
+
+
+class CircuitOpenError(GoogleUnavailableError):
+    pass
+
+
+class RateLimitedError(GoogleUnavailableError):
+    pass
+
+
+class DeadlineExceededError(GoogleUnavailableError):
+    pass
+
+
+def google_errors() -> tuple:
+    """
+    Excepciones esperables de `google_call`: Google no disponible o petición
+    rechazada (p. ej. INVALID_REQUEST). Se usa en `except google_errors():`,
+    que solo se evalúa (e importa googlemaps) cuando hay una excepción.
+    """
+    try:
+        from googlemaps import exceptions as gexc
+    except ImportError:
+        return (GoogleUnavailableError,)
+    return (GoogleUnavailableError, gexc.ApiError, gexc.HTTPError, gexc.Timeout, gexc.TransportError)
+
+
+# Timeout del intento en curso (s): GMAPS_CALL_TIMEOUT recortado a lo que
+# queda del plazo de la llamada. Lo lee el cliente de `make_client`.
+_ATTEMPT_TIMEOUT = contextvars.ContextVar("gmaps_attempt_timeout", default=None)
+
+
+# ---------------------------
+# Cubo de fichas
+# ---------------------------
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = max(rate, 0.001)
+        self.capacity = max(burst, 1.0)
+        self._tokens = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def acquire(self, timeout: float = 0.0) -> bool:
+        """Toma una ficha esperando como mucho `timeout` segundos."""
+        end = time.monotonic() + max(timeout, 0.0)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return True
+                wait = (1.0 - self._tokens) / self.rate
+            if now + wait > end:
+                return False
+            time.sleep(wait)
+
+
+# ---------------------------
+# Cortacircuitos
+# ---------------------------
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    metrics.inc("gmaps_circuit_opened_total")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def release_probe(self):
+        """La llamada de prueba no llegó a hacerse: deja pasar otra."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+LIMITER = TokenBucket(GMAPS_QPS, GMAPS_BURST)
+BACKGROUND_LIMITER = TokenBucket(GMAPS_BACKGROUND_QPS, GMAPS_BACKGROUND_QPS)
+BREAKER = CircuitBreaker(GMAPS_BREAKER_FAILURES, GMAPS_BREAKER_RESET)
+
+metrics.register_gauge(
+    "app_gmaps_circuit_open",
+    lambda: 1 if BREAKER.state == CircuitBreaker.OPEN else 0,
+    "1 si el cortacircuitos de Google Maps está abierto",
+)
+
+
+def make_client(key: str, base_url: str = None):
+    """
+    googlemaps.Client sin reintentos ni limitador propios y con timeout por
+    intento (GMAPS_CALL_TIMEOUT recortado a lo que queda del plazo): toda la
+    política vive en `google_call`.
+    """
+    import googlemaps
+    from googlemaps import exceptions as gexc
+
+    class _SingleAttemptClient(googlemaps.Client):
+        def _request(self, url, params, first_request_time=None, retry_counter=0, *args, **kwargs):
+            # La librería reintenta llamándose a sí misma (5xx, cuota) con
+            # esperas de hasta 60 s: lo cortamos como error transitorio.
+            if retry_counter > 0:
+                raise gexc.TransportError("reintento interno desactivado")
+            timeout = _ATTEMPT_TIMEOUT.get()
+            if timeout is not None:
+                kwargs["requests_kwargs"] = dict(kwargs.get("requests_kwargs") or {}, timeout=timeout)
+            return super()._request(url, params, first_request_time, retry_counter, *args, **kwargs)
+
+    kwargs = {"base_url": base_url} if base_url else {}
+    return _SingleAttemptClient(
+        key=key,
+        timeout=GMAPS_CALL_TIMEOUT,
+        retry_over_query_limit=False,
+        queries_per_second=1000,
+        queries_per_minute=60000,
+        **kwargs,
+    )
+
+
+# ---------------------------
+# Clasificación de errores
+# ---------------------------
+_BREAKER_API_STATUSES = {"REQUEST_DENIED", "OVER_DAILY_LIMIT"}
+_TRANSIENT_API_STATUSES = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+
+
+def _classify(exc):
+    """(transitorio, cuenta para el cortacircuitos)."""
+    try:
+        from googlemaps import exceptions as gexc
+    except ImportError:
+        gexc = None
+    if gexc is not None:
+        if isinstance(exc, gexc.HTTPError):
+            transient = exc.status_code >= 500
+            return transient, transient
+        if isinstance(exc, (gexc.Timeout, gexc.TransportError)):
+            return True, True
+        if isinstance(exc, gexc.ApiError):
+            if exc.status in _TRANSIENT_API_STATUSES:
+                return True, True
+            return False, exc.status in _BREAKER_API_STATUSES
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True, True
+    return False, False
+
+
+# ---------------------------
+# Llamada protegida
+# ---------------------------
+def google_call(api: str, fn, *args, deadline: float = None, limiter=None, breaker=None,
+                retries: int = None, **kwargs):
+    """
+    Ejecuta `fn(*args, **kwargs)` con limitador, reintentos, cortacircuitos y
+    plazo. Lanza `GoogleUnavailableError` si no se llamó o se agotó el plazo;
+    los errores no transitorios (p. ej. INVALID_REQUEST) se propagan tal cual.
+    """
+    limiter = limiter or LIMITER
+    breaker = breaker or BREAKER
+    retries = GMAPS_RETRIES if retries is None else retries
+    end = time.monotonic() + (GMAPS_DEADLINE if deadline is None else deadline)
+
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            metrics.inc("gmaps_short_circuited_total", api=api)
+            raise CircuitOpenError(api)
+        if not limiter.acquire(timeout=end - time.monotonic()):
+            metrics.inc("gmaps_rate_limited_total", api=api)
+            breaker.release_probe()
+            raise RateLimitedError(api)
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            breaker.release_probe()
+            raise DeadlineExceededError(api)
+        metrics.inc("gmaps_api_calls_total", api=api, user=metrics.current_user())
+        # Ningún intento puede pasarse del plazo de la llamada
+        token = _ATTEMPT_TIMEOUT.set(min(GMAPS_CALL_TIMEOUT, remaining))
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as exc:
+            transient, counts = _classify(exc)
+            metrics.inc("gmaps_api_errors_total", api=api, kind=type(exc).__name__)
+            if counts:
+                breaker.record_failure()
+            else:
+                breaker.record_success()       # Google respondió (p. ej. INVALID_REQUEST)
+            if not transient:
+                raise
+            attempt += 1
+            if attempt > retries:
+                raise GoogleUnavailableError(f"{api}: {type(exc).__name__}") from exc
+            # Espera exponencial con jitter completo, sin pasarse del plazo
+            delay = random.uniform(0, min(GMAPS_BACKOFF_MAX, GMAPS_BACKOFF_BASE * 2 ** attempt))
+            if time.monotonic() + delay >= end:
+                raise DeadlineExceededError(api) from exc
+            metrics.inc("gmaps_retries_total", api=api)
+            time.sleep(delay)
+            continue
+        finally:
+            _ATTEMPT_TIMEOUT.reset(token)
+        breaker.record_success()
+        return result
@@ -0,0 +1,194 @@
+# route_export.py
+"""
+Exportación de rutas guardadas a formatos estándar: GPX, KML y GeoJSON.
+
+Las coordenadas salen de la geometría guardada con cada ruta y, si falta,
+de la caché de geocodificación (nunca se llama a Google al exportar). Las
+paradas que no se pueden situar se omiten: no se exporta el centro del
+municipio como si fuera la parada.
+
+La salida se genera por trozos (una ruta cada vez, leyendo el almacén por
+páginas), así que exportar una biblioteca de miles de rutas no la carga
+entera en memoria:
+
+    for chunk in iter_export("ana", "gpx"):               # toda la biblioteca
+        fh.write(chunk)
+    export_routes("ana", "kml", fh, names=["lunes"])      # una ruta
+
+En línea de comandos:
+    python route_export.py <usuario> gpx|kml|geojson salida.gpx [--route lunes ...]
+"""
+import json
+import re
+import sys
+from xml.sax.saxutils import escape
+
+from geocache import MISS, get_geocache
+from route_store import get_route_store
+
+# formato -> (tipo MIME, extensión)
+EXPORT_FORMATS = {
+    "gpx": ("application/gpx+xml", "gpx"),
+    "kml": ("application/vnd.google-earth.kml+xml", "kml"),
+    "geojson": ("application/geo+json", "geojson"),
+}
+
+_COORDS = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")
+
+
+# ---------------------------
+# Coordenadas de cada parada
+# ---------------------------
+def _parse_coords(text):
+    m = _COORDS.match(text or "")
+    if not m:
+        return None
+    lat, lon = float(m.group(1)), float(m.group(2))
+    if -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0:
+        return lat, lon
+    return None
+
+
+def _locate(label: str, meta):
+    """(lat, lon, dirección) de una parada sin usar la red, o None."""
+    if isinstance(meta, dict):
+        coords = _parse_coords(meta.get("coords"))
+        if coords:
+            return coords[0], coords[1], meta.get("address") or label
+    coords = _parse_coords(label)
+    if coords:
+        return coords[0], coords[1], label
+    cached = get_geocache().get(label)
+    if cached is not MISS and cached:
+        return cached["lat"], cached["lon"], cached.get("address") or label
+    return None
+
+
+def _located_stops(points, stops):
+    """[(etiqueta, lat, lon, dirección)] de las paradas que se pueden situar."""
+    stops = list(stops or [])
+    out = []
+    for i, label in enumerate(points):
+        loc = _locate(str(label), stops[i] if i < len(stops) else None)
+        if loc:
+            out.append((str(label), loc[0], loc[1], loc[2]))
+    return out
+
+
+# ---------------------------
+# Escritores (un trozo por ruta)
+# ---------------------------
+def _gpx(routes, title):
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<gpx version="1.1" creator="photo_agent" xmlns="http://www.topografix.com/GPX/1/1">\n'
+           f"<metadata><name>{escape(title)}</name></metadata>\n")
+    for name, located in routes:
+        parts = [f"<rte><name>{escape(name)}</name>\n"]
+        for label, lat, lon, address in located:
+            parts.append(
+                f'<rtept lat="{lat:.6f}" lon="{lon:.6f}"><name>{escape(label)}</name>'
+                f"<desc>{escape(address)}</desc></rtept>\n"
+            )
+        parts.append("</rte>\n")
+        yield "".join(parts)
+    yield "</gpx>\n"
+
+
+def _kml(routes, title):
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<kml xmlns="http://www.opengis.net/kml/2.2"><Document>\n'
+           f"<name>{escape(title)}</name>\n")
+    for name, located in routes:
+        parts = [f"<Folder><name>{escape(name)}</name>\n"]
+        for n, (label, lat, lon, address) in enumerate(located, 1):
+            parts.append(
+                f"<Placemark><name>{n}. {escape(label)}</name>"
+                f"<description>{escape(address)}</description>"
+                f"<Point><coordinates>{lon:.6f},{lat:.6f}</coordinates></Point></Placemark>\n"
+            )
+        if len(located) >= 2:
+            line = " ".join(f"{lon:.6f},{lat:.6f}" for _, lat, lon, _ in located)
+            parts.append(
+                f"<Placemark><name>{escape(name)}</name>"
+                f"<LineString><tessellate>1</tessellate><coordinates>{line}</coordinates>"
+                "</LineString></Placemark>\n"
+            )
+        parts.append("</Folder>\n")
+        yield "".join(parts)
+    yield "</Document></kml>\n"
+
+
+def _geojson(routes, title):
+    yield '{"type": "FeatureCollection", "name": ' + json.dumps(title, ensure_ascii=False) + ', "features": [\n'
+    first = True
+    for name, located in routes:
+        features = []
+        if len(located) >= 2:
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "LineString",
+                             "coordinates": [[round(lon, 6), round(lat, 6)] for _, lat, lon, _ in located]},
+                "properties": {"route": name, "kind": "route", "stops": len(located)},
+            })
+        for n, (label, lat, lon, address) in enumerate(located, 1):
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [round(lon, 6), round(lat, 6)]},
+                "properties": {"route": name, "kind": "stop", "seq": n, "label": label, "address": address},
+            })
+        if not features:
+            continue
+        chunk = ",\n".join(json.dumps(f, ensure_ascii=False) for f in features)
+        yield chunk if first else ",\n" + chunk
+        first = False
+    yield "\n]}\n"
+
+
+_WRITERS = {"gpx": _gpx, "kml": _kml, "geojson": _geojson}
+
+
+# ---------------------------
+# API
+# ---------------------------
+def iter_export(user: str, fmt: str, names=None, store=None):
+    """
+    Genera el fichero `fmt` (gpx, kml o geojson) con las rutas de `user`
+    (todas, o solo `names`) como trozos de texto.
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f"formato no soportado: {fmt}")
+    store = store or get_route_store()
+    routes = (
+        (name, _located_stops(points, stops))
+        for name, points, stops in store.iter_routes(user, names=names)
+    )
+    title = names[0] if names is not None and len(names) == 1 else f"Rutas de {user}"
+    yield from _WRITERS[fmt](routes, title)
+
+
+def export_routes(user: str, fmt: str, out, names=None, store=None) -> int:
+    """Escribe la exportación en `out` (fichero de texto o binario). Devuelve los bytes escritos."""
+    written = 0
+    binary = "b" in getattr(out, "mode", "") or not hasattr(out, "encoding")
+    for chunk in iter_export(user, fmt, names=names, store=store):
+        data = chunk.encode("utf-8")
+        out.write(data if binary else chunk)
+        written += len(data)
+    return written
+
+
+def export_filename(user: str, fmt: str, names=None) -> str:
+    base = names[0] if names is not None and len(names) == 1 else f"rutas_{user}"
+    base = re.sub(r"[^\w.-]+", "_", base).strip("_") or "rutas"
+    return f"{base}.{EXPORT_FORMATS[fmt][1]}"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4 or sys.argv[2] not in EXPORT_FORMATS:
+        print(__doc__)
+        sys.exit(1)
+    user, fmt, target = sys.argv[1:4]
+    route_names = [a for a in sys.argv[4:] if a != "--route"] or None
+    with open(target, "wb") as fh:
+        size = export_routes(user, fmt, fh, names=route_names)
+    print(f"{target}: {size} bytes")
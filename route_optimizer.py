@@ -0,0 +1,168 @@
+# route_optimizer.py
+"""
+Optimizador local del orden de paradas (TSP de camino abierto).
+
+El origen (primer punto) y el destino (último) quedan fijos; las paradas
+intermedias se reordenan con vecino más cercano + 2-opt + Or-opt sobre una
+matriz de distancias (por defecto haversine vectorizada con NumPy).
+"""
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+class UnlocatedStopsError(ValueError):
+    """Hay paradas sin coordenadas: no se puede optimizar el orden."""
+
+    def __init__(self, points):
+        self.points = list(points)
+        super().__init__(", ".join(self.points))
+
+
+# ---------------------------
+# Coordenadas y distancias
+# ---------------------------
+def parse_coords(meta):
+    """Extrae (lat, lon) de un meta {"coords": "lat,lon"} / {"lat","lon"} o de un string."""
+    if isinstance(meta, dict):
+        if meta.get("lat") is not None and meta.get("lon") is not None:
+            return float(meta["lat"]), float(meta["lon"])
+        meta = meta.get("coords") or ""
+    try:
+        lat, lon = (float(x) for x in str(meta).split(","))
+    except ValueError:
+        return None
+    if -90 <= lat <= 90 and -180 <= lon <= 180:
+        return lat, lon
+    return None
+
+
+def haversine_matrix(coords) -> np.ndarray:
+    """Matriz N×N de distancias en km entre pares (lat, lon)."""
+    arr = np.radians(np.asarray(coords, dtype=float).reshape(-1, 2))
+    lat = arr[:, 0][:, None]
+    lon = arr[:, 1][:, None]
+    dlat = lat.T - lat
+    dlon = lon.T - lon
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def route_length(order, dist) -> float:
+    order = np.asarray(order)
+    return float(dist[order[:-1], order[1:]].sum())
+
+
+# ---------------------------
+# Heurísticas
+# ---------------------------
+def nearest_neighbour(dist, start: int = 0, end: int | None = None):
+    """Camino voraz desde `start` visitando todo y terminando en `end`."""
+    n = len(dist)
+    end = n - 1 if end is None else end
+    visited = np.zeros(n, dtype=bool)
+    visited[[start, end]] = True
+    order = [start]
+    cur = start
+    for _ in range(n - 2):
+        row = np.where(visited, np.inf, dist[cur])
+        cur = int(np.argmin(row))
+        visited[cur] = True
+        order.append(cur)
+    order.append(end)
+    return order
+
+
+def two_opt(order, dist, max_passes: int = 50):
+    """2-opt con extremos fijos; cada pasada evalúa todos los j de un i a la vez."""
+    order = np.asarray(order)
+    n = len(order)
+    if n < 4:
+        return order.tolist()
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n - 2):
+            js = np.arange(i + 1, n - 1)
+            a, b = order[i - 1], order[i]
+            c, d = order[js], order[js + 1]
+            delta = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+            k = int(np.argmin(delta))
+            if delta[k] < -1e-9:
+                j = js[k]
+                order[i:j + 1] = order[i:j + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return order.tolist()
+
+
+def or_opt(order, dist, max_segment: int = 3, max_passes: int = 20):
+    """Or-opt: mueve tramos de 1..`max_segment` paradas a su mejor hueco."""
+    order = list(order)
+    n = len(order)
+    if n < 4:
+        return order
+    for _ in range(max_passes):
+        improved = False
+        for seg_len in range(1, max_segment + 1):
+            for i in range(1, n - seg_len):
+                j_end = i + seg_len - 1
+                if j_end >= n - 1:
+                    break
+                prev, nxt = order[i - 1], order[j_end + 1]
+                seg = order[i:j_end + 1]
+                removed = dist[prev, seg[0]] + dist[seg[-1], nxt] - dist[prev, nxt]
+                rest = order[:i] + order[j_end + 1:]
+                best_gain, best_pos, best_seg = 1e-9, None, None
+                for p in range(len(rest) - 1):
+                    u, v = rest[p], rest[p + 1]
+                    for cand in (seg, seg[::-1]):
+                        added = dist[u, cand[0]] + dist[cand[-1], v] - dist[u, v]
+                        gain = removed - added
+                        if gain > best_gain:
+                            best_gain, best_pos, best_seg = gain, p + 1, cand
+                if best_pos is not None:
+                    order = rest[:best_pos] + list(best_seg) + rest[best_pos:]
+                    improved = True
+        if not improved:
+            break
+    return order
+
+
+def solve_path(dist):
+    """Mejor orden encontrado (índices) para la matriz `dist`, con extremos fijos."""
+    dist = np.asarray(dist, dtype=float)
+    n = len(dist)
+    identity = list(range(n))
+    if n < 4:
+        return identity
+    # 2-opt asume costes simétricos; para matrices asimétricas (duraciones)
+    # buscamos sobre la versión simétrica y validamos con la real.
+    sym = (dist + dist.T) / 2
+    order = nearest_neighbour(sym, 0, n - 1)
+    order = two_opt(order, sym)
+    order = or_opt(order, sym)
+    if route_length(order, dist) < route_length(identity, dist):
+        return order
+    return identity
+
+
+def optimize_order(points, metas, dist=None):
+    """
+    Reordena `points` (textos) usando las coordenadas de `metas` (mismo orden).
+    Devuelve (puntos_reordenados, km_ahorrados). Si falta alguna coordenada,
+    devuelve el orden original y 0.0. `dist` permite pasar otra matriz de
+    costes (p. ej. distancias por carretera) en lugar de la haversine.
+    """
+    points = list(points)
+    if len(points) < 4:
+        return points, 0.0
+    if dist is None:
+        coords = [parse_coords(m) for m in metas]
+        if any(c is None for c in coords):
+            return points, 0.0
+        dist = haversine_matrix(coords)
+    dist = np.asarray(dist, dtype=float)
+    order = solve_path(dist)
+    saved = route_length(list(range(len(points))), dist) - route_length(order, dist)
+    return [points[i] for i in order], max(0.0, saved)
@@ -0,0 +1,368 @@
+# route_planner.py
+"""
+Reparto de un conjunto grande de paradas en varias rutas equilibradas
+(vehículos o días) y guardado como rutas con nombre del usuario.
+
+1. Las coordenadas se proyectan a un plano local en km.
+2. Agrupación:
+   - "kmeans": k-means++ vectorizado con NumPy y, después, una asignación
+     con capacidad (por orden de "arrepentimiento": primero las paradas que
+     más pierden si no van a su grupo más cercano) que se refina unas
+     cuantas veces recalculando centros;
+   - "sweep": barrido angular alrededor del almacén (o del centro),
+     cortando en sectores de carga parecida.
+3. Cada grupo se ordena con `route_optimizer` (completo hasta
+   ORDER_FULL_MAX paradas; por encima, vecino más cercano + 2-opt acotado).
+
+Capacidad: `max_stops` por ruta y, opcionalmente, `capacity` sobre la suma
+de `demands` (una unidad por parada si no se indica). Sin límites se reparte
+por igual: ceil(n / rutas) paradas como máximo por ruta.
+
+    plan = plan_stops("ana", puntos, n_routes=5, depot="Polígono Industrial, Sils")
+
+En línea de comandos (las paradas se leen con `stop_import`):
+    python route_planner.py <usuario> paradas.csv --routes 5 [--max-stops 40]
+        [--method kmeans|sweep] [--depot "..."] [--prefix ruta] [--overwrite]
+"""
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+from route_optimizer import (
+    EARTH_RADIUS_KM,
+    haversine_matrix,
+    nearest_neighbour,
+    parse_coords,
+    route_length,
+    solve_path,
+    two_opt,
+)
+from route_store import RouteConflictError, get_route_store
+
+METHODS = ("kmeans", "sweep")
+DAY_NAMES = ("lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo")
+
+KMEANS_ITERS = 50
+ASSIGN_ROUNDS = 5
+# Hasta este tamaño cada ruta se ordena con `solve_path` (2-opt + Or-opt
+# completos); los grupos mayores, con vecino más cercano + 2-opt acotado.
+ORDER_FULL_MAX = 150
+LARGE_TWO_OPT_PASSES = 6
+
+
+# ---------------------------
+# Geometría
+# ---------------------------
+def _project(latlon, lat0=None) -> np.ndarray:
+    """(lat, lon) -> (x, y) en km sobre un plano tangente (equirectangular)."""
+    latlon = np.asarray(latlon, dtype=float).reshape(-1, 2)
+    lat0 = np.radians(latlon[:, 0].mean() if lat0 is None else lat0)
+    rad = np.radians(latlon)
+    return np.column_stack((
+        EARTH_RADIUS_KM * rad[:, 1] * np.cos(lat0),
+        EARTH_RADIUS_KM * rad[:, 0],
+    ))
+
+
+def _sq_dists(xy, centers) -> np.ndarray:
+    """Matriz N×K de distancias al cuadrado."""
+    return ((xy[:, None, :] - centers[None, :, :]) ** 2).sum(-1)
+
+
+def _centers(xy, labels, k, previous) -> np.ndarray:
+    counts = np.bincount(labels, minlength=k).astype(float)
+    sums = np.column_stack((
+        np.bincount(labels, xy[:, 0], minlength=k),
+        np.bincount(labels, xy[:, 1], minlength=k),
+    ))
+    out = previous.copy()
+    filled = counts > 0
+    out[filled] = sums[filled] / counts[filled, None]
+    return out
+
+
+# ---------------------------
+# Agrupación
+# ---------------------------
+def kmeans(xy, k: int, iters: int = KMEANS_ITERS, seed: int = 0):
+    """k-means++ + Lloyd vectorizado. Devuelve (etiquetas, centros)."""
+    rng = np.random.default_rng(seed)
+    n = len(xy)
+    centers = np.empty((k, 2))
+    centers[0] = xy[rng.integers(n)]
+    d2 = ((xy - centers[0]) ** 2).sum(1)
+    for c in range(1, k):
+        total = d2.sum()
+        pick = rng.choice(n, p=d2 / total) if total > 0 else rng.integers(n)
+        centers[c] = xy[pick]
+        d2 = np.minimum(d2, ((xy - centers[c]) ** 2).sum(1))
+    labels = np.zeros(n, dtype=int)
+    for _ in range(iters):
+        labels = _sq_dists(xy, centers).argmin(1)
+        new = _centers(xy, labels, k, centers)
+        if np.allclose(new, centers, atol=1e-6):
+            break
+        centers = new
+    return labels, centers
+
+
+def _assign_with_capacity(xy, centers, demands, max_load, max_count):
+    """
+    Cada parada a su centro más cercano con hueco, empezando por las que más
+    pierden si no van a su preferido.
+    """
+    n, k = len(xy), len(centers)
+    dist = np.sqrt(_sq_dists(xy, centers))
+    prefs = np.argsort(dist, axis=1)
+    if k > 1:
+        ranked = np.take_along_axis(dist, prefs[:, :2], axis=1)
+        regret = ranked[:, 1] - ranked[:, 0]
+    else:
+        regret = np.zeros(n)
+    load = [0.0] * k
+    count = [0] * k
+    labels = np.empty(n, dtype=int)
+    prefs_l = prefs.tolist()
+    demands_l = demands.tolist()
+    for i in np.argsort(-regret, kind="stable").tolist():
+        d = demands_l[i]
+        for c in prefs_l[i]:
+            if count[c] < max_count and load[c] + d <= max_load + 1e-9:
+                labels[i] = c
+                count[c] += 1
+                load[c] += d
+                break
+        else:
+            raise ValueError("No caben todas las paradas con la capacidad indicada.")
+    return labels
+
+
+def cluster_kmeans(xy, k, demands, max_load, max_count, seed=0):
+    labels, centers = kmeans(xy, k, seed=seed)
+    for _ in range(ASSIGN_ROUNDS):
+        new = _assign_with_capacity(xy, centers, demands, max_load, max_count)
+        if np.array_equal(new, labels):
+            break
+        labels = new
+        centers = _centers(xy, labels, k, centers)
+    return labels
+
+
+def cluster_sweep(xy, k, demands, max_load, max_count, origin=None):
+    """Sectores angulares alrededor de `origin` (por defecto, el centro) de carga parecida."""
+    n = len(xy)
+    origin = xy.mean(0) if origin is None else origin
+    angles = np.arctan2(xy[:, 1] - origin[1], xy[:, 0] - origin[0])
+    order = np.argsort(angles, kind="stable")
+    # Empezamos justo después del mayor hueco angular para no partir un grupo
+    sorted_angles = angles[order]
+    gaps = np.diff(np.append(sorted_angles, sorted_angles[0] + 2 * np.pi))
+    order = np.roll(order, -(int(gaps.argmax()) + 1))
+    d = demands[order]
+    before = np.cumsum(d) - d
+    total = d.sum()
+    sector = np.minimum((before * k / total).astype(int), k - 1) if total > 0 \
+        else np.minimum(np.arange(n) * k // n, k - 1)
+    labels = np.empty(n, dtype=int)
+    labels[order] = sector
+    counts = np.bincount(labels, minlength=k)
+    loads = np.bincount(labels, demands, minlength=k)
+    if counts.max() > max_count or loads.max() > max_load + 1e-9:
+        raise ValueError("No caben todas las paradas con la capacidad indicada.")
+    return labels
+
+
+# ---------------------------
+# Orden dentro de cada ruta
+# ---------------------------
+def _solve(dist):
+    if len(dist) <= ORDER_FULL_MAX:
+        return solve_path(dist)
+    order = nearest_neighbour(dist, 0, len(dist) - 1)
+    return two_opt(order, dist, max_passes=LARGE_TWO_OPT_PASSES)
+
+
+def order_cluster(latlon, depot=None):
+    """
+    Orden de visita (índices de `latlon`) y km en línea recta. Con `depot` la
+    ruta sale y vuelve al almacén; sin él, va del extremo más alejado del
+    centro al punto más lejano de ese extremo.
+    """
+    latlon = np.asarray(latlon, dtype=float).reshape(-1, 2)
+    n = len(latlon)
+    if n == 0:
+        return [], 0.0
+    if depot is not None:
+        pts = np.vstack((depot, latlon, depot))
+        dist = haversine_matrix(pts)
+        order = _solve(dist)
+        return [i - 1 for i in order[1:-1]], route_length(order, dist)
+    if n == 1:
+        return [0], 0.0
+    full = haversine_matrix(latlon)
+    # El más alejado del centro (basta la aproximación en grados)
+    start = int(((latlon - latlon.mean(0)) ** 2).sum(1).argmax())
+    end = int(full[start].argmax())
+    if full[start, end] == 0:
+        return list(range(n)), 0.0      # todas en el mismo sitio
+    middle = [i for i in range(n) if i not in (start, end)]
+    idx = [start] + middle + [end]
+    dist = full[np.ix_(idx, idx)]
+    order = _solve(dist)
+    return [idx[i] for i in order], route_length(order, dist)
+
+
+# ---------------------------
+# Planificación
+# ---------------------------
+def plan_routes(latlon, n_routes: int, method: str = "kmeans", max_stops: int = None,
+                capacity: float = None, demands=None, depot=None, seed: int = 0):
+    """
+    Reparte las paradas `latlon` ([(lat, lon)]) en `n_routes` rutas.
+    Devuelve [(índices ordenados, km)] sin rutas vacías.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Método desconocido: {method}")
+    latlon = np.asarray(latlon, dtype=float).reshape(-1, 2)
+    n = len(latlon)
+    if n == 0:
+        return []
+    if n_routes < 1:
+        raise ValueError("Hace falta al menos una ruta.")
+    k = min(int(n_routes), n)
+    demands = np.ones(n) if demands is None else np.asarray(demands, dtype=float)
+    max_count = int(max_stops) if max_stops else math.ceil(n / k)
+    max_load = float(capacity) if capacity else float("inf")
+    if max_count * k < n or max_load * k < demands.sum():
+        raise ValueError("No caben todas las paradas: sube el número de rutas o la capacidad.")
+
+    lat0 = latlon[:, 0].mean()
+    xy = _project(latlon, lat0)
+    if method == "sweep":
+        origin = _project([depot], lat0)[0] if depot is not None else None
+        labels = cluster_sweep(xy, k, demands, max_load, max_count, origin)
+    else:
+        labels = cluster_kmeans(xy, k, demands, max_load, max_count, seed=seed)
+
+    plan = []
+    for c in range(k):
+        members = np.flatnonzero(labels == c)
+        if not len(members):
+            continue
+        order, km = order_cluster(latlon[members], depot)
+        plan.append(([int(members[i]) for i in order], km))
+    # Orden estable de las rutas: por ángulo alrededor del centro (lunes, martes…)
+    center = xy.mean(0)
+    plan.sort(key=lambda r: math.atan2(*(xy[r[0]].mean(0) - center)[::-1]))
+    return plan
+
+
+def route_names(count: int, prefix: str = None):
+    if prefix:
+        return [f"{prefix} {i}" for i in range(1, count + 1)]
+    if count <= len(DAY_NAMES):
+        return list(DAY_NAMES[:count])
+    return [f"ruta {i}" for i in range(1, count + 1)]
+
+
+def plan_stops(user: str, points, n_routes: int, method: str = "kmeans", max_stops: int = None,
+               capacity: float = None, demands=None, depot: str = None, names=None,
+               prefix: str = None, known=None, save: bool = True, overwrite: bool = False):
+    """
+    Resuelve `points` (textos), los reparte en rutas y, con `save`, las guarda
+    en el almacén de `user` con su geometría. Devuelve
+    {"routes": [{"name", "points", "stops", "km"}], "unplaced": [...], "seconds"}.
+
+    `depot` (texto) se añade como origen y destino de cada ruta. Sin
+    `overwrite`, una ruta que ya exista lanza `RouteConflictError`.
+    """
+    from app_utils_core import resolve_many
+
+    t0 = time.perf_counter()
+    points = [p for p in points if isinstance(p, str) and p.strip()]
+    labels = ([depot] if depot else []) + points
+    metas = resolve_many(labels, known=known)
+    depot_meta = None
+    if depot:
+        depot_meta, metas = metas[0], metas[1:]
+        depot_ll = parse_coords(depot_meta)
+        if depot_ll is None:
+            raise ValueError(f"No se pudo localizar el almacén «{depot}».")
+    else:
+        depot_ll = None
+
+    placed, latlon, unplaced = [], [], []
+    for i, (label, meta) in enumerate(zip(points, metas)):
+        ll = parse_coords(meta)      # sin resolver, "coords" es el propio texto
+        if ll is None:
+            unplaced.append(label)
+        else:
+            placed.append(i)
+            latlon.append(ll)
+    if demands is not None:
+        demands = [demands[i] for i in placed]
+
+    plan = plan_routes(latlon, n_routes, method=method, max_stops=max_stops,
+                       capacity=capacity, demands=demands, depot=depot_ll)
+    names = list(names) if names else route_names(len(plan), prefix)
+    if len(names) < len(plan):
+        raise ValueError(f"Hay {len(plan)} rutas y solo {len(names)} nombres.")
+    routes = []
+    for (order, km), name in zip(plan, names):
+        idx = [placed[i] for i in order]
+        route_points = [points[i] for i in idx]
+        route_stops = [metas[i] for i in idx]
+        if depot:
+            route_points = [depot] + route_points + [depot]
+            route_stops = [depot_meta] + route_stops + [depot_meta]
+        routes.append({"name": name, "points": route_points, "stops": route_stops, "km": round(km, 1)})
+
+    if save:
+        store = get_route_store()
+        if not overwrite:
+            existing = store.list_versions(user)
+            taken = [r["name"] for r in routes if r["name"] in existing]
+            if taken:
+                raise RouteConflictError(", ".join(taken))
+        for r in routes:
+            store.save(user, r["name"], r["points"], expected_version=None if overwrite else 0,
+                       stops=r["stops"])
+    return {"routes": routes, "unplaced": unplaced, "seconds": round(time.perf_counter() - t0, 3)}
+
+
+def main(argv=None):
+    from stop_import import import_stops
+
+    parser = argparse.ArgumentParser(description="Reparte paradas en rutas equilibradas")
+    parser.add_argument("user")
+    parser.add_argument("stops", help="fichero de paradas (CSV, GPX, KML o lista)")
+    parser.add_argument("--routes", type=int, required=True, help="vehículos o días")
+    parser.add_argument("--max-stops", type=int)
+    parser.add_argument("--method", choices=METHODS, default="kmeans")
+    parser.add_argument("--depot", help="almacén: origen y destino de cada ruta")
+    parser.add_argument("--prefix", help="nombre base de las rutas (por defecto, días)")
+    parser.add_argument("--overwrite", action="store_true")
+    parser.add_argument("--dry-run", action="store_true", help="no guardar")
+    args = parser.parse_args(argv)
+
+    with open(args.stops, "rb") as fh:
+        imported = import_stops(fh, filename=args.stops)["stops"]
+    result = plan_stops(
+        args.user, [label for label, _ in imported], args.routes, method=args.method,
+        max_stops=args.max_stops, depot=args.depot, prefix=args.prefix,
+        known={label: meta for label, meta in imported if meta},
+        save=not args.dry_run, overwrite=args.overwrite,
+    )
+    for r in result["routes"]:
+        print(f"{r['name']:12s} {len(r['points']):5d} paradas  ~{r['km']:.0f} km")
+    if result["unplaced"]:
+        print(f"sin localizar: {len(result['unplaced'])}")
+    print(f"{result['seconds']} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
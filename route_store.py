@@ -0,0 +1,344 @@
+# route_store.py
+"""
+Almacén transaccional (SQLite) de rutas guardadas.
+
+Una fila por ruta (usuario, nombre) con columna `version` para concurrencia
+optimista: guardar una ruta cuesta O(ruta), no reescribir toda la biblioteca,
+y dos pestañas del mismo usuario no se pisan en silencio. El modo WAL hace
+las escrituras atómicas frente a caídas.
+
+Junto a los textos de las paradas se guarda su geometría ya resuelta
+(`stops`: dirección, coordenadas, place_id y fecha de resolución, alineada
+con `points`) con versión de esquema `stops_schema`. Las rutas antiguas o
+guardadas sin resolver quedan pendientes y se completan en segundo plano
+(`app_utils_core.start_stops_backfill`), o a mano:
+    python route_store.py backfill
+
+Los antiguos `.streamlit/routes_<usuario>.json` se importan una sola vez:
+    python route_store.py import [.streamlit]
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROUTES_DIR = Path(".streamlit")
+ROUTES_DB_PATH = Path(os.getenv("ROUTES_DB_PATH", str(ROUTES_DIR / "routes.sqlite3")))
+# Versión del formato de `stops`; las filas con una versión menor se rellenan
+STOPS_SCHEMA = 1
+
+
+class RouteConflictError(Exception):
+    """La ruta cambió (o se creó/borró) desde que se leyó."""
+
+
+class RouteStore:
+    def __init__(self, path=ROUTES_DB_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, timeout=10, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS routes (
+                user       TEXT NOT NULL,
+                name       TEXT NOT NULL,
+                points     TEXT NOT NULL,      -- JSON
+                version    INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (user, name)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS imported_files (file TEXT PRIMARY KEY, imported_at REAL)"
+        )
+        self._migrate()
+
+    def _migrate(self):
+        """Añade las columnas nuevas a bases de datos creadas por versiones anteriores."""
+        with self._lock:
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(routes)")}
+            if "stops" not in columns:
+                self._conn.execute("ALTER TABLE routes ADD COLUMN stops TEXT")   # JSON o NULL
+            if "stops_schema" not in columns:
+                self._conn.execute(
+                    "ALTER TABLE routes ADD COLUMN stops_schema INTEGER NOT NULL DEFAULT 0"
+                )
+
+    # ---------------------------
+    # Lectura
+    # ---------------------------
+    def list_routes(self, user: str) -> dict:
+        """{nombre: puntos} del usuario."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, points FROM routes WHERE user = ? ORDER BY name", (user,)
+            ).fetchall()
+        return {name: json.loads(points) for name, points in rows}
+
+    def list_versions(self, user: str) -> dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, version FROM routes WHERE user = ?", (user,)
+            ).fetchall()
+        return dict(rows)
+
+    def get(self, user: str, name: str):
+        """(puntos, versión) o None si no existe."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT points, version FROM routes WHERE user = ? AND name = ?", (user, name)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def iter_routes(self, user: str, names=None, page: int = 200):
+        """
+        Genera (nombre, puntos, stops) de las rutas del usuario (todas o las de
+        `names`, en ese orden) por páginas, sin cargar la biblioteca entera ni
+        bloquear el almacén mientras se consumen.
+        """
+        if names is not None:
+            yield from self._iter_named_routes(user, list(dict.fromkeys(names)), page)
+            return
+        last, op = "", ">="
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT name, points, stops FROM routes WHERE user = ? AND name {op} ? "
+                    "ORDER BY name LIMIT ?",
+                    (user, last, page),
+                ).fetchall()
+            if not rows:
+                return
+            for name, points, stops in rows:
+                yield name, json.loads(points), json.loads(stops) if stops else None
+            last, op = rows[-1][0], ">"
+
+    def _iter_named_routes(self, user: str, names, page: int):
+        """`iter_routes` de unas rutas concretas: busca por nombre, `page` cada vez."""
+        for start in range(0, len(names), page):
+            part = names[start:start + page]
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT name, points, stops FROM routes WHERE user = ? "
+                    f"AND name IN ({', '.join('?' * len(part))})",
+                    (user, *part),
+                ).fetchall()
+            found = {name: (points, stops) for name, points, stops in rows}
+            for name in part:
+                if name in found:
+                    points, stops = found[name]
+                    yield name, json.loads(points), json.loads(stops) if stops else None
+
+    def get_stops(self, user: str, name: str):
+        """Metadatos por parada (alineados con los puntos; None si no hay) de una ruta."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT stops FROM routes WHERE user = ? AND name = ?", (user, name)
+            ).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def iter_pending_stops(self, page: int = 50):
+        """
+        Genera (usuario, nombre, puntos, versión, stops) de las rutas con
+        `stops` incompletos o de un esquema antiguo. Recorre la tabla una sola
+        vez por páginas (cursor por rowid), sin volver a leer el conjunto
+        pendiente en cada lote.
+        """
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT rowid, user, name, points, version, stops FROM routes "
+                    "WHERE stops_schema < ? AND rowid > ? ORDER BY rowid LIMIT ?",
+                    (STOPS_SCHEMA, last, page),
+                ).fetchall()
+            if not rows:
+                return
+            for _, user, name, points, version, stops in rows:
+                yield user, name, json.loads(points), version, json.loads(stops) if stops else None
+            last = rows[-1][0]
+
+    def set_stops(self, user: str, name: str, version: int, stops) -> bool:
+        """
+        Completa los metadatos de una ruta sin cambiar su versión (los puntos
+        no cambian). No hace nada si la ruta se guardó de nuevo entretanto.
+        """
+        payload, schema = _stops_payload(None, stops)
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE routes SET stops = ?, stops_schema = ? "
+                "WHERE user = ? AND name = ? AND version = ?",
+                (payload, schema, user, name, version),
+            )
+        return cur.rowcount > 0
+
+    def signature(self, user: str):
+        """Cambia cada vez que cambia alguna ruta del usuario (para invalidar cachés)."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(version), 0), COALESCE(MAX(updated_at), 0) "
+                "FROM routes WHERE user = ?", (user,)
+            ).fetchone()
+
+    def iter_users(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT user FROM routes").fetchall()
+        return [r[0] for r in rows]
+
+    # ---------------------------
+    # Escritura
+    # ---------------------------
+    def save(self, user: str, name: str, points, expected_version=None, stops=None) -> int:
+        """
+        Crea o reemplaza una ruta y devuelve su nueva versión.
+
+        `expected_version`: None = sin comprobación; 0 = la ruta no debe
+        existir; n = la versión guardada debe ser n. Si no se cumple se lanza
+        `RouteConflictError`.
+
+        `stops`: metadatos por parada alineados con `points` (None donde no se
+        conocen). Si falta alguno, la ruta queda pendiente de completar.
+        """
+        points = list(points)
+        payload = json.dumps(points, ensure_ascii=False)
+        stops_payload, stops_schema = _stops_payload(points, stops)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT version FROM routes WHERE user = ? AND name = ?", (user, name)
+                ).fetchone()
+                current = row[0] if row else 0
+                if expected_version is not None and expected_version != current:
+                    raise RouteConflictError(name)
+                new_version = current + 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO routes "
+                    "(user, name, points, version, updated_at, stops, stops_schema) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (user, name, payload, new_version, time.time(), stops_payload, stops_schema),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return new_version
+
+    def delete(self, user: str, name: str, expected_version=None) -> bool:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT version FROM routes WHERE user = ? AND name = ?", (user, name)
+                ).fetchone()
+                if expected_version is not None and (row[0] if row else 0) != expected_version:
+                    raise RouteConflictError(name)
+                self._conn.execute(
+                    "DELETE FROM routes WHERE user = ? AND name = ?", (user, name)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row is not None
+
+    # ---------------------------
+    # Importación desde JSON
+    # ---------------------------
+    def import_json_dir(self, directory=ROUTES_DIR) -> int:
+        """
+        Importa cada `routes_<usuario>.json` de `directory` una sola vez. Las
+        rutas que ya existan en la base de datos no se sobrescriben. Devuelve
+        el número de rutas importadas.
+        """
+        imported = 0
+        for path in sorted(Path(directory).glob("routes_*.json")):
+            with self._lock:
+                done = self._conn.execute(
+                    "SELECT 1 FROM imported_files WHERE file = ?", (path.name,)
+                ).fetchone()
+            if done:
+                continue
+            user = path.stem[len("routes_"):]
+            try:
+                data = json.loads(path.read_text(encoding="utf-8")) or {}
+            except Exception:
+                continue
+            now = time.time()
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for name, points in data.items():
+                        cur = self._conn.execute(
+                            "INSERT OR IGNORE INTO routes (user, name, points, version, updated_at) "
+                            "VALUES (?, ?, ?, 1, ?)",
+                            (user, name, json.dumps(list(points), ensure_ascii=False), now),
+                        )
+                        imported += cur.rowcount
+                    self._conn.execute(
+                        "INSERT INTO imported_files (file, imported_at) VALUES (?, ?)",
+                        (path.name, now),
+                    )
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+        return imported
+
+
+def _stops_payload(points, stops):
+    """
+    (JSON, esquema) de `stops`. Esquema 0 (pendiente de completar) si alguna
+    parada no está resuelta: falta, o es el texto tal cual / sin fecha de
+    resolución (p. ej. guardada sin conexión con Google).
+    """
+    if stops is None:
+        return None, 0
+    stops = list(stops)
+    complete = (
+        all(isinstance(s, dict) and s.get("resolved_at") for s in stops)
+        and (points is None or len(stops) == len(points))
+    )
+    return json.dumps(stops, ensure_ascii=False), STOPS_SCHEMA if complete else 0
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_route_store() -> RouteStore:
+    """Almacén del proceso; la primera vez importa los JSON antiguos pendientes."""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                store = RouteStore()
+                try:
+                    store.import_json_dir(ROUTES_DIR)
+                except Exception:
+                    pass
+                _STORE = store
+    return _STORE
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "import":
+        directory = sys.argv[2] if len(sys.argv) > 2 else ROUTES_DIR
+        print(f"{RouteStore().import_json_dir(directory)} rutas importadas")
+    elif len(sys.argv) >= 2 and sys.argv[1] == "backfill":
+        from app_utils_core import backfill_route_stops
+
+        print(f"{backfill_route_stops()} rutas completadas")
+    else:
+        print(__doc__)
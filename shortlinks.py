@@ -0,0 +1,118 @@
+# shortlinks.py
+"""
+Acortador de enlaces propio (sin servicios de terceros).
+
+Cada URL larga se guarda en SQLite con un código corto derivado de su hash
+(la misma URL da siempre el mismo código) y la API la redirige desde
+`GET /r/<código>`. Así el QR solo lleva `SHORTLINK_BASE_URL/<código>` y se
+queda en una versión baja, fácil de leer con el móvil aunque la ruta tenga
+muchas paradas.
+
+Se activa definiendo SHORTLINK_BASE_URL con la dirección pública de la API,
+p. ej. `http://rutas.local:8502/r`.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import metrics
+
+SHORTLINKS_PATH = Path(os.getenv("SHORTLINKS_PATH", ".streamlit/shortlinks.sqlite3"))
+SHORTLINK_BASE_URL = os.getenv("SHORTLINK_BASE_URL", "").rstrip("/")
+CODE_LEN = 7
+
+_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def _base62(data: bytes) -> str:
+    n = int.from_bytes(data, "big")
+    out = []
+    while n:
+        n, r = divmod(n, 62)
+        out.append(_ALPHABET[r])
+    return "".join(reversed(out)) or "0"
+
+
+class LinkShortener:
+    def __init__(self, path=SHORTLINKS_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS links (
+                code       TEXT PRIMARY KEY,
+                url        TEXT NOT NULL UNIQUE,
+                created_at REAL NOT NULL,
+                hits       INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._conn.commit()
+
+    def shorten(self, url: str) -> str:
+        """Código corto de `url` (estable: la misma URL reutiliza su código)."""
+        digest = _base62(hashlib.sha256(url.encode("utf-8")).digest())
+        with self._lock:
+            # INSERT OR IGNORE: si otro proceso acaba de guardar la misma URL,
+            # la siguiente vuelta devuelve su código; si el código es de otra
+            # URL (colisión de prefijo), se alarga
+            for length in range(CODE_LEN, len(digest) + 1):
+                row = self._conn.execute("SELECT code FROM links WHERE url = ?", (url,)).fetchone()
+                if row:
+                    return row[0]
+                code = digest[:length]
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO links (code, url, created_at) VALUES (?, ?, ?)",
+                    (code, url, time.time()),
+                )
+                self._conn.commit()
+                if cur.rowcount:
+                    break
+            else:
+                raise RuntimeError(f"sin código libre para {url!r}")
+        metrics.inc("shortlinks_created_total")
+        return code
+
+    def resolve(self, code: str):
+        """URL larga de `code` (y cuenta la visita) o None."""
+        with self._lock:
+            row = self._conn.execute("SELECT url FROM links WHERE code = ?", (code,)).fetchone()
+            if row:
+                self._conn.execute("UPDATE links SET hits = hits + 1 WHERE code = ?", (code,))
+                self._conn.commit()
+        metrics.inc("shortlinks_redirects_total", found=bool(row))
+        return row[0] if row else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, hits = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM links"
+            ).fetchone()
+        return {"links": count, "redirects": hits}
+
+
+_SHORTENER = None
+_SHORTENER_LOCK = threading.Lock()
+
+
+def get_shortener() -> LinkShortener:
+    global _SHORTENER
+    if _SHORTENER is None:
+        with _SHORTENER_LOCK:
+            if _SHORTENER is None:
+                _SHORTENER = LinkShortener()
+    return _SHORTENER
+
+
+def short_url(url: str):
+    """URL corta pública de `url`, o None si el acortador no está configurado."""
+    if not SHORTLINK_BASE_URL or not url:
+        return None
+    return f"{SHORTLINK_BASE_URL}/{get_shortener().shorten(url)}"
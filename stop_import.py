@@ -0,0 +1,327 @@
+# stop_import.py
+"""
+Importación masiva de paradas: listas pegadas, CSV, GPX y KML.
+
+Todo se lee en streaming (líneas, `csv.reader` y `ElementTree.iterparse`
+liberando cada elemento al procesarlo), así que un fichero de miles de
+paradas no se carga entero en memoria ni como árbol DOM. Cada parada pasa
+por `_clean_waypoints`, se descarta cualquier directiva 'optimize:...' y,
+salvo que se pida lo contrario, también las repetidas.
+
+Las paradas que ya traen coordenadas (GPX, KML, CSV con lat/lon o líneas
+"lat,lon") salen con su geometría resuelta y no necesitan geocodificarse;
+el resto se resuelve en lote con `resolve_imported` (o en segundo plano con
+`resolve_imported_async`, que usa la pestaña profesional).
+
+    result = import_stops(uploaded_file, filename="clientes.gpx")
+    labels = [label for label, _ in result["stops"]]
+
+En línea de comandos:
+    python stop_import.py clientes.kml [--resolve]
+"""
+import csv
+import io
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from app_utils_core import GEOCODE_WORKERS, _clean_waypoints, resolve_many
+from geocache import normalize_query
+
+IMPORT_MAX_STOPS = int(os.getenv("IMPORT_MAX_STOPS", "10000"))
+IMPORT_RESOLVE_CHUNK = 256
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+
+# Importaciones en segundo plano: un trabajo por importación en un pool
+# propio, para no llenar de golpe el pool de geocodificación de las sesiones
+_IMPORT_POOL = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="import")
+
+FORMATS = ("text", "csv", "gpx", "kml")
+
+# "lat,lon" o "lat;lon": un espacio no basta (un número de portal seguido de
+# un código postal no son coordenadas)
+_COORDS = re.compile(r"^\s*(-?\d{1,2}(?:\.\d+)?)\s*[,;]\s*(-?\d{1,3}(?:\.\d+)?)\s*$")
+
+_ADDRESS_COLUMNS = ("address", "direccion", "dirección", "stop", "parada", "punto")
+_NAME_COLUMNS = ("name", "nombre", "label", "etiqueta")
+_LAT_COLUMNS = ("lat", "latitude", "latitud")
+_LON_COLUMNS = ("lon", "lng", "long", "longitude", "longitud")
+
+
+# ---------------------------
+# Paradas con coordenadas
+# ---------------------------
+def _coords_meta(lat, lon, name=None):
+    """Meta ya resuelto (misma forma que `resolve_many`) o None si no son coordenadas válidas."""
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        return None
+    coords = f"{lat},{lon}"
+    return {"address": (name or "").strip() or coords, "coords": coords, "resolved_at": int(time.time())}
+
+
+def _text_stop(text):
+    """(etiqueta, meta) de una línea de texto; las "lat,lon" ya vienen resueltas."""
+    m = _COORDS.match(text)
+    meta = _coords_meta(m.group(1), m.group(2)) if m else None
+    return text, meta
+
+
+# ---------------------------
+# Lectores (generadores de (etiqueta, meta o None))
+# ---------------------------
+def iter_text_stops(lines):
+    """Una parada por línea; también se acepta "a | b | c" en una misma línea."""
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    for line in lines:
+        for part in str(line).split("|"):
+            part = part.strip()
+            if part:
+                yield _text_stop(part)
+
+
+def _pick(header, names):
+    for i, col in enumerate(header):
+        if col in names:
+            return i
+    return None
+
+
+def iter_csv_stops(stream):
+    """
+    CSV con cabecera (address/dirección, name/nombre, lat, lon…) o sin ella
+    (primera columna = dirección, o dos columnas numéricas = lat, lon).
+    """
+    reader = csv.reader(stream)
+    first = next(reader, None)
+    if first is None:
+        return
+    header = [normalize_query(c) for c in first]
+    i_addr = _pick(header, _ADDRESS_COLUMNS)
+    i_name = _pick(header, _NAME_COLUMNS)
+    i_lat, i_lon = _pick(header, _LAT_COLUMNS), _pick(header, _LON_COLUMNS)
+    has_header = any(i is not None for i in (i_addr, i_name, i_lat, i_lon))
+    if not has_header:
+        i_addr, i_name, i_lat, i_lon = 0, None, None, None
+        if len(first) >= 2 and _coords_meta(first[0], first[1]):
+            i_addr, i_lat, i_lon = None, 0, 1
+        rows = _prepend(first, reader)
+    else:
+        rows = reader
+
+    def cell(row, i):
+        return row[i].strip() if i is not None and i < len(row) else ""
+
+    for row in rows:
+        name, addr = cell(row, i_name), cell(row, i_addr)
+        meta = _coords_meta(cell(row, i_lat), cell(row, i_lon), name or addr) \
+            if i_lat is not None and i_lon is not None else None
+        if meta:
+            yield name or addr or meta["coords"], meta
+        elif addr or name:
+            yield _text_stop(addr or name)
+
+
+def _prepend(first, rows):
+    yield first
+    yield from rows
+
+
+def _local(tag: str) -> str:
+    """Nombre del elemento sin espacio de nombres ('{ns}wpt' -> 'wpt')."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _iter_xml(stream, wanted):
+    """
+    `iterparse` incremental: genera los elementos `wanted` ya completos. Todo
+    elemento terminado que no forme parte de uno de ellos se suelta de su
+    padre, así el árbol en memoria no crece con el fichero (p. ej. tracks de
+    miles de puntos que no nos interesan).
+    """
+    stack = []
+    inside = 0          # elementos `wanted` abiertos
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            inside += _local(elem.tag) in wanted
+            continue
+        stack.pop()
+        if _local(elem.tag) in wanted:
+            inside -= 1
+            yield elem
+        elif inside:
+            continue        # hijo de un elemento que aún se está leyendo
+        if stack:
+            stack[-1].remove(elem)
+        elem.clear()
+
+
+def _child_text(elem, name):
+    for child in elem:
+        if _local(child.tag) == name:
+            return (child.text or "").strip()
+    return ""
+
+
+def iter_gpx_stops(stream):
+    """Waypoints (`wpt`) y puntos de ruta (`rtept`); los tracks (`trkpt`) no son paradas."""
+    for elem in _iter_xml(stream, ("wpt", "rtept")):
+        name = _child_text(elem, "name")
+        meta = _coords_meta(elem.get("lat"), elem.get("lon"), name)
+        if meta:
+            yield name or meta["coords"], meta
+
+
+def iter_kml_stops(stream):
+    """Placemarks con un `Point` (coordenadas "lon,lat[,alt]"); las líneas se ignoran."""
+    for elem in _iter_xml(stream, ("Placemark",)):
+        name = _child_text(elem, "name")
+        point = next((e for e in elem.iter() if _local(e.tag) == "Point"), None)
+        if point is None:
+            address = _child_text(elem, "address")
+            if address:
+                yield _text_stop(address)
+            continue
+        raw = _child_text(point, "coordinates").split(",")
+        meta = _coords_meta(raw[1], raw[0], name) if len(raw) >= 2 else None
+        if meta:
+            yield name or meta["coords"], meta
+
+
+# ---------------------------
+# Entrada única
+# ---------------------------
+def detect_format(filename: str = None, head: bytes = b"") -> str:
+    ext = os.path.splitext(filename or "")[1].lower().lstrip(".")
+    if ext in ("gpx", "kml", "csv"):
+        return ext
+    if ext in ("txt", "list"):
+        return "text"
+    sniff = head.lstrip()[:512].lower()
+    if sniff.startswith(b"<") or sniff.startswith(b"\xef\xbb\xbf<"):
+        return "kml" if b"<kml" in sniff else "gpx"
+    return "text"
+
+
+def _as_binary(source):
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    if isinstance(source, str):
+        return io.BytesIO(source.encode("utf-8"))
+    return source
+
+
+def iter_stops(source, filename: str = None, fmt: str = None):
+    """
+    Paradas limpias de `source` (texto, bytes o fichero binario abierto) en
+    el orden del fichero, como (etiqueta, meta o None).
+    """
+    if fmt is None and isinstance(source, str) and not filename:
+        fmt = "text"
+    binary = _as_binary(source)
+    if fmt is None:
+        head = binary.peek(512) if hasattr(binary, "peek") else b""
+        if not head and hasattr(binary, "seek"):
+            head = binary.read(512)
+            binary.seek(0)
+        fmt = detect_format(filename, head)
+    if fmt == "gpx":
+        raw = iter_gpx_stops(binary)
+    elif fmt == "kml":
+        raw = iter_kml_stops(binary)
+    else:
+        text = io.TextIOWrapper(binary, encoding="utf-8-sig", errors="replace", newline="")
+        raw = iter_csv_stops(text) if fmt == "csv" else iter_text_stops(text)
+
+    for label, meta in raw:
+        cleaned = _clean_waypoints([label])
+        if cleaned and not cleaned[0].lower().startswith("optimize"):
+            yield cleaned[0], meta
+
+
+def import_stops(source, filename: str = None, fmt: str = None, limit: int = IMPORT_MAX_STOPS,
+                 exclude=(), dedupe: bool = True) -> dict:
+    """
+    Lee y deduplica las paradas de `source` (también frente a `exclude`, p.
+    ej. los puntos que ya hay en la lista). Devuelve
+    {"stops": [(etiqueta, meta)], "read", "duplicates", "truncated"}.
+
+    Con `dedupe=False` se conservan las repetidas (p. ej. un itinerario que
+    pasa dos veces por el mismo sitio).
+    """
+    seen = {normalize_query(p) for p in exclude}
+    stops = []
+    read = duplicates = 0
+    truncated = False
+    for label, meta in iter_stops(source, filename=filename, fmt=fmt):
+        read += 1
+        key = normalize_query(label)
+        if dedupe and key in seen:
+            # Mismo nombre con otras coordenadas: se distingue por las coordenadas
+            if meta is None or normalize_query(meta["coords"]) in seen:
+                duplicates += 1
+                continue
+            label, key = meta["coords"], normalize_query(meta["coords"])
+        if len(stops) >= limit:
+            truncated = True
+            break
+        seen.add(key)
+        stops.append((label, meta))
+    return {"stops": stops, "read": read, "duplicates": duplicates, "truncated": truncated}
+
+
+def resolve_imported(stops, chunk: int = IMPORT_RESOLVE_CHUNK):
+    """
+    Completa la geometría de las paradas importadas por lotes de `chunk`
+    con el geocodificador en lote de la app. Genera (etiqueta, meta).
+    """
+    stops = list(stops)
+    for start in range(0, len(stops), chunk):
+        part = stops[start:start + chunk]
+        known = {label: meta for label, meta in part if meta}
+        metas = resolve_many([label for label, _ in part], known=known)
+        yield from zip((label for label, _ in part), metas)
+
+
+def resolve_imported_async(stops, into: dict, cancel=None):
+    """
+    `resolve_imported` como un único trabajo en segundo plano. Va dejando en
+    `into` ({etiqueta: meta}) cada lote resuelto; los lotes son del ancho del
+    pool de geocodificación, así que las paradas que añada a mano una sesión
+    no esperan detrás de miles de importadas. Se detiene al activarse
+    `cancel` (threading.Event). Devuelve el Future del trabajo.
+    """
+    stops = [(label, meta) for label, meta in stops if not meta]
+
+    def _run():
+        for start in range(0, len(stops), GEOCODE_WORKERS):
+            if cancel is not None and cancel.is_set():
+                return
+            into.update(resolve_imported(stops[start:start + GEOCODE_WORKERS]))
+
+    return _IMPORT_POOL.submit(metrics.bind(_run))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    t0 = time.perf_counter()
+    with open(sys.argv[1], "rb") as fh:
+        result = import_stops(fh, filename=sys.argv[1])
+    with_coords = sum(1 for _, meta in result["stops"] if meta)
+    print(f"{len(result['stops'])} paradas ({with_coords} con coordenadas), "
+          f"{result['duplicates']} repetidas, leídas {result['read']} "
+          f"en {time.perf_counter() - t0:.2f} s" + (" (truncado)" if result["truncated"] else ""))
+    if "--resolve" in sys.argv[2:]:
+        found = sum(1 for _, meta in resolve_imported(result["stops"]) if meta.get("resolved_at"))
+        print(f"resueltas: {found}/{len(result['stops'])} en {time.perf_counter() - t0:.2f} s")
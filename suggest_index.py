@@ -0,0 +1,173 @@
+# suggest_index.py
+"""
+Índice local de autocompletado para `suggest_addresses`.
+
+Se construye con las rutas guardadas del usuario, sus puntos recientes y el
+nomenclátor. Cada sugerencia se indexa por el comienzo de cada una de sus
+palabras en un array ordenado (búsqueda por prefijo con `bisect`) y, para
+tolerar erratas, por las variantes con una letra borrada del comienzo de
+cada palabra (estilo SymSpell, distancia 1).
+"""
+import bisect
+import math
+import threading
+import time
+
+from geocache import normalize_query
+
+# Longitud del prefijo de palabra usado para el índice de erratas
+_TYPO_PREFIX = 7
+# Vida media (en días) del peso por uso reciente
+_RECENCY_HALF_LIFE_DAYS = 30.0
+
+
+def _deletes(word: str):
+    """Variantes de `word` con un carácter borrado (más la propia palabra)."""
+    out = {word}
+    for i in range(len(word)):
+        out.add(word[:i] + word[i + 1:])
+    return out
+
+
+class SuggestIndex:
+    """
+    Índice inmutable de sugerencias. Cada entrada: etiqueta visible, frecuencia
+    de uso, última vez vista (epoch) y origen ("route", "recent", "gazetteer").
+    """
+
+    def __init__(self):
+        self._entries = []        # [label, freq, last_seen, source, clave]
+        self._by_key = {}         # clave normalizada -> posición en _entries
+        self._suffixes = []       # [(sufijo desde una palabra, id)] ordenado
+        self._typos = {}          # variante de prefijo de palabra -> {id}
+
+    def add(self, label: str, freq: int = 1, last_seen: float = 0.0, source: str = "route"):
+        key = normalize_query(label)
+        if not key:
+            return
+        idx = self._by_key.get(key)
+        if idx is not None:
+            e = self._entries[idx]
+            e[1] += freq
+            e[2] = max(e[2], last_seen)
+            return
+        idx = len(self._entries)
+        self._by_key[key] = idx
+        self._entries.append([label.strip(), freq, last_seen, source, key])
+        words = key.split(" ")
+        for n in range(len(words)):
+            self._suffixes.append((" ".join(words[n:]), idx))
+        for w in words:
+            if len(w) >= 3:
+                for d in _deletes(w[:_TYPO_PREFIX]):
+                    self._typos.setdefault(d, set()).add(idx)
+
+    def freeze(self):
+        """Ordena el array de sufijos; llamar tras el último `add`."""
+        self._suffixes.sort()
+        return self
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _score(self, idx: int, now: float, typo: bool, q: str = "") -> float:
+        _, freq, last_seen, source, key = self._entries[idx]
+        score = math.log1p(freq)
+        # Preferimos lo que empieza por la consulta a lo que solo la contiene
+        if q and key.startswith(q):
+            score += 1.0
+        if last_seen:
+            age_days = max(0.0, now - last_seen) / 86400.0
+            score += 2.0 * 0.5 ** (age_days / _RECENCY_HALF_LIFE_DAYS)
+        if source == "gazetteer":
+            score -= 0.5
+        if typo:
+            score -= 1.5
+        return score
+
+    def _prefix_ids(self, q: str, limit: int):
+        ids = []
+        i = bisect.bisect_left(self._suffixes, (q,))
+        while i < len(self._suffixes) and len(ids) < limit:
+            suffix, idx = self._suffixes[i]
+            if not suffix.startswith(q):
+                break
+            if idx not in ids:
+                ids.append(idx)
+            i += 1
+        return ids
+
+    def _typo_ids(self, q: str):
+        """Entradas con alguna palabra a distancia <= 1 del último token de `q`."""
+        last = q.split(" ")[-1][:_TYPO_PREFIX]
+        if len(last) < 4:
+            return set()
+        found = set()
+        for d in _deletes(last):
+            found |= self._typos.get(d, set())
+        return found
+
+    def search(self, query: str, max_results: int = 8, now: float | None = None):
+        """Devuelve [(etiqueta, origen)] ordenadas por relevancia."""
+        q = normalize_query(query)
+        if not q:
+            return []
+        now = now or time.time()
+        # Se recogen más candidatos de los pedidos para poder ordenarlos
+        exact = self._prefix_ids(q, max_results * 8)
+        scored = {idx: self._score(idx, now, False, q) for idx in exact}
+        if len(scored) < max_results:
+            for idx in self._typo_ids(q):
+                if idx not in scored:
+                    scored[idx] = self._score(idx, now, True)
+        best = sorted(scored, key=lambda i: -scored[i])[:max_results]
+        return [(self._entries[i][0], self._entries[i][3]) for i in best]
+
+
+# ---------------------------
+# Índice compartido por proceso
+# ---------------------------
+_GAZETTEER_INDEX = None
+_USER_INDEXES = {}   # (usuario, firma de la fuente) -> SuggestIndex
+_LOCK = threading.Lock()
+
+
+def build_index(routes: dict, last_seen: float = 0.0, gazetteer=None) -> SuggestIndex:
+    """Construye un índice a partir de {nombre: [puntos]} y, opcionalmente, el nomenclátor."""
+    index = SuggestIndex()
+    for pts in (routes or {}).values():
+        for p in pts or []:
+            if isinstance(p, dict):
+                p = p.get("text") or p.get("address") or ""
+            if isinstance(p, str) and p.strip():
+                index.add(p, 1, last_seen, "route")
+    if gazetteer is not None:
+        for _, entry in gazetteer.items():
+            index.add(entry["address"], 0, 0.0, "gazetteer")
+    return index.freeze()
+
+
+def get_gazetteer_index(gazetteer):
+    global _GAZETTEER_INDEX
+    if _GAZETTEER_INDEX is None and gazetteer is not None:
+        with _LOCK:
+            if _GAZETTEER_INDEX is None:
+                _GAZETTEER_INDEX = build_index({}, 0.0, gazetteer)
+    return _GAZETTEER_INDEX
+
+
+def get_user_index(username: str, signature, load_routes):
+    """
+    Índice de rutas del usuario. `signature` identifica la versión de sus datos
+    (p. ej. su firma en el almacén); si cambia, se reconstruye con `load_routes()`.
+    """
+    key = (username, signature)
+    index = _USER_INDEXES.get(key)
+    if index is None:
+        routes = load_routes()
+        index = build_index(routes, time.time())
+        with _LOCK:
+            for old in [k for k in _USER_INDEXES if k[0] == username]:
+                _USER_INDEXES.pop(old, None)
+            _USER_INDEXES[key] = index
+    return index
@@ -1,43 +1,59 @@
+import hashlib
 import io
-import json
-from pathlib import Path
+import threading
 from typing import List
 
 import streamlit as st
-import qrcode
 
+import metrics
 from app_utils_core import (
-    build_gmaps_url,
-    build_waze_url,
-    build_apple_maps_url,
-    resolve_selection,
+    is_fresh_meta,
+    optimize_points,
+    resolve_async,
+    resolve_position,
+    route_links,
+    start_stops_backfill,
+    suggest_addresses,
 )
-
-# Definición base para la carpeta de rutas
-ROUTES_DIR = Path(".streamlit")
-ROUTES_DIR.mkdir(parents=True, exist_ok=True)
-
-MAX_POINTS = 10
-
+from i18n import get_texts
+from qr_render import qr_png
+from route_export import EXPORT_FORMATS, export_filename, export_routes
+from route_store import ROUTES_DB_PATH, RouteConflictError, get_route_store
+from stop_import import import_stops, resolve_imported_async
+
+try:
+    from streamlit_searchbox import st_searchbox
+except ImportError:  # sin el componente seguimos con el formulario simple
+    st_searchbox = None
+
+try:
+    from streamlit_js_eval import get_geolocation
+except ImportError:  # sin el componente no se ofrece "Usar mi ubicación"
+    get_geolocation = None
+
+# Fragmentos: cada zona (búsqueda, lista, salidas) se re-ejecuta sola al
+# interactuar con ella, sin relanzar todo el script (st.fragment y
+# st.rerun(scope=...); versión mínima en requirements.txt).
+# Cada cuánto se refresca la lista mientras hay puntos resolviéndose (s)
+PENDING_REFRESH_S = 1.0
+# Puntos por página en la lista (una importación puede traer miles)
+LIST_PAGE_SIZE = 50
 
 # ---------------------------
 # Estado
 # ---------------------------
-def _get_user_routes_path():
-    """Devuelve el objeto Path del archivo de rutas del usuario logeado."""
-    # Usamos 'default' si el usuario no está logeado (no debería pasar aquí)
-    username = st.session_state.get('username', 'default')
-    return ROUTES_DIR / f"routes_{username}.json"
+def _get_username():
+    """Usuario logeado ('default' si no lo hay, no debería pasar aquí)."""
+    return st.session_state.get('username') or 'default'
+
 
+@metrics.timed()
 def _load_routes_file():
-    """Carga las rutas del archivo específico del usuario."""
-    routes_db_path = _get_user_routes_path()
-    try:
-        if routes_db_path.exists():
-            return json.loads(routes_db_path.read_text(encoding="utf-8"))
-    except Exception:
-        pass
-    return {}
+    """Carga las rutas del usuario (y sus versiones) desde el almacén."""
+    store = get_route_store()
+    user = _get_username()
+    st.session_state["saved_versions"] = store.list_versions(user)
+    return store.list_routes(user)
 
 
 def _init_state():
@@ -48,8 +64,13 @@ def _init_state():
     ss.setdefault("saved_choice", "")
     ss.setdefault("open_target", "Navegador")
     ss.setdefault("last_gmaps_url", None)
-    ss.setdefault("list_version", 0)       # <- fuerza refresco visual de la lista
+    ss.setdefault("last_route_legs", [])
     ss.setdefault("ow_pending", None)      # <- nombre pendiente de sobrescritura
+    ss.setdefault("prof_meta", {})         # texto del punto -> geometría resuelta (None = no encontrado)
+    ss.setdefault("prof_pending", {})      # texto del punto -> Future de resolve_async
+    ss.setdefault("prof_imports", [])      # importaciones resolviéndose en segundo plano
+    ss.setdefault("prof_list_page", 0)
+    ss.setdefault("prof_locating", 0)      # >0 = esperando la posición del navegador (n.º de petición)
     
     # ----------------------------------------------------
     # CORRECCIÓN DE PRIVACIDAD CRÍTICA
@@ -64,23 +85,116 @@ def _init_state():
         ss["saved_routes"] = _load_routes_file()
         ss['_current_routes_user'] = current_username # Marca que las rutas se cargaron para este usuario
         ss["prof_points"] = [] # Limpiamos la ruta activa para evitar la mezcla inicial
+        ss["prof_meta"] = {}
+        ss["prof_pending"] = {}
+        _cancel_imports()
         ss["route_name_input"] = ""
         ss["saved_choice"] = ""
+        # Rutas antiguas sin geometría: se completan en segundo plano
+        start_stops_backfill()
+
+def _reload_saved_routes():
+    st.session_state["saved_routes"] = _load_routes_file()
 
-def _persist_routes_file():
-    """Guarda las rutas en el archivo específico del usuario."""
-    routes_db_path = _get_user_routes_path()
+
+@metrics.timed()
+def _persist_route(name: str) -> bool:
+    """
+    Guarda la ruta activa como `name` comprobando que nadie la haya cambiado
+    desde que la leímos (otra pestaña del mismo usuario).
+    """
+    ss = st.session_state
+    points = list(ss["prof_points"])
+    known = ss.get("prof_meta") or {}
+    stops = [known.get(p) if is_fresh_meta(known.get(p)) else None for p in points]
     try:
-        routes_db_path.write_text(
-            json.dumps(st.session_state["saved_routes"], ensure_ascii=False, indent=2),
-            encoding="utf-8",
+        version = get_route_store().save(
+            _get_username(), name, points,
+            expected_version=ss["saved_versions"].get(name, 0),
+            stops=stops,
         )
-    except Exception:
-        pass
+    except RouteConflictError:
+        _reload_saved_routes()
+        st.warning(f"La ruta «{name}» ha cambiado en otra pestaña. Revísala y vuelve a guardar.")
+        return False
+    ss["saved_routes"][name] = points
+    ss["saved_versions"][name] = version
+    if None in stops:
+        start_stops_backfill()
+    return True
+
+
+def _point_ids(pts):
+    """
+    Identidad estable de cada punto (hash del texto + nº de aparición), para
+    que sus widgets conserven la clave aunque cambie de posición.
+    """
+    seen = {}
+    ids = []
+    for p in pts:
+        h = hashlib.sha1(p.encode("utf-8")).hexdigest()[:10]
+        seen[h] = seen.get(h, 0) + 1
+        ids.append(f"{h}_{seen[h]}")
+    return ids
 
 
-def _bump_list_version():
-    st.session_state["list_version"] += 1
+# ---------------------------
+# Resolución especulativa
+# ---------------------------
+def _prefetch(points):
+    """Empieza a resolver en segundo plano los puntos que aún no tienen geometría."""
+    ss = st.session_state
+    for p in points:
+        if p in ss["prof_pending"] or is_fresh_meta(ss["prof_meta"].get(p)):
+            continue
+        ss["prof_pending"][p] = resolve_async(p)
+
+
+def _harvest():
+    """Pasa a `prof_meta` las resoluciones terminadas y olvida las de puntos ya quitados."""
+    ss = st.session_state
+    current = set(ss["prof_points"])
+    for p, fut in list(ss["prof_pending"].items()):
+        if fut.done():
+            ss["prof_meta"][p] = fut.result()
+            del ss["prof_pending"][p]
+        elif p not in current:
+            del ss["prof_pending"][p]
+    for job in list(ss["prof_imports"]):
+        done = job["future"].done()
+        ss["prof_meta"].update(job["metas"])
+        if done:
+            ss["prof_imports"].remove(job)
+
+
+def _cancel_imports():
+    ss = st.session_state
+    for job in ss.get("prof_imports", []):
+        job["cancel"].set()
+    ss["prof_imports"] = []
+
+
+def _has_pending() -> bool:
+    ss = st.session_state
+    return bool(ss["prof_pending"] or ss["prof_imports"])
+
+
+def _point_status(p: str) -> str:
+    ss = st.session_state
+    if p in ss["prof_pending"]:
+        return "pending"
+    if is_fresh_meta(ss["prof_meta"].get(p)):
+        return "resolved"
+    if p in ss["prof_meta"]:
+        return "not_found"
+    return "pending"
+
+
+_STATUS_ICONS = {
+    "resolved": ("✅", "Dirección localizada"),
+    "pending": ("⏳", "Localizando…"),
+    "not_found": ("⚠️", "No se encontró: se usará el texto tal cual"),
+}
 
 
 # ---------------------------
@@ -91,48 +205,147 @@ def _add_point(val: str):
     val = (val or "").strip()
     if not val:
         return
-    if len(ss["prof_points"]) >= MAX_POINTS:
-        st.warning(f"Límite de {MAX_POINTS} puntos.")
-        return
     ss["prof_points"].append(val)
+    _prefetch([val])
     if "prof_text_input" in ss:
         del ss["prof_text_input"]
-    _bump_list_version()
-    st.rerun()
+    # Rerun de toda la app: la lista vive en otro fragmento
+    st.rerun(scope="app")
+
+
+def _add_position(lat, lon):
+    """Añade la dirección de la posición actual, ya resuelta (no se vuelve a geocodificar)."""
+    ss = st.session_state
+    texts = get_texts(ss.get("lang"))
+    found = resolve_position(lat, lon)
+    if not found:
+        st.warning(texts["loc_failed"])
+        return
+    label, meta = found
+    # Otro punto con la misma dirección (p. ej. la misma calle, otra posición)
+    # conserva su geometría: la etiqueta nueva lleva las coordenadas
+    if label in ss["prof_points"] or label in ss["prof_meta"]:
+        label = f"{label} ({meta['coords']})"
+        if label in ss["prof_points"]:
+            st.info(texts["loc_exists"].format(x=label))
+            return
+    ss["prof_points"].append(label)
+    ss["prof_meta"][label] = meta
+    ss["prof_loc_msg"] = texts["loc_added"].format(x=label)
+    # Rerun de toda la app: la lista vive en otro fragmento
+    st.rerun(scope="app")
+
+
+def _locate_me():
+    """Botón "Usar mi ubicación": pide la posición al navegador y la añade."""
+    ss = st.session_state
+    texts = get_texts(ss.get("lang"))
+    msg = ss.pop("prof_loc_msg", None)
+    if msg:
+        st.success(msg)
+    if st.button(texts["use_my_location"], use_container_width=True):
+        ss["prof_locating"] = abs(ss["prof_locating"]) + 1
+    if ss["prof_locating"] <= 0:
+        return
+    # Clave nueva por petición: el componente no devuelve la posición anterior
+    loc = get_geolocation(component_key=f"prof_geoloc_{ss['prof_locating']}")
+    if loc is None:
+        st.caption("📡 …")
+        return
+    ss["prof_locating"] = -ss["prof_locating"]
+    coords = loc.get("coords") if isinstance(loc, dict) else None
+    if not coords:
+        st.warning(texts["loc_failed"])
+        return
+    _add_position(coords.get("latitude"), coords.get("longitude"))
+
+
+def _import_points(uploaded, pasted: str):
+    """Añade al final de la lista las paradas de un fichero o lista pegada."""
+    ss = st.session_state
+    if uploaded is not None:
+        result = import_stops(uploaded, filename=uploaded.name, exclude=ss["prof_points"])
+    elif (pasted or "").strip():
+        result = import_stops(pasted, fmt="text", exclude=ss["prof_points"])
+    else:
+        st.warning("Sube un fichero o pega una lista de direcciones.")
+        return
+    if not result["stops"]:
+        st.warning("No se encontró ninguna parada nueva.")
+        return
+    labels = []
+    for label, meta in result["stops"]:
+        labels.append(label)
+        if meta:
+            ss["prof_meta"][label] = meta
+    ss["prof_points"].extend(labels)
+    # Un solo trabajo por importación (no un Future por parada)
+    job = {"metas": {}, "cancel": threading.Event()}
+    job["future"] = resolve_imported_async(result["stops"], job["metas"], job["cancel"])
+    ss["prof_imports"].append(job)
+    msg = f"{len(labels)} paradas importadas"
+    if result["duplicates"]:
+        msg += f" ({result['duplicates']} repetidas omitidas)"
+    if result["truncated"]:
+        msg += " · fichero recortado al máximo permitido"
+    ss["prof_import_msg"] = msg
+    # Rerun de toda la app: la lista vive en otro fragmento
+    st.rerun(scope="app")
 
 
 def _clear_points():
     ss = st.session_state
     ss["prof_points"] = []
+    ss["prof_pending"] = {}
+    _cancel_imports()
+    ss["prof_list_page"] = 0
     ss["last_gmaps_url"] = None
+    ss["last_route_legs"] = []
     if "prof_text_input" in ss:
         del ss["prof_text_input"]
-    _bump_list_version()
-    st.rerun()
 
 
 def _move_point_up(i: int):
     pts = st.session_state["prof_points"]
     if i > 0:
         pts[i-1], pts[i] = pts[i], pts[i-1]
-        _bump_list_version()
-    st.rerun()
 
 
 def _move_point_down(i: int):
     pts = st.session_state["prof_points"]
     if i < len(pts) - 1:
         pts[i+1], pts[i] = pts[i], pts[i+1]
-        _bump_list_version()
-    st.rerun()
+
+
+def _optimize_points():
+    # NumPy solo se carga al optimizar (arranque perezoso)
+    from route_optimizer import UnlocatedStopsError
+
+    ss = st.session_state
+    if len(ss["prof_points"]) < 4:
+        st.info("Hacen falta al menos dos paradas intermedias para optimizar.")
+        return
+    _harvest()
+    try:
+        new_pts, saved_km = optimize_points(ss["prof_points"], known=ss["prof_meta"])
+    except UnlocatedStopsError as exc:
+        st.warning(
+            f"No se han podido localizar {len(exc.points)} paradas ({', '.join(exc.points[:5])}"
+            f"{'…' if len(exc.points) > 5 else ''}); corrígelas para poder optimizar el orden."
+        )
+        return
+    if new_pts == ss["prof_points"]:
+        st.info("El orden actual ya es el mejor encontrado.")
+        return
+    ss["prof_points"] = new_pts
+    ss["last_gmaps_url"] = None
+    st.success(f"Orden optimizado: ~{saved_km:.0f} km menos ✅")
 
 
 def _delete_point(i: int):
     pts = st.session_state["prof_points"]
     if 0 <= i < len(pts):
         pts.pop(i)
-        _bump_list_version()
-    st.rerun()
 
 
 # ---------------------------
@@ -149,15 +362,14 @@ def _save_current_route():
         return
 
     if name in ss["saved_routes"] and ss.get("ow_pending") != name:
+        # El rerun que sigue al callback ya muestra la confirmación
         ss["ow_pending"] = name
-        st.rerun()
         return
 
-    ss["saved_routes"][name] = list(ss["prof_points"])
-    _persist_routes_file()
-    ss["saved_choice"] = name
+    if _persist_route(name):
+        ss["saved_choice"] = name
+        st.success("Ruta guardada ✅")
     ss["ow_pending"] = None
-    st.success("Ruta guardada ✅")
 
 
 def _confirm_overwrite(ok: bool):
@@ -165,13 +377,10 @@ def _confirm_overwrite(ok: bool):
     name = ss.get("ow_pending")
     if not name:
         return
-    if ok:
-        ss["saved_routes"][name] = list(ss["prof_points"])
-        _persist_routes_file()
+    if ok and _persist_route(name):
         ss["saved_choice"] = name
         st.success("Ruta sobrescrita ✅")
     ss["ow_pending"] = None
-    st.rerun()
 
 
 def _load_route(name: str):
@@ -183,38 +392,169 @@ def _load_route(name: str):
         return
     ss["prof_points"] = list(data)
     ss["route_name_input"] = name
-    _bump_list_version()
+    # Geometría guardada con la ruta: generar no necesita volver a geocodificar
+    stops = get_route_store().get_stops(_get_username(), name) or []
+    for p, meta in zip(data, stops):
+        if is_fresh_meta(meta):
+            ss["prof_meta"][p] = meta
+    _prefetch(ss["prof_points"])
 
 
 def _delete_saved_route(name: str):
     ss = st.session_state
     if name and name in ss["saved_routes"]:
+        try:
+            get_route_store().delete(
+                _get_username(), name, expected_version=ss["saved_versions"].get(name)
+            )
+        except RouteConflictError:
+            _reload_saved_routes()
+            st.warning(f"La ruta «{name}» ha cambiado en otra pestaña; no se ha borrado.")
+            return
         del ss["saved_routes"][name]
-        _persist_routes_file()
+        ss["saved_versions"].pop(name, None)
         ss["saved_choice"] = ""
         st.success("Ruta borrada 🗑️")
-        st.rerun()
 
 
 # ---------------------------
-# QR helper
+# Exportación
 # ---------------------------
-def _qr_image_for(url: str):
-    qr = qrcode.QRCode(version=2, box_size=8, border=2)
-    qr.add_data(url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
+def _export_file(user: str, fmt: str, names):
+    """
+    Fichero de exportación para la descarga diferida: solo se genera al pulsar
+    el botón, no en cada rerun. Streamlit sirve la descarga desde memoria; la
+    API (`/users/<usuario>/routes/export`) la sirve en streaming.
+    """
     buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
+    export_routes(user, fmt, buf, names=names)
     return buf
 
 
+def _export_section():
+    ss = st.session_state
+    if not ss["saved_routes"]:
+        return
+    with st.expander("📤 Exportar (GPX, KML, GeoJSON)"):
+        fmt = st.selectbox("Formato", list(EXPORT_FORMATS), key="export_format")
+        choice = ss.get("saved_choice")
+        scope = st.radio(
+            "Qué exportar",
+            [f"Ruta «{choice}»", "Todas mis rutas"] if choice else ["Todas mis rutas"],
+            key="export_scope",
+            horizontal=True,
+        )
+        names = [choice] if choice and scope.startswith("Ruta") else None
+        user = _get_username()
+        # La descarga se genera al pulsar (fuera del rerun) con estos valores fijados
+        st.download_button(
+            "⬇️ Descargar",
+            data=lambda: _export_file(user, fmt, names),
+            file_name=export_filename(user, fmt, names),
+            mime=EXPORT_FORMATS[fmt][0],
+            on_click="ignore",
+            use_container_width=True,
+        )
+
+
+# ---------------------------
+# Reparto en varias rutas
+# ---------------------------
+def _plan_current_points(n_routes, max_stops, method, use_depot, prefix, overwrite):
+    # NumPy solo se carga al repartir (arranque perezoso)
+    from route_planner import plan_stops
+
+    ss = st.session_state
+    _harvest()
+    pts = list(ss["prof_points"])
+    depot = pts.pop(0) if use_depot and pts else None
+    try:
+        with st.spinner("Repartiendo paradas…"):
+            result = plan_stops(
+                _get_username(), pts, int(n_routes), method=method,
+                max_stops=int(max_stops) or None, depot=depot,
+                prefix=(prefix or "").strip() or None,
+                known=ss["prof_meta"], overwrite=overwrite,
+            )
+    except RouteConflictError as exc:
+        st.warning(f"Ya existen rutas con esos nombres ({exc}). Marca «Sobrescribir» o cambia el prefijo.")
+        return
+    except ValueError as exc:
+        st.warning(str(exc))
+        return
+    _reload_saved_routes()
+    lines = [f"- **{r['name']}**: {len(r['points'])} paradas, ~{r['km']:.0f} km" for r in result["routes"]]
+    st.success(f"{len(result['routes'])} rutas guardadas en {result['seconds']:.1f} s ✅\n\n" + "\n".join(lines))
+    if result["unplaced"]:
+        st.warning(f"Sin localizar (no se han repartido): {', '.join(result['unplaced'][:20])}")
+
+
+# Métodos de `route_planner.METHODS` con su nombre visible (aquí para no
+# importar el planificador, y NumPy, al pintar la pestaña)
+_PLAN_METHODS = {"kmeans": "Agrupación (k-means)", "sweep": "Barrido angular"}
+
+
+def _planner_section():
+    pts = st.session_state["prof_points"]
+    if len(pts) < 2:
+        return
+    with st.expander("🧭 Repartir en varias rutas (vehículos / días)"):
+        c1, c2 = st.columns(2)
+        with c1:
+            n_routes = st.number_input("Rutas", min_value=1, max_value=50, value=5, key="plan_routes")
+        with c2:
+            max_stops = st.number_input("Máx. paradas por ruta (0 = equilibrado)",
+                                        min_value=0, value=0, key="plan_max_stops")
+        method = st.selectbox("Método", list(_PLAN_METHODS), key="plan_method",
+                              format_func=_PLAN_METHODS.get)
+        use_depot = st.checkbox("El primer punto es el almacén (inicio y fin de cada ruta)",
+                                key="plan_depot")
+        prefix = st.text_input("Prefijo de nombre (vacío = lunes, martes…)", key="plan_prefix")
+        overwrite = st.checkbox("Sobrescribir rutas existentes", key="plan_overwrite")
+        if st.button("Repartir y guardar", use_container_width=True):
+            _plan_current_points(n_routes, max_stops, method, use_depot, prefix, overwrite)
+
+
+# ---------------------------
+# QR helper
+# ---------------------------
+@metrics.timed()
+def _qr_image_for(url: str):
+    """QR de la URL como PNG de 1 bit (cacheado por contenido entre sesiones)."""
+    return io.BytesIO(qr_png(url))
+
+
 # ---------------------------
 # Columnas
 # ---------------------------
+def _suggest(query: str):
+    """Sugerencias locales para el buscador (rutas guardadas, recientes y municipios)."""
+    return [
+        s["description"]
+        for s in suggest_addresses(
+            query,
+            username=_get_username(),
+            recent=st.session_state.get("prof_points"),
+        )
+    ]
+
+
+@st.fragment
 def _search_col():
     st.subheader("Añade puntos")
+    if st_searchbox is not None:
+        picked = st_searchbox(
+            _suggest,
+            placeholder="Busca en tus rutas y municipios…",
+            key="prof_searchbox",
+            clear_on_submit=True,
+        )
+        # El componente puede devolver la misma selección en el siguiente rerun
+        if picked and picked != st.session_state.get("_last_pick"):
+            st.session_state["_last_pick"] = picked
+            _add_point(picked)
+        elif not picked:
+            st.session_state["_last_pick"] = None
     with st.form("add_form", clear_on_submit=False):
         st.text_input(
             "Escribe dirección (mín. 3 letras).",
@@ -224,44 +564,104 @@ def _search_col():
         submitted = st.form_submit_button("Añadir", type="primary", use_container_width=True)
     if submitted:
         _add_point(st.session_state.get("prof_text_input"))
+    if get_geolocation is not None:
+        _locate_me()
+
+    with st.expander("📥 Importar paradas (CSV, GPX, KML o lista)"):
+        msg = st.session_state.pop("prof_import_msg", None)
+        if msg:
+            st.success(msg)
+        uploaded = st.file_uploader(
+            "Fichero", type=["csv", "gpx", "kml", "txt"], key="prof_import_file"
+        )
+        pasted = st.text_area("…o pega una dirección por línea", key="prof_import_text")
+        if st.button("Importar", use_container_width=True):
+            _import_points(uploaded, pasted)
+
+
+def _set_list_page(page: int):
+    st.session_state["prof_list_page"] = page
 
 
-def _list_col():
-    st.subheader(f"Puntos ({len(st.session_state['prof_points'])}/{MAX_POINTS})  📌")
+def _list_pager(page: int, pages: int):
+    prev_col, info_col, next_col = st.columns([1, 3, 1])
+    with prev_col:
+        st.button("◀", key="list_prev", on_click=_set_list_page, args=(page - 1,),
+                  use_container_width=True, disabled=page == 0)
+    with info_col:
+        st.caption(f"Página {page + 1} de {pages}")
+    with next_col:
+        st.button("▶", key="list_next", on_click=_set_list_page, args=(page + 1,),
+                  use_container_width=True, disabled=page >= pages - 1)
+
+
+def _list_body():
+    _harvest()
+    st.subheader(f"Puntos ({len(st.session_state['prof_points'])})  📌")
     pts: List[str] = st.session_state["prof_points"]
     if not pts:
         st.info("Añade al menos dos puntos (origen y destino).")
     else:
-        ver = st.session_state["list_version"]
-        for i, p in enumerate(pts):
+        # Solo se pintan las filas de la página actual
+        pages = -(-len(pts) // LIST_PAGE_SIZE)
+        page = max(0, min(st.session_state["prof_list_page"], pages - 1))
+        first = page * LIST_PAGE_SIZE
+        if pages > 1:
+            _list_pager(page, pages)
+        ids = _point_ids(pts)
+        for i in range(first, min(first + LIST_PAGE_SIZE, len(pts))):
+            p, pid = pts[i], ids[i]
             # Usamos las columnas solo para la fila de cada punto
-            row = st.columns([9, 3]) 
-            
+            row = st.columns([1, 9, 3])
+
             with row[0]:
+                icon, help_text = _STATUS_ICONS[_point_status(p)]
+                st.markdown(icon, help=help_text)
+
+            with row[1]:
                 st.text_input(
-                    "",
+                    f"Punto {i + 1}",
                     value=p,
-                    key=f"pt_{ver}_{i}",
+                    key=f"pt_{pid}",
                     disabled=True,
                     label_visibility="collapsed",
                 )
             
-            with row[1]:
+            with row[2]:
                 # Usamos una sub-columna para los 3 botones, haciéndolos más anchos
                 col_btn = st.columns(3) 
                 
                 with col_btn[0]:
-                    st.button("✖", key=f"del_{ver}_{i}", on_click=_delete_point, args=(i,), use_container_width=True)
+                    st.button("✖", key=f"del_{pid}", on_click=_delete_point, args=(i,), use_container_width=True)
                 with col_btn[1]:
-                    st.button("▲", key=f"up_{ver}_{i}", on_click=_move_point_up, args=(i,), use_container_width=True,
+                    st.button("▲", key=f"up_{pid}", on_click=_move_point_up, args=(i,), use_container_width=True,
                               disabled=(i==0))
                 with col_btn[2]:
-                    st.button("▼", key=f"dn_{ver}_{i}", on_click=_move_point_down, args=(i,), use_container_width=True,
+                    st.button("▼", key=f"dn_{pid}", on_click=_move_point_down, args=(i,), use_container_width=True,
                               disabled=(i==len(pts)-1))
 
 
-    # Limpiar debajo de la lista: Ahora usa el ancho completo.
-    st.button("Limpiar ruta", on_click=_clear_points, use_container_width=True)
+    # Limpiar / optimizar debajo de la lista, a todo el ancho.
+    c1, c2 = st.columns(2)
+    with c1:
+        st.button("🔀 Optimizar orden", on_click=_optimize_points, use_container_width=True,
+                  disabled=len(pts) < 4)
+    with c2:
+        st.button("Limpiar ruta", on_click=_clear_points, use_container_width=True)
+
+
+# La lista se pinta con refresco automático solo mientras hay puntos
+# resolviéndose; al terminar el último se vuelve a la versión sin temporizador.
+_list_col = st.fragment(_list_body)
+
+
+def _list_col_live():
+    _list_body()
+    if not _has_pending():
+        st.rerun(scope="app")
+
+
+_list_col_live = st.fragment(_list_col_live, run_every=PENDING_REFRESH_S)
 
 
 def _save_load_col():
@@ -294,6 +694,9 @@ def _save_load_col():
         with cB:
             st.button("❌ Cancelar", on_click=_confirm_overwrite, args=(False,), use_container_width=True)
 
+    _export_section()
+    _planner_section()
+
 
 # ---------------------------
 # Generar y salidas
@@ -307,57 +710,75 @@ def _build_and_show_outputs():
         st.warning("Añade origen y destino (mínimo 2 puntos).")
         return
 
-    o_text = pts[0]
-    d_text = pts[-1]
-    w_texts = pts[1:-1]
-
-    # Resolvemos todas las direcciones a meta-datos (incluyendo coordenadas)
-    o_meta = resolve_selection(o_text, None)
-    d_meta = resolve_selection(d_text, None)
-    waypoints_meta = [resolve_selection(w, None) for w in w_texts]
-    # --- SANEAR waypoints: evitar que 'optimize:true' entre como punto ---
-    w_texts = [w for w in w_texts if not str(w).lower().startswith("optimize")]
-    waypoints_meta = [resolve_selection(w, None) for w in w_texts]
-    # --- FIN SANEADO ---
-
-    # Pasamos los objetos meta a las funciones de construcción de URL
-    gmaps_web = build_gmaps_url(
-        origin_meta=o_meta,
-        destination_meta=d_meta,
-        waypoints_meta=waypoints_meta if waypoints_meta else None,
-    )
-    ss["last_gmaps_url"] = gmaps_web
+    # Resolvemos todas las direcciones de una vez (en paralelo, sin duplicados)
+    # y partimos las rutas largas en tramos que caben en una URL
+    # Lo resuelto en segundo plano mientras se añadían los puntos ya está en
+    # `prof_meta`; lo que siga en vuelo se espera en `route_links` sin repetirlo
+    _harvest()
+    known = ss["prof_meta"]
+    metas, legs = route_links(pts, known=known)
+    if len(metas) == len(pts):
+        known.update({p: m for p, m in zip(pts, metas) if is_fresh_meta(m)})
+    ss["last_route_legs"] = legs
+    ss["last_gmaps_url"] = legs[0]["gmaps"] if legs else None
+
+    if not legs:
+        st.warning("No se pudo generar la URL de Google Maps.")
+        return
 
-    # --- RENDER ENLACE GOOGLE MAPS (siempre) ---
-    if gmaps_web:
-        st.link_button("Abrir en Google Maps", gmaps_web, use_container_width=True)
-        with st.expander("Ver URL"):
-            st.code(gmaps_web)
+    if len(legs) > 1:
+        st.success(f"Ruta generada en {len(legs)} tramos enlazados. Elige cómo abrir cada uno 👇")
     else:
-        st.warning("No se pudo generar la URL de Google Maps.")
-    # --- FIN RENDER ---
+        st.success("Ruta generada. Elige cómo abrirla 👇")
 
-    # Waze y Apple también usan el objeto meta
-    waze = build_waze_url(o_meta, d_meta)
-    apple = build_apple_maps_url(o_meta, d_meta)
+    for n, leg in enumerate(legs, start=1):
+        _show_leg(leg, n, len(legs))
 
-    st.success("Ruta generada. Elige cómo abrirla 👇")
+
+def _show_leg(leg: dict, n: int, total: int):
+    """Enlaces y QR de un tramo (o de la ruta entera si solo hay uno)."""
+    gmaps_web = leg["gmaps"]
+    if total > 1:
+        st.markdown(
+            f"**Tramo {n}/{total}** · {leg['origin']} → {leg['destination']} "
+            f"({leg['points']} puntos)"
+        )
+
+    # --- RENDER ENLACE GOOGLE MAPS (siempre) ---
+    st.link_button("Abrir en Google Maps", gmaps_web, use_container_width=True)
+    with st.expander("Ver URL"):
+        st.code(gmaps_web)
+    # --- FIN RENDER ---
 
     c1, c2, c3, c4 = st.columns(4)
     with c1:
         st.link_button("🗺️ Maps (Web)", gmaps_web, use_container_width=True)
     with c2:
         st.link_button("📱 Maps (App)", gmaps_web, use_container_width=True)
+    # Waze y Apple Maps no admiten paradas intermedias: un enlace por parada
+    hops = len(leg["waze_hops"])
     with c3:
-        st.link_button("🚗 Waze", waze, use_container_width=True)
+        st.link_button("🚗 Waze" + (" (1ª parada)" if hops > 1 else ""), leg["waze"],
+                       use_container_width=True)
     with c4:
-        st.link_button("🍎 Apple", apple, use_container_width=True)
+        st.link_button("🍎 Apple" + (" (1ª parada)" if hops > 1 else ""), leg["apple"],
+                       use_container_width=True)
+    if hops > 1:
+        with st.expander(f"Waze / Apple parada a parada ({hops} enlaces)"):
+            for i, (waze, apple) in enumerate(zip(leg["waze_hops"], leg["apple_hops"]), start=1):
+                h1, h2, h3 = st.columns([6, 2, 2])
+                h1.markdown(f"{i}. → {waze['destination']}")
+                h2.link_button("🚗 Waze", waze["url"], use_container_width=True)
+                h3.link_button("🍎 Apple", apple["url"], use_container_width=True)
 
     st.markdown("---")
     st.caption("Escanea el QR (Google Maps)")
-    if ss["last_gmaps_url"]:
-        img_buf = _qr_image_for(ss["last_gmaps_url"])
-        st.image(img_buf, caption="QR", width=220)
+    # Con acortador configurado el QR lleva el enlace corto (versión baja)
+    short = leg.get("short")
+    if short:
+        st.caption(f"Enlace corto: {short}")
+    img_buf = _qr_image_for(short or gmaps_web)
+    st.image(img_buf, caption="QR" if total == 1 else f"QR tramo {n}", width=220)
 
 
 # ---------------------------
@@ -368,9 +789,9 @@ def mostrar_profesional():
 
     st.header("🗺️ Planificador de Rutas")
     
-    # DEBUG: Muestra el nombre del archivo para confirmar que es único
+    # DEBUG: Muestra de quién son las rutas para confirmar que es único
     st.sidebar.markdown("---")
-    st.sidebar.caption(f"Archivo de rutas: **{_get_user_routes_path().name}**")
+    st.sidebar.caption(f"Rutas de: **{_get_username()}** ({ROUTES_DB_PATH.name})")
 
     # Modificado: Dos columnas principales (Izquierda=Controles, Derecha=Lista)
     col_controles, col_lista = st.columns([4, 8])
@@ -381,8 +802,15 @@ def mostrar_profesional():
         _save_load_col() # 2. Guardar / Cargar
         
     with col_lista:
-        _list_col() # 3. La lista de puntos
+        _harvest()
+        # 3. La lista de puntos
+        (_list_col_live if _has_pending() else _list_col)()
 
     st.markdown("---")
+    _outputs_area()
+
+
+@st.fragment
+def _outputs_area():
     if st.button("Generar ruta profesional", type="primary", use_container_width=True):
         _build_and_show_outputs()
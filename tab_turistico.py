@@ -1,5 +1,6 @@
 import streamlit as st
 from app_utils_core import build_gmaps_url
+from stop_import import import_stops
 
 def mostrar_turistico():
     st.header("🗺️ Planificador Turístico")
@@ -13,12 +14,9 @@ def mostrar_turistico():
             st.warning("Indica al menos origen y destino.")
             return
 
-        stops = stops.splitlines()
-        # --- SANEAR WAYPOINTS ---
-        if isinstance(stops, str):
-            stops = [w.strip() for w in stops.split("|") if w.strip() and not w.lower().startswith("optimize")]
-        stops = [w.strip() for w in stops if w.strip() and not w.lower().startswith("optimize")]
-        # --- FIN SANEO ---
+        # Misma limpieza que la importación masiva (sin directivas 'optimize:...');
+        # se respetan las paradas repetidas
+        stops = [label for label, _ in import_stops(stops, fmt="text", dedupe=False)["stops"]]
 
         url = build_gmaps_url({"address": o}, {"address": d}, stops if stops else None)
         st.success("Ruta generada correctamente ✅")
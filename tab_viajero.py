@@ -1,5 +1,6 @@
 import streamlit as st
 from app_utils_core import build_gmaps_url
+from stop_import import import_stops
 
 def mostrar_viajero():
     st.header("🌍 Planificador de Viajes")
@@ -13,12 +14,9 @@ def mostrar_viajero():
             st.warning("Indica al menos origen y destino.")
             return
 
-        wps = wps.splitlines()
-        # --- SANEAR WAYPOINTS ---
-        if isinstance(wps, str):
-            wps = [w.strip() for w in wps.split("|") if w.strip() and not w.lower().startswith("optimize")]
-        wps = [w.strip() for w in wps if w.strip() and not w.lower().startswith("optimize")]
-        # --- FIN SANEO ---
+        # Misma limpieza que la importación masiva (sin directivas 'optimize:...');
+        # se respetan las paradas repetidas
+        wps = [label for label, _ in import_stops(wps, fmt="text", dedupe=False)["stops"]]
 
         url = build_gmaps_url({"address": o}, {"address": d}, wps if wps else None)
         st.success("Ruta generada correctamente ✅")
@@ -0,0 +1,39 @@
+# tests/conftest.py
+"""
+Entorno aislado para las pruebas: sin clave de Google (no hay red) y con las
+bases de datos del proceso (caché, rutas, enlaces, nomenclátor) en un
+directorio temporal. Las variables se fijan antes de importar los módulos,
+que las leen al cargarse.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+_TMP = Path(tempfile.mkdtemp(prefix="photo_agent_tests_"))
+
+os.environ["GOOGLE_API_KEY"] = ""
+os.environ.setdefault("GEOCACHE_PATH", str(_TMP / "geocache.sqlite3"))
+os.environ.setdefault("ROUTES_DB_PATH", str(_TMP / "routes.sqlite3"))
+os.environ.setdefault("SHORTLINKS_PATH", str(_TMP / "shortlinks.sqlite3"))
+os.environ.setdefault("MATRIX_CACHE_PATH", str(_TMP / "matrix.sqlite3"))
+os.environ.setdefault("GAZETTEER_SOURCE", str(ROOT / "data" / "municipios_es.csv"))
+os.environ.setdefault("GAZETTEER_PATH", str(_TMP / "gazetteer_es.bin"))
+
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def fake_client():
+    """Cliente falso de Google Maps instalado en `app_utils_core` (y retirado al acabar)."""
+    import resilience
+    from benchmarks.fake_gmaps import FakeGoogleMapsClient, install
+
+    resilience.BREAKER.record_success()
+    client = install(FakeGoogleMapsClient())
+    yield client
+    install(None)
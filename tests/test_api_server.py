@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+import pytest
+from starlette.requests import Request
+
+import api_server
+
+
+def _call(handler, method="POST", body=None, path_params=None, query=b"", token=None):
+    data = json.dumps(body).encode("utf-8") if body is not None else b""
+    headers = [(b"content-type", b"application/json")]
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    scope = {
+        "type": "http", "method": method, "path": "/", "headers": headers,
+        "query_string": query, "path_params": path_params or {},
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": data, "more_body": False}
+
+    return asyncio.run(handler(Request(scope, receive)))
+
+
+@pytest.fixture
+def no_token(monkeypatch):
+    monkeypatch.setattr(api_server, "API_TOKEN", None)
+
+
+def test_user_routes_are_never_served_without_a_configured_token(no_token):
+    resp = _call(api_server.user_routes, "GET", path_params={"user": "ana"})
+    assert resp.status_code == 403
+    resp = _call(api_server.export, "GET", path_params={"user": "ana"}, query=b"format=gpx")
+    assert resp.status_code == 403
+
+
+def test_user_routes_with_token(monkeypatch):
+    monkeypatch.setattr(api_server, "API_TOKEN", "s3cret")
+    assert _call(api_server.user_routes, "GET", path_params={"user": "ana"}).status_code == 401
+    resp = _call(api_server.user_routes, "GET", path_params={"user": "ana"}, token="s3cret")
+    assert resp.status_code == 200
+
+
+@pytest.mark.parametrize("body", [
+    {"points": ["41.0,1.0", "41.0,2.0"], "leg": "uno"},
+    {"points": ["41.0,1.0", "41.0,2.0"], "leg": 1.5},
+    {"points": ["41.0,1.0", "41.0,2.0"], "leg": 3},
+    {"points": ["41.0,1.0", "41.0,2.0"], "avoid": ["tolls"]},
+    {"points": ["41.0,1.0", "41.0,2.0"], "mode": 3},
+    {"points": ["41.0,1.0", "41.0,2.0"], "mode": "teleport"},
+    {"url": 12},
+])
+def test_qr_rejects_malformed_input_with_422(no_token, body):
+    assert _call(api_server.qr, body=body).status_code == 422
+
+
+def test_qr_applies_the_points_limit(no_token, monkeypatch):
+    monkeypatch.setattr(api_server, "MAX_POINTS_PER_REQUEST", 3)
+    resp = _call(api_server.qr, body={"points": ["41.0,1.0"] * 4})
+    assert resp.status_code == 413
+
+
+def test_qr_rejects_urls_too_long_for_a_qr_code(no_token):
+    resp = _call(api_server.qr, body={"url": "https://example.com/" + "a" * 5000})
+    assert resp.status_code == 413
+    resp = _call(api_server.qr, body={"url": "https://example.com/" + "a" * 2000})
+    assert resp.status_code == 200
+
+
+def test_links_rejects_unknown_travel_modes(no_token):
+    resp = _call(api_server.links, body={"points": ["41.0,1.0", "41.0,2.0"], "mode": "teleport"})
+    assert resp.status_code == 422
+    resp = _call(api_server.links, body={"points": ["41.0,1.0", "41.0,2.0"], "mode": "walking"})
+    assert "travelmode=walking" in json.loads(resp.body)["legs"][0]["gmaps"]
+
+
+def test_qr_and_links_happy_path(no_token):
+    resp = _call(api_server.qr, body={"points": ["41.0,1.0", "41.0,2.0"], "leg": 0})
+    assert resp.status_code == 200 and resp.media_type == "image/png"
+    resp = _call(api_server.links, body={"points": ["41.0,1.0", "41.0,2.0"]})
+    assert json.loads(resp.body)["legs"][0]["gmaps"].startswith("https://www.google.com/maps/dir/")
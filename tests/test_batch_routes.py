@@ -0,0 +1,28 @@
+import json
+
+import batch_routes
+
+
+def test_run_dedupes_stops_and_skips_malformed_lines(tmp_path, fake_client):
+    src = tmp_path / "rutas.jsonl"
+    rows = [
+        {"name": "lunes", "stops": ["Carrer A 1, Lot", "Carrer B 2, Lot", "Carrer C 3, Lot"]},
+        '{"name": "roto", "stops": ',
+        {"name": "martes", "stops": "Carrer A 1, Lot | Carrer C 3, Lot"},
+        "[1, 2]",
+        {"name": "corta", "stops": ["Carrer A 1, Lot"]},
+        {"name": 5, "stops": ["Carrer A 1, Lot", "Carrer B 2, Lot"]},
+        {"name": "raro", "stops": 7},
+        {"name": "modo", "mode": ["driving"], "stops": "Carrer A 1, Lot | Carrer B 2, Lot"},
+    ]
+    src.write_text("\n".join(r if isinstance(r, str) else json.dumps(r) for r in rows) + "\n",
+                   encoding="utf-8")
+
+    stats = batch_routes.run(src, tmp_path / "out", workers=1, log=None)
+
+    assert stats["rows"] == 8
+    assert (stats["routes"], stats["rejected"], stats["skipped"]) == (2, 5, 1)
+    assert fake_client.calls["geocode"] == 3          # una vez por dirección distinta
+    out = [json.loads(line) for line in (tmp_path / "out" / "routes.jsonl").open(encoding="utf-8")]
+    assert [r["name"] for r in out] == ["lunes", "martes"]
+    assert all((tmp_path / "out" / leg["qr"]).exists() for r in out for leg in r["legs"])
@@ -0,0 +1,54 @@
+import multiprocessing
+
+import pytest
+import yaml
+
+from credentials import CredentialStore, hash_password
+
+
+def _register(path, prefix, count):
+    store = CredentialStore(path)      # un almacén por proceso, como cada worker de la app
+    for i in range(count):
+        assert store.register(f"{prefix}{i}", f"{prefix}{i}@x.es", prefix, "pw")
+
+
+def test_register_and_check_password(tmp_path):
+    store = CredentialStore(tmp_path / "config.yaml")
+    assert store.register("ana", "ana@x.es", "Ana", "s3cret") is True
+    assert store.register("ana", "otra@x.es", "Otra", "otra") is False
+    assert store.check_password("ana", "s3cret")
+    assert not store.check_password("ana", "mala") and not store.check_password("nadie", "s3cret")
+
+    on_disk = yaml.safe_load((tmp_path / "config.yaml").read_text(encoding="utf-8"))
+    assert on_disk["credentials"]["usernames"]["ana"]["password_hash"] == hash_password("s3cret")
+    assert on_disk["cookie"]["name"] == "auth_cookie"
+    assert not [p for p in tmp_path.iterdir() if p.suffix == ".tmp"]
+
+
+def test_reloads_only_after_an_external_write(tmp_path):
+    path = tmp_path / "config.yaml"
+    store = CredentialStore(path)
+    store.register("ana", "ana@x.es", "Ana", "pw")
+    store.config()
+    reloads = store.reloads
+    for _ in range(5):
+        store.get_user("ana")
+    assert store.reloads == reloads
+
+    CredentialStore(path).register("bob", "bob@x.es", "Bob", "pw")     # otro proceso
+    assert store.get_user("bob")["name"] == "Bob"
+    assert store.reloads == reloads + 1
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="sin fork")
+def test_concurrent_registrations_are_not_lost(tmp_path):
+    path = tmp_path / "config.yaml"
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_register, args=(path, prefix, 10)) for prefix in "abcd"]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(timeout=60)
+    assert [p.exitcode for p in procs] == [0, 0, 0, 0]
+    users = CredentialStore(path).config()["credentials"]["usernames"]
+    assert sorted(users) == sorted(f"{prefix}{i}" for prefix in "abcd" for i in range(10))
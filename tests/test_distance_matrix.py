@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+import metrics
+from distance_matrix import TILE_DESTINATIONS, TILE_ORIGINS, MatrixCache, travel_matrix
+
+
+def _elements():
+    return sum(v for (name, _), v in metrics._COUNTERS.items() if name == "gmaps_matrix_elements_total")
+
+
+def _stops(n, lat0=41.0):
+    return [{"address": f"P{i}", "coords": f"{lat0 + i * 0.01:.5f},{2.0 + i * 0.01:.5f}"} for i in range(n)]
+
+
+@pytest.fixture
+def calls(fake_client, monkeypatch):
+    shapes = []
+    original = fake_client.distance_matrix
+
+    def recording(origins, destinations, **kwargs):
+        shapes.append((len(origins), len(destinations)))
+        return original(origins, destinations, **kwargs)
+
+    monkeypatch.setattr(fake_client, "distance_matrix", recording)
+    return shapes
+
+
+def test_large_matrices_are_tiled_and_cached(fake_client, calls, tmp_path):
+    cache = MatrixCache(tmp_path / "matrix.sqlite3")
+    metas = _stops(23)
+    km, minutes, source = travel_matrix(metas, client=fake_client, cache=cache)
+
+    assert source == "google" and km.shape == (23, 23)
+    assert len(calls) == 9                                   # 3 × 3 bloques
+    assert all(o <= TILE_ORIGINS and d <= TILE_DESTINATIONS for o, d in calls)
+    assert np.all(np.diag(km) == 0) and np.all(km[~np.eye(23, dtype=bool)] > 0)
+
+    calls.clear()
+    again = travel_matrix(metas, client=fake_client, cache=cache)
+    assert calls == [] and again[2] == "google"
+    assert np.array_equal(again[0], km)
+
+    calls.clear()
+    travel_matrix(metas + _stops(1, lat0=42.0), client=fake_client, cache=cache)
+    assert sum(o * d for o, d in calls) < 2 * 24 * 10        # solo la fila y la columna nuevas
+
+
+def test_failed_tiles_fall_back_to_the_estimate_and_are_not_billed(fake_client, tmp_path, monkeypatch):
+    from googlemaps.exceptions import ApiError
+
+    def fail(*_, **__):
+        raise ApiError("INVALID_REQUEST")
+
+    monkeypatch.setattr(fake_client, "distance_matrix", fail)
+    before = _elements()
+    km, _, source = travel_matrix(_stops(4), client=fake_client, cache=MatrixCache(tmp_path / "m.sqlite3"))
+    assert source == "estimate" and not np.isnan(km).any()
+    assert _elements() == before
+
+
+def test_programming_errors_are_not_hidden(fake_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(fake_client, "distance_matrix", lambda *_, **__: None)    # resp.get -> AttributeError
+    with pytest.raises(AttributeError):
+        travel_matrix(_stops(3), client=fake_client, cache=MatrixCache(tmp_path / "m.sqlite3"))
@@ -0,0 +1,43 @@
+import pytest
+
+from conftest import ROOT
+from gazetteer import Gazetteer, build_gazetteer
+
+
+@pytest.fixture(scope="module")
+def gz(tmp_path_factory):
+    path = tmp_path_factory.mktemp("gz") / "gazetteer.bin"
+    build_gazetteer(ROOT / "data" / "municipios_es.csv", path)
+    gz = Gazetteer(path)
+    yield gz
+    gz.close()
+
+
+def test_exact_and_alias(gz):
+    assert gz.exact("TARRAGONA")["address"].startswith("Tarragona")
+    assert gz.exact("tarrasa")["address"].startswith("Terrassa")
+    assert gz.exact("carrer de valencia") is None
+
+
+def test_lookup_accepts_town_with_province_and_country(gz):
+    assert gz.lookup("Sils, Girona, España")["address"] == "Sils, Girona, España"
+    assert gz.lookup("Barcelona, España")["address"].startswith("Barcelona")
+
+
+def test_lookup_never_substitutes_a_centroid_for_a_street(gz):
+    # "…València 250, Barcelona" no es Valencia ni el centro de Barcelona
+    assert gz.lookup("Carrer de València 250, Barcelona") is None
+    assert gz.lookup("carrer pau casals 27 sils") is None
+    assert gz.lookup("Sils, Tarragona") is None
+
+
+def test_prefix_is_sorted_and_limited(gz):
+    keys = [k for k, _ in gz.prefix("ba", limit=3)]
+    assert keys == sorted(keys) and len(keys) <= 3
+    assert all(k.startswith("ba") for k in keys)
+
+
+def test_nearest(gz):
+    hit = gz.nearest(41.81, 2.74)
+    assert hit["address"].startswith("Sils")
+    assert hit["distance_km"] < 1
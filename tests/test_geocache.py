@@ -0,0 +1,67 @@
+import geocache
+from geocache import MISS, GeocodeCache, geohash, normalize_query
+
+
+def _cache(tmp_path, **kwargs):
+    return GeocodeCache(tmp_path / "geocache.sqlite3", **kwargs)
+
+
+def test_normalize_query_folds_case_accents_and_spaces():
+    assert normalize_query("  Carrer   de VALÈNCIA ") == normalize_query("carrer de valencia")
+
+
+def test_put_get_roundtrip_and_negative_entries(tmp_path):
+    cache = _cache(tmp_path)
+    assert cache.get("Girona") is MISS
+    cache.put("Girona", {"address": "Girona, España", "lat": 41.98, "lon": 2.82})
+    cache.put("nowhere", None)
+    assert cache.get(" girona ")["lat"] == 41.98
+    assert cache.get("nowhere") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["negative_hits"]) == (2, 1, 1)
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = _cache(tmp_path, ttl=-1, negative_ttl=-1)
+    cache.put("Girona", {"address": "Girona", "lat": 1, "lon": 2})
+    assert cache.get("Girona") is MISS
+    assert cache.stats()["entries"] == 0
+
+
+def test_hit_does_not_write_unless_access_mark_is_stale(tmp_path, monkeypatch):
+    cache = _cache(tmp_path)
+    cache.put("Girona", {"address": "Girona", "lat": 1, "lon": 2})
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+
+    cache.get("Girona")
+    assert not [s for s in statements if s.lstrip().upper().startswith(("UPDATE", "COMMIT"))]
+
+    monkeypatch.setattr(geocache, "GEOCACHE_TOUCH_INTERVAL", -1)
+    cache.get("Girona")
+    assert any(s.lstrip().upper().startswith("UPDATE") for s in statements)
+
+
+def test_lru_eviction_keeps_recent_entries(tmp_path):
+    cache = _cache(tmp_path, max_entries=2)
+    for i, q in enumerate(("a", "b", "c")):
+        cache.put(q, {"address": q, "lat": i, "lon": i})
+    cache.evict()
+    assert cache.stats()["entries"] == 2
+    assert cache.get("a") is MISS
+
+
+def test_geohash_known_values():
+    # Valores de referencia del algoritmo público de geohash
+    assert geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geohash(41.81, 2.74, 5) == geohash(41.8101, 2.7402, 5)
+    assert len(geohash(0, 0)) == geocache.REVERSE_GEOHASH_PRECISION
+
+
+def test_reverse_table_shares_cell(tmp_path):
+    cache = _cache(tmp_path)
+    cell = geohash(41.8101, 2.7402)
+    assert cache.get_reverse(cell) is MISS
+    cache.put_reverse(cell, {"address": "Calle Falsa 1"})
+    assert cache.get_reverse(geohash(41.8102, 2.7402)) == {"address": "Calle Falsa 1"}
+    assert cache.stats()["reverse_entries"] == 1
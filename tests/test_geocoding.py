@@ -0,0 +1,38 @@
+import pytest
+
+import app_utils_core as core
+
+
+def test_street_address_without_api_keeps_raw_text():
+    label = "Carrer de València 250, Barcelona"
+    assert core.geocode_address(label) is None
+    meta = core.resolve_selection(label)
+    assert meta == {"address": label, "coords": label}
+    assert not core.is_fresh_meta(meta)
+
+
+def test_town_name_without_api_resolves_from_gazetteer():
+    meta = core.resolve_selection("Sils, Girona, España")
+    assert meta["coords"] == "41.8086,2.744"
+    assert core.is_fresh_meta(meta)
+
+
+def test_reverse_remote_handles_google_errors_but_not_bugs(fake_client, monkeypatch):
+    from googlemaps.exceptions import ApiError
+
+    def _raise(exc):
+        def fn(*_, **__):
+            raise exc
+        return fn
+
+    monkeypatch.setattr(fake_client, "reverse_geocode", _raise(ApiError("INVALID_REQUEST")))
+    assert core._reverse_remote(41.8, 2.7) == (None, False)
+    monkeypatch.setattr(fake_client, "reverse_geocode", _raise(KeyError("formatted_address")))
+    with pytest.raises(KeyError):
+        core._reverse_remote(41.8, 2.7)
+
+
+def test_approximate_position_is_not_marked_resolved():
+    label, meta = core.resolve_position(41.81, 2.74)     # sin Google: municipio más cercano
+    assert meta["coords"] == "41.81,2.74"
+    assert not core.is_fresh_meta(meta)
@@ -0,0 +1,53 @@
+import socket
+import urllib.request
+
+import app_utils_core as core
+import metrics
+
+
+def _counter(name, **labels):
+    return metrics._COUNTERS.get((name, tuple(sorted(labels.items()))), 0)
+
+
+def test_geocode_many_counts_one_cache_miss_per_unknown_query():
+    before = core.get_geocache().stats()["misses"]
+    assert core.geocode_many(["Carrer desconegut 7, Enlloc"]) == [None]
+    assert core.get_geocache().stats()["misses"] - before == 1
+
+
+def test_local_hits_in_batches_get_their_own_span():
+    def count(name):
+        return metrics.snapshot()["spans"].get(name, {}).get("count", 0)
+
+    before_local, before_address = count("geocode_local"), count("geocode_address")
+    before_hits = _counter("geocode_lookups_total", source="gazetteer")
+    core.resolve_many(["Girona", "Tarragona"])
+    assert count("geocode_local") - before_local == 2
+    assert count("geocode_address") == before_address      # no entran en geocode_address
+    assert _counter("geocode_lookups_total", source="gazetteer") - before_hits == 2
+    assert metrics.snapshot()["spans"]["resolve_many"]["count"] >= 1
+
+
+def test_api_calls_are_labelled_api_not_client_chosen(fake_client):
+    from test_api_server import _call
+    import api_server
+
+    _call(api_server.links, body={"points": ["Carrer X 1, Lot", "Carrer Y 2, Lot"], "user": "mallory"})
+    assert _counter("gmaps_api_calls_total", api="geocode", user="mallory") == 0
+    assert _counter("gmaps_api_calls_total", api="geocode", user="api") >= 2
+
+
+def test_metrics_server_listens_on_localhost_by_default(monkeypatch):
+    monkeypatch.setattr(metrics, "_SERVER", None)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        free_port = sock.getsockname()[1]
+    server = metrics.start_http_server(port=free_port)
+    try:
+        host, port = server.server_address[:2]
+        assert host == "127.0.0.1"
+        body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read()
+        assert b"app_span_seconds" in body
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,65 @@
+import struct
+import zlib
+
+import qr_render
+from qr_render import qr_matrix, qr_png, qr_svg
+
+URL = "https://www.google.com/maps/dir/?api=1&origin=41.98,2.82&destination=41.12,1.24"
+
+
+def _decode_png(png):
+    """(ancho, alto, bits por píxel, tipo de color, filas de bool "negro")."""
+    assert png[:8] == b"\x89PNG\r\n\x1a\n"
+    pos, chunks = 8, {}
+    while pos < len(png):
+        length, = struct.unpack(">I", png[pos:pos + 4])
+        tag, payload = png[pos + 4:pos + 8], png[pos + 8:pos + 8 + length]
+        crc, = struct.unpack(">I", png[pos + 8 + length:pos + 12 + length])
+        assert crc == zlib.crc32(tag + payload) & 0xFFFFFFFF
+        chunks[tag] = chunks.get(tag, b"") + payload
+        pos += 12 + length
+    width, height, depth, color = struct.unpack(">IIBB", chunks[b"IHDR"][:10])
+    raw = zlib.decompress(chunks[b"IDAT"])
+    stride = (width * depth + 7) // 8 + 1
+    rows = []
+    for y in range(height):
+        line = raw[y * stride:(y + 1) * stride]
+        assert line[0] == 0                               # filtro "None"
+        rows.append([not (line[1 + x // 8] >> (7 - x % 8)) & 1 for x in range(width)])
+    return width, height, depth, color, rows
+
+
+def test_png_is_one_bit_and_decodes_to_the_qr_matrix():
+    png = qr_png(URL)
+    width, height, depth, color, rows = _decode_png(png)
+    matrix = qr_matrix(URL)
+    box = width // len(matrix)
+    assert (depth, color) == (1, 0) and width == height == box * len(matrix)
+    assert [row[::box] for row in rows[::box]] == [list(map(bool, r)) for r in matrix]
+
+
+def test_second_call_is_served_from_the_lru(monkeypatch):
+    data = URL + "&x=lru"
+    before = qr_render._CACHE.stats()
+    first = qr_png(data)
+    calls = []
+    monkeypatch.setattr(qr_render, "qr_matrix", lambda d: calls.append(d))
+    assert qr_png(data) is first
+    after = qr_render._CACHE.stats()
+    assert calls == []
+    assert (after["hits"] - before["hits"], after["misses"] - before["misses"]) == (1, 1)
+
+
+def test_lru_evicts_the_least_recently_used():
+    lru = qr_render._LRU(2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    lru.get("a")
+    lru.put("c", 3)
+    assert lru.get("b") is None and lru.get("a") == 1 and lru.get("c") == 3
+
+
+def test_svg_draws_one_path():
+    svg = qr_svg(URL)
+    n = len(qr_matrix(URL))
+    assert svg.startswith("<svg") and f'viewBox="0 0 {n} {n}"' in svg and svg.count("<path") == 1
@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+import resilience
+from resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceededError,
+    GoogleUnavailableError,
+    TokenBucket,
+    google_call,
+)
+
+
+def _policy(**kwargs):
+    return dict(limiter=TokenBucket(1000, 1000), breaker=CircuitBreaker(3, 60), **kwargs)
+
+
+def test_token_bucket_refuses_without_tokens():
+    bucket = TokenBucket(rate=0.001, burst=1)
+    assert bucket.acquire() is True
+    assert bucket.acquire(timeout=0.01) is False
+
+
+def test_breaker_opens_and_short_circuits():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    def boom():
+        raise TimeoutError()
+
+    for _ in range(2):
+        with pytest.raises(GoogleUnavailableError):
+            google_call("t", boom, limiter=TokenBucket(1000, 1000), breaker=breaker, retries=0)
+    with pytest.raises(CircuitOpenError):
+        google_call("t", lambda: 1, limiter=TokenBucket(1000, 1000), breaker=breaker)
+
+
+def test_non_transient_errors_propagate():
+    with pytest.raises(KeyError):
+        google_call("t", lambda: {}["x"], **_policy())
+
+
+def test_attempt_timeout_is_clamped_to_the_deadline(monkeypatch):
+    monkeypatch.setattr(resilience, "GMAPS_CALL_TIMEOUT", 3.0)
+    seen = google_call("t", resilience._ATTEMPT_TIMEOUT.get, deadline=0.5, **_policy())
+    assert 0 < seen <= 0.5
+    assert resilience._ATTEMPT_TIMEOUT.get() is None
+
+
+def test_no_attempt_starts_after_the_deadline():
+    calls = []
+    with pytest.raises(DeadlineExceededError):
+        google_call("t", calls.append, 1, deadline=0, **_policy())
+    assert calls == []
+
+
+def test_client_passes_the_clamped_timeout_to_requests(monkeypatch):
+    requests = pytest.importorskip("requests")
+    client = resilience.make_client("AIza" + "x" * 35)
+    seen = {}
+
+    def fake_get(url, **kwargs):
+        seen.update(kwargs)
+        raise requests.exceptions.Timeout()
+
+    monkeypatch.setattr(client.session, "get", fake_get)
+    start = time.monotonic()
+    with pytest.raises(GoogleUnavailableError):
+        google_call("geocode", client.geocode, "Girona", deadline=0.2, retries=0, **_policy())
+    assert seen["timeout"] <= 0.2
+    assert time.monotonic() - start < 1
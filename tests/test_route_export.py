@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from route_export import export_filename, iter_export
+from route_store import RouteStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = RouteStore(tmp_path / "routes.sqlite3")
+    ok = {"address": "Plaça 1, Girona", "coords": "41.98,2.82", "resolved_at": 1}
+    store.save("ana", "lunes", ["Plaça 1", "Girona", "41.5,2.1"], stops=[ok, None, None])
+    store.save("ana", "martes", ["Carrer desconegut 3"])
+    for i in range(5):
+        store.save("ana", f"z{i}", ["41.0,2.0"])
+    return store
+
+
+def _geojson(store, names=None):
+    return json.loads("".join(iter_export("ana", "geojson", names=names, store=store)))
+
+
+def test_unlocated_stops_are_skipped_not_exported_as_town_centroids(store):
+    stops = [f["properties"]["label"] for f in _geojson(store, ["lunes"])["features"]
+             if f["properties"]["kind"] == "stop"]
+    # "Girona" no tiene geometría guardada ni está en caché: no sale el centroide
+    assert stops == ["Plaça 1", "41.5,2.1"]
+    assert _geojson(store, ["martes"])["features"] == []
+
+
+def test_named_export_queries_only_those_routes(store):
+    sql = []
+    store._conn.set_trace_callback(sql.append)
+    routes = [name for name, *_ in store.iter_routes("ana", names=["martes", "lunes", "nada"], page=1)]
+    store._conn.set_trace_callback(None)
+    assert routes == ["martes", "lunes"]
+    selects = [s for s in sql if s.startswith("SELECT")]
+    assert len(selects) == 3 and all(" IN (" in s for s in selects)
+
+
+def test_gpx_and_kml_contain_every_route(store):
+    gpx = "".join(iter_export("ana", "gpx", store=store))
+    kml = "".join(iter_export("ana", "kml", store=store))
+    assert gpx.count("<rte>") == 7 and gpx.rstrip().endswith("</gpx>")
+    assert kml.count("<Folder>") == 7 and "<LineString>" in kml
+    with pytest.raises(ValueError):
+        list(iter_export("ana", "csv", store=store))
+
+
+def test_export_filename():
+    assert export_filename("ana", "kml", ["ruta del lunes"]) == "ruta_del_lunes.kml"
+    assert export_filename("ana", "gpx") == "rutas_ana.gpx"
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+import app_utils_core as core
+from route_optimizer import (
+    UnlocatedStopsError,
+    haversine_matrix,
+    optimize_order,
+    parse_coords,
+    route_length,
+    solve_path,
+)
+
+
+def test_parse_coords():
+    assert parse_coords({"coords": "41.8,2.7"}) == (41.8, 2.7)
+    assert parse_coords({"lat": 1, "lon": 2, "coords": "x"}) == (1.0, 2.0)
+    assert parse_coords("Carrer Major 1") is None
+    assert parse_coords("95,0") is None
+
+
+def test_solve_path_keeps_endpoints_and_shortens():
+    rng = np.random.default_rng(0)
+    coords = [tuple(c) for c in rng.uniform([41, 1], [42, 3], size=(30, 2))]
+    dist = haversine_matrix(coords)
+    order = solve_path(dist)
+    assert order[0] == 0 and order[-1] == len(coords) - 1
+    assert sorted(order) == list(range(len(coords)))
+    assert route_length(order, dist) <= route_length(list(range(len(coords))), dist)
+
+
+def test_optimize_order_reorders_a_zigzag():
+    pts = ["a", "c", "b", "d"]
+    metas = [{"coords": f"41.0,{x}"} for x in (1.0, 3.0, 2.0, 4.0)]
+    new, saved = optimize_order(pts, metas)
+    assert new == ["a", "b", "c", "d"] and saved > 0
+
+
+def test_optimize_points_reports_unlocated_stops():
+    pts = ["41.0,1.0", "Carrer inventat 12, Enlloc", "41.0,2.0", "41.0,3.0"]
+    with pytest.raises(UnlocatedStopsError) as exc:
+        core.optimize_points(pts)
+    assert exc.value.points == ["Carrer inventat 12, Enlloc"]
@@ -0,0 +1,55 @@
+import random
+
+import pytest
+
+import route_planner
+from route_planner import order_cluster, plan_routes, plan_stops, route_names
+
+
+def _grid(n, seed=1):
+    rnd = random.Random(seed)
+    return [(41.5 + rnd.random(), 2.0 + rnd.random()) for _ in range(n)]
+
+
+@pytest.mark.parametrize("n", [2, 5])
+def test_order_cluster_with_all_stops_in_the_same_place(n):
+    order, km = order_cluster([(41.8, 2.7)] * n)
+    assert sorted(order) == list(range(n)) and km == 0.0
+
+
+def test_order_cluster_visits_every_stop_once():
+    pts = _grid(12) + [(41.8, 2.7)] * 2
+    order, km = order_cluster(pts)
+    assert sorted(order) == list(range(len(pts))) and km > 0
+    order, _ = order_cluster(pts, depot=(41.6, 2.2))
+    assert sorted(order) == list(range(len(pts)))
+
+
+@pytest.mark.parametrize("method", route_planner.METHODS)
+def test_plan_routes_respects_max_stops(method):
+    plan = plan_routes(_grid(40), 4, method=method, max_stops=12)
+    assert sorted(i for order, _ in plan for i in order) == list(range(40))
+    assert all(len(order) <= 12 for order, _ in plan)
+
+
+def test_plan_routes_rejects_impossible_limits():
+    with pytest.raises(ValueError):
+        plan_routes(_grid(10), 2, max_stops=3)
+    with pytest.raises(ValueError):
+        plan_routes(_grid(10), 2, method="random")
+
+
+def test_route_names():
+    assert route_names(2) == ["lunes", "martes"]
+    assert route_names(2, "zona") == ["zona 1", "zona 2"]
+    assert route_names(8)[-1] == "ruta 8"
+
+
+def test_plan_stops_with_too_few_names_raises():
+    points = [f"{lat},{lon}" for lat, lon in _grid(9)]
+    with pytest.raises(ValueError):
+        plan_stops("planner", points, 3, names=["a", "b"], save=False)
+    result = plan_stops("planner", points + ["Carrer desconegut 9, Enlloc"], 3,
+                        names=["a", "b", "c"], save=False)
+    assert [r["name"] for r in result["routes"]] == ["a", "b", "c"]
+    assert result["unplaced"] == ["Carrer desconegut 9, Enlloc"]
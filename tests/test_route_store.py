@@ -0,0 +1,147 @@
+import json
+import threading
+
+import pytest
+
+import app_utils_core as core
+import metrics
+from route_store import STOPS_SCHEMA, RouteConflictError, RouteStore
+
+
+def _counter(name, **labels):
+    return metrics._COUNTERS.get((name, tuple(sorted(labels.items()))), 0)
+
+
+def _schema(store, user, name):
+    with store._lock:
+        return store._conn.execute(
+            "SELECT stops_schema FROM routes WHERE user = ? AND name = ?", (user, name)
+        ).fetchone()[0]
+
+
+def test_save_get_and_optimistic_versions(tmp_path):
+    store = RouteStore(tmp_path / "routes.sqlite3")
+    version = store.save("ana", "lunes", ["Girona", "Figueres"])
+    assert store.get("ana", "lunes") == (["Girona", "Figueres"], version)
+    store.save("ana", "lunes", ["Girona"], expected_version=version)
+    with pytest.raises(RouteConflictError):
+        store.save("ana", "lunes", ["Figueres"], expected_version=version)
+    assert store.list_routes("ana") == {"lunes": ["Girona"]}
+    assert store.delete("ana", "lunes") is True
+    assert store.list_routes("ana") == {}
+
+
+def test_iter_pending_stops_visits_each_route_once(tmp_path):
+    store = RouteStore(tmp_path / "routes.sqlite3")
+    for i in range(7):
+        store.save("ana", f"r{i}", [f"Carrer {i}, Lot"])
+    seen = [name for _, name, *_ in store.iter_pending_stops(page=2)]
+    assert sorted(seen) == [f"r{i}" for i in range(7)]
+
+
+def test_raw_text_stops_stay_pending(tmp_path):
+    store = RouteStore(tmp_path / "routes.sqlite3")
+    raw = {"address": "Carrer sense resoldre 1", "coords": "Carrer sense resoldre 1"}
+    ok = {"address": "Girona", "coords": "41.98,2.82", "resolved_at": 1}
+    store.save("ana", "mixta", ["Carrer sense resoldre 1", "Girona"], stops=[raw, ok])
+    store.save("ana", "buena", ["Girona"], stops=[ok])
+    assert _schema(store, "ana", "mixta") == 0
+    assert _schema(store, "ana", "buena") == STOPS_SCHEMA
+
+
+def test_approx_metas_are_not_marked_resolved():
+    meta = core._meta_from_geo("Girona", {"address": "Girona", "lat": 41.9, "lon": 2.8, "approx": True})
+    assert "resolved_at" not in meta
+    assert not core.is_fresh_meta(meta)
+
+
+def test_backfill_without_google_keeps_route_pending():
+    store = core.get_route_store()
+    store.save("backfill-offline", "r", ["Carrer del Backfill 1, Lot", "Girona"])
+    core.backfill_route_stops()
+    assert _schema(store, "backfill-offline", "r") == 0
+
+
+def test_backfill_completes_routes_as_system_user(fake_client):
+    store = core.get_route_store()
+    store.save("backfill-online", "r", ["Carrer del Backfill 2, Lot", "Carrer del Backfill 3, Lot"])
+    before = _counter("gmaps_api_calls_total", api="geocode", user="system")
+    metrics.set_user("alice")
+
+    core.start_stops_backfill().join(timeout=10)
+
+    assert _schema(store, "backfill-online", "r") == STOPS_SCHEMA
+    assert all(core.is_fresh_meta(m) for m in store.get_stops("backfill-online", "r"))
+    assert _counter("gmaps_api_calls_total", api="geocode", user="system") - before >= 2
+    assert _counter("gmaps_api_calls_total", api="geocode", user="alice") == 0
+
+
+def test_import_json_dir_migrates_legacy_files_once(tmp_path):
+    legacy = tmp_path / "legacy"
+    legacy.mkdir()
+    (legacy / "routes_ana.json").write_text(
+        json.dumps({"lunes": ["Girona", "Figueres"], "martes": ["Reus"]}), encoding="utf-8")
+    (legacy / "routes_bob.json").write_text(json.dumps({"lunes": ["Sils"]}), encoding="utf-8")
+    (legacy / "routes_roto.json").write_text("{", encoding="utf-8")
+    (legacy / "otro.json").write_text(json.dumps({"x": ["y"]}), encoding="utf-8")
+    store = RouteStore(tmp_path / "routes.sqlite3")
+    store.save("ana", "martes", ["Ya guardada"])         # lo de la base de datos manda
+
+    assert store.import_json_dir(legacy) == 2
+    assert store.list_routes("ana") == {"lunes": ["Girona", "Figueres"], "martes": ["Ya guardada"]}
+    assert store.list_versions("bob") == {"lunes": 1}
+    assert _schema(store, "ana", "lunes") == 0            # pendiente de completar su geometría
+    assert store.list_routes("roto") == {}
+
+    # Segunda pasada: nada nuevo, aunque el fichero cambie o se borre la ruta importada
+    (legacy / "routes_ana.json").write_text(json.dumps({"jueves": ["Lot"]}), encoding="utf-8")
+    store.delete("bob", "lunes")
+    assert store.import_json_dir(legacy) == 0
+    assert sorted(store.list_routes("ana")) == ["lunes", "martes"]
+    assert store.list_routes("bob") == {}
+    # El fichero roto no se marcó como importado: entra cuando se arregla
+    (legacy / "routes_roto.json").write_text(json.dumps({"r": ["Lot"]}), encoding="utf-8")
+    assert store.import_json_dir(legacy) == 1
+
+
+def test_delete_and_save_with_the_same_expected_version_race(tmp_path):
+    path = tmp_path / "routes.sqlite3"
+    first, second = RouteStore(path), RouteStore(path)     # dos procesos
+    version = first.save("ana", "lunes", ["Girona"])
+    barrier = threading.Barrier(2)
+    outcome = {}
+
+    def run(kind, fn):
+        barrier.wait()
+        try:
+            fn()
+            outcome[kind] = "ok"
+        except RouteConflictError:
+            outcome[kind] = "conflict"
+
+    threads = [
+        threading.Thread(target=run, args=("delete", lambda: first.delete(
+            "ana", "lunes", expected_version=version))),
+        threading.Thread(target=run, args=("save", lambda: second.save(
+            "ana", "lunes", ["Figueres"], expected_version=version))),
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+
+    assert sorted(outcome.values()) == ["conflict", "ok"]
+    if outcome["delete"] == "ok":
+        assert first.get("ana", "lunes") is None
+    else:
+        assert first.get("ana", "lunes") == (["Figueres"], version + 1)
+
+
+def test_stale_delete_does_not_remove_a_newer_save(tmp_path):
+    path = tmp_path / "routes.sqlite3"
+    first, second = RouteStore(path), RouteStore(path)
+    version = first.save("ana", "lunes", ["Girona"])
+    second.save("ana", "lunes", ["Figueres"], expected_version=version)
+    with pytest.raises(RouteConflictError):
+        first.delete("ana", "lunes", expected_version=version)
+    assert first.get("ana", "lunes") == (["Figueres"], version + 1)
@@ -0,0 +1,47 @@
+import threading
+
+import app_utils_core as core
+import shortlinks
+from shortlinks import LinkShortener
+
+
+def test_shorten_then_resolve_returns_the_original_url(tmp_path):
+    links = LinkShortener(tmp_path / "links.sqlite3")
+    url = core.build_gmaps_url({"coords": "41.98,2.82"}, {"coords": "41.12,1.24"})
+    code = links.shorten(url)
+    assert len(code) == shortlinks.CODE_LEN and links.shorten(url) == code
+    assert links.resolve(code) == url
+    assert links.resolve("nada") is None
+    assert links.stats() == {"links": 1, "redirects": 1}
+
+
+def test_code_prefix_collisions_get_a_longer_code(tmp_path, monkeypatch):
+    links = LinkShortener(tmp_path / "links.sqlite3")
+    monkeypatch.setattr(shortlinks, "_base62", lambda _: "abcdefghijklmnop")
+    first, second = links.shorten("https://a.example/1"), links.shorten("https://a.example/2")
+    assert (first, second) == ("abcdefg", "abcdefgh")
+    assert links.resolve(second) == "https://a.example/2"
+
+
+def test_concurrent_processes_shortening_the_same_url_agree(tmp_path):
+    path = tmp_path / "links.sqlite3"
+    workers = [LinkShortener(path) for _ in range(6)]      # una conexión por "proceso"
+    urls = [f"https://www.google.com/maps/dir/?api=1&origin={i}" for i in range(20)]
+    barrier = threading.Barrier(len(workers))
+    results, errors = [], []
+
+    def run(links):
+        barrier.wait()
+        try:
+            results.append([links.shorten(u) for u in urls])
+        except Exception as exc:       # p. ej. sqlite3.IntegrityError
+            errors.append(exc)
+
+    threads = [threading.Thread(target=run, args=(w,)) for w in workers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=30)
+    assert errors == []
+    assert all(r == results[0] for r in results)
+    assert workers[0].stats()["links"] == len(urls)
@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+import app_utils_core as core
+from tab_profesional import ui
+
+
+@pytest.fixture
+def session(monkeypatch):
+    """`st.session_state` de la pestaña profesional como un dict (sin servidor de Streamlit)."""
+    state = {"prof_points": [], "prof_meta": {}, "prof_pending": {}, "prof_imports": []}
+    monkeypatch.setattr(ui.st, "session_state", state)
+    return state
+
+
+@pytest.fixture
+def gate(fake_client, monkeypatch):
+    """Google "tarda" hasta que el test abre la puerta."""
+    opened = threading.Event()
+    original = fake_client.geocode
+
+    def slow(address, **kwargs):
+        assert opened.wait(10)
+        return original(address, **kwargs)
+
+    monkeypatch.setattr(fake_client, "geocode", slow)
+    yield opened
+    opened.set()
+
+
+def test_prefetch_resolves_in_the_background_and_harvest_collects(session, gate, fake_client):
+    points = ["Carrer Especulatiu 1, Lot", "Carrer Especulatiu 2, Lot"]
+    session["prof_points"] = list(points)
+    ui._prefetch(points)
+    assert set(session["prof_pending"]) == set(points)
+    assert ui._point_status(points[0]) == "pending"
+
+    ui._prefetch(points)                         # ya en marcha: no se relanza
+    gate.set()
+    for fut in list(session["prof_pending"].values()):
+        fut.result(timeout=10)
+    ui._harvest()
+
+    assert session["prof_pending"] == {}
+    assert all(ui._point_status(p) == "resolved" for p in points)
+    assert fake_client.calls["geocode"] == 2
+
+
+def test_harvest_forgets_points_removed_while_pending(session, gate):
+    session["prof_points"] = ["Carrer Esborrat 1, Lot"]
+    ui._prefetch(session["prof_points"])
+    session["prof_points"] = []
+    ui._harvest()
+    assert session["prof_pending"] == {}
+
+
+def test_concurrent_requests_for_one_address_share_a_call(gate, fake_client):
+    query = "Carrer Compartit 1, Lot"
+    first = core.geocode_async(query)
+    assert core.geocode_async(query.upper()) is first         # misma clave normalizada
+    background = core.geocode_async(query, background=True)
+    assert background is first                                 # el fondo reutiliza lo que hay en vuelo
+    gate.set()
+    assert first.result(timeout=10)["address"]
+    assert fake_client.calls["geocode"] == 1
+    assert core.normalize_query(query) not in core._INFLIGHT
+
+
+def test_background_jobs_are_not_shared_with_sessions(gate, fake_client):
+    query = "Carrer de Fons 1, Lot"
+    background = core.geocode_async(query, background=True)
+    interactive = core.geocode_async(query)
+    assert interactive is not background                       # la sesión no espera a la cola de fondo
+    gate.set()
+    assert background.result(timeout=10) and interactive.result(timeout=10)
@@ -0,0 +1,18 @@
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+def test_professional_tab_does_not_load_numpy_at_import():
+    code = "import sys, tab_profesional.ui; print('numpy' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True,
+                         text=True, timeout=120)
+    assert out.stdout.strip().splitlines()[-1] == "False", out.stderr
+
+
+def test_plan_method_labels_cover_the_planner_methods():
+    from route_planner import METHODS
+    from tab_profesional.ui import _PLAN_METHODS
+
+    assert tuple(_PLAN_METHODS) == METHODS
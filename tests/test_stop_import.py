@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+from stop_import import detect_format, import_stops, resolve_imported_async
+
+
+def _labels(result):
+    return [label for label, _ in result["stops"]]
+
+
+@pytest.mark.parametrize("line, coords", [
+    ("41.98,2.82", "41.98,2.82"),
+    ("41.98; 2.82", "41.98,2.82"),
+    ("41.98 2.82", None),           # un espacio no separa coordenadas
+    ("Carrer Major 12, 17001", None),
+])
+def test_text_lines_with_coordinates(line, coords):
+    (label, meta), = import_stops(line, fmt="text")["stops"]
+    assert label == line
+    assert (meta["coords"] if meta else None) == coords
+
+
+def test_text_import_drops_optimize_directives_and_duplicates():
+    text = "Girona\noptimize:true|Reus\nOPTIMIZE:false\ngirona \nSils"
+    result = import_stops(text, fmt="text", exclude=["Sils"])
+    assert _labels(result) == ["Girona", "Reus"]
+    assert result["duplicates"] == 2
+
+
+def test_csv_with_header_and_coordinates():
+    data = "nombre,lat,lon,direccion\nCliente A,41.9,2.8,\nCliente B,,,\"Carrer B 2, Lot\"\n"
+    result = import_stops(data.encode(), filename="clientes.csv")
+    assert _labels(result) == ["Cliente A", "Carrer B 2, Lot"]
+    assert result["stops"][0][1]["coords"] == "41.9,2.8"
+    assert result["stops"][1][1] is None
+
+
+def test_gpx_and_kml_read_waypoints_only():
+    gpx = (b'<gpx xmlns="http://www.topografix.com/GPX/1/1">'
+           b'<wpt lat="41.9" lon="2.8"><name>A</name></wpt>'
+           b'<trk><trkseg><trkpt lat="1" lon="1"/></trkseg></trk></gpx>')
+    kml = (b'<kml xmlns="http://www.opengis.net/kml/2.2"><Document>'
+           b'<Placemark><name>B</name><Point><coordinates>2.7,41.8,0</coordinates></Point></Placemark>'
+           b'<Placemark><name>L</name><LineString><coordinates>1,1 2,2</coordinates></LineString></Placemark>'
+           b'</Document></kml>')
+    assert detect_format(None, gpx) == "gpx" and detect_format(None, kml) == "kml"
+    assert [(l, m["coords"]) for l, m in import_stops(gpx)["stops"]] == [("A", "41.9,2.8")]
+    assert [(l, m["coords"]) for l, m in import_stops(kml)["stops"]] == [("B", "41.8,2.7")]
+
+
+def test_limit_truncates():
+    result = import_stops("\n".join(f"Carrer {i}, Lot" for i in range(5)), fmt="text", limit=3)
+    assert len(result["stops"]) == 3 and result["truncated"]
+
+
+def test_resolve_imported_async_is_one_job_filling_metas(fake_client):
+    stops = import_stops("Carrer Import 1, Lot\nCarrer Import 2, Lot\n41.9,2.8", fmt="text")["stops"]
+    metas = {}
+    resolve_imported_async(stops, metas).result(timeout=10)
+    assert sorted(metas) == ["Carrer Import 1, Lot", "Carrer Import 2, Lot"]
+    assert fake_client.calls["geocode"] == 2
+
+
+def test_resolve_imported_async_stops_when_cancelled(fake_client):
+    stops = [(f"Carrer Cancel {i}, Lot", None) for i in range(40)]
+    cancel = threading.Event()
+    cancel.set()
+    metas = {}
+    resolve_imported_async(stops, metas, cancel).result(timeout=10)
+    assert metas == {} and fake_client.calls["geocode"] == 0
+
+
+def test_tab_waypoints_keep_repeats_and_drop_optimize_lines():
+    text = "Girona\noptimize:false\n Girona \n\noptimize:true|Reus"
+    result = import_stops(text, fmt="text", dedupe=False)
+    assert _labels(result) == ["Girona", "Girona", "Reus"]
+    assert result["duplicates"] == 0
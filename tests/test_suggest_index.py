@@ -0,0 +1,49 @@
+import app_utils_core as core
+from suggest_index import SuggestIndex, build_index, get_user_index
+
+
+def _labels(results):
+    return [label for label, _ in results]
+
+
+def test_prefix_of_any_word_and_one_typo():
+    index = build_index({"lunes": ["Carrer Major 12, Girona", "Avinguda Catalunya 3, Figueres"]})
+    assert _labels(index.search("maj")) == ["Carrer Major 12, Girona"]
+    assert _labels(index.search("figeres")) == ["Avinguda Catalunya 3, Figueres"]
+    assert index.search("") == [] and index.search("zzzz") == []
+
+
+def test_frequency_recency_and_source_order_results():
+    now = 1_000_000_000.0
+    index = SuggestIndex()
+    index.add("Carrer Nou 1, Lot", 1, now - 365 * 86400)
+    index.add("Carrer Nou 2, Lot", 5, now)
+    index.add("Carrer Nou", 0, 0.0, "gazetteer")
+    index.add("carrer nou 2, lot", 1, now)              # misma clave: suma frecuencia
+    index.freeze()
+    assert len(index) == 3
+    assert _labels(index.search("carrer nou", now=now)) == [
+        "Carrer Nou 2, Lot", "Carrer Nou 1, Lot", "Carrer Nou"]
+
+
+def test_user_index_is_rebuilt_when_the_signature_changes():
+    loads = []
+
+    def load():
+        loads.append(1)
+        return {"r": [f"Parada {len(loads)}"]}
+
+    first = get_user_index("suggest-user", "v1", load)
+    assert get_user_index("suggest-user", "v1", load) is first
+    second = get_user_index("suggest-user", "v2", load)
+    assert second is not first and len(loads) == 2
+    assert _labels(second.search("parada")) == ["Parada 2"]
+
+
+def test_suggest_addresses_merges_recent_routes_and_gazetteer():
+    core.get_route_store().save("suggest-ana", "lunes", ["Carrer de Girona 5, Lot"])
+    out = [s["description"] for s in core.suggest_addresses(
+        "giro", username="suggest-ana", recent=["Plaça Girona 1"])]
+    assert out[:2] == ["Plaça Girona 1", "Carrer de Girona 5, Lot"]
+    assert "Girona, España" in out
+    assert core.suggest_addresses("gi") == []
@@ -0,0 +1,54 @@
+import urllib.parse
+
+import app_utils_core as core
+
+
+def _metas(n):
+    return [{"address": f"Parada {i}", "coords": f"41.{i:04d},2.{i:04d}"} for i in range(n)]
+
+
+def test_split_legs_chains_destination_to_next_origin():
+    legs = core.split_legs(list(range(25)), max_waypoints=9)
+    assert [len(leg) for leg in legs] == [11, 11, 5]
+    assert all(a[-1] == b[0] for a, b in zip(legs, legs[1:]))
+
+
+def test_gmaps_url_keeps_order_and_drops_optimize():
+    metas = _metas(4)
+    url = core.build_gmaps_url(metas[0], metas[-1], ["optimize:true"] + metas[1:-1])
+    assert "optimize" not in url
+    waypoints = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)["waypoints"][0]
+    assert waypoints.split("|") == ["41.0001,2.0001", "41.0002,2.0002"]
+
+
+def test_waze_and_apple_links_cover_every_stop_of_a_leg():
+    metas = _metas(12)
+    legs = core.build_route_legs(metas, max_waypoints=9)
+    assert len(legs) == 2
+    destinations = [h["destination"] for leg in legs for h in leg["waze_hops"]]
+    assert destinations == [m["address"] for m in metas[1:]]
+    for leg in legs:
+        assert len(leg["apple_hops"]) == leg["points"] - 1
+        assert leg["waze"] == leg["waze_hops"][0]["url"]
+
+
+def test_compact_coords_and_place_ids_round_trip(monkeypatch):
+    monkeypatch.setattr(core, "URL_PLACE_IDS", True)
+    origin = {"address": "Plaça del Vi 1, Girona", "coords": "41.98312345,2.82412987", "place_id": "ChIJo"}
+    stops = [{"address": "Carrer Nou 2, Sils", "coords": "41.80870001,2.74470009", "place_id": "ChIJs"},
+             {"address": "Rambla 3, Lloret", "coords": "41.69990000,2.84560000", "place_id": "ChIJl"}]
+    dest = {"address": "Av. Catalunya 4, Reus", "place_id": "ChIJr"}
+    url = core.build_gmaps_url(origin, dest, stops, compact=True)
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+
+    assert query["origin"] == ["41.98312,2.82413"] and "%2C" not in url
+    assert query["destination"] == ["Av. Catalunya 4, Reus"]
+    assert query["waypoints"] == ["41.8087,2.7447|41.6999,2.8456"]
+    for text, meta in zip(query["waypoints"][0].split("|"), stops):
+        lat, lon = map(float, text.split(","))
+        want = tuple(map(float, meta["coords"].split(",")))
+        assert abs(lat - want[0]) < 1e-5 and abs(lon - want[1]) < 1e-5
+    assert query["origin_place_id"] == ["ChIJo"] and query["destination_place_id"] == ["ChIJr"]
+    assert query["waypoint_place_ids"] == ["ChIJs|ChIJl"]
+    full = core.build_gmaps_url(origin, dest, stops, compact=False)
+    assert len(url) < len(full)